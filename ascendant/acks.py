@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+
+"""
+Ack Barriers
+============
+
+Waiting on acks from every player without blocking a web handler.
+
+A barrier is started when the server sends an event that every player in the game has to ack. It resolves as soon as the last ack comes in, and until then it re-sends the event to the players that haven't acked yet, backing off a bit more each time. Nothing in here sleeps, so the handler that started the barrier can return right away.
+
+Every barrier gets a sequence number, and the ack callback it hands out is bound to it. An ack that comes back for an older send of the same event is dropped, instead of counting towards the new one.
+"""
+
+from itertools import count
+from timeit import default_timer
+
+from .errors import *
+from .metrics import Counter, Histogram
+from .settings import *
+
+ACK_SECONDS = Histogram('ascendant_ack_seconds', 'Time from sending an event to a player acking it', ('ack_type',))
+ACK_RETRIES = Counter('ascendant_ack_retries_total', 'Times an event was re-sent to the players who hadn\'t acked it', ('ack_type',))
+ACK_RESENDS = Counter('ascendant_ack_resends_total', 'Events re-sent to single players', ('ack_type',))
+ACK_TIMEOUTS = Counter('ascendant_ack_timeouts_total', 'Barriers that gave up waiting on somebody', ('ack_type',))
+ACK_STALE = Counter('ascendant_ack_stale_total', 'Acks for an event that had already been sent again or given up on', ('ack_type',))
+
+
+class AckBarrier(object):
+    '''
+    waits for every player in a game to ack one event
+
+    `send` is called as send(players, callback): players is None to
+    send the event to the whole room, or a list of players to re-send
+    it to just those. callback is what the emit should be acked to.
+    `schedule` is called as schedule(delay, func) and has to return
+    something with a cancel() method, like eventlet.spawn_after does
+    '''
+
+    def __init__(self, game, ack_type, seq, send, callback, schedule, on_complete=None,
+                 timeout=ACK_TIMEOUT, max_retries=ACK_MAX_RETRIES):
+        self.game = game
+        self.ack_type = ack_type
+        self.seq = seq
+        self.send = send
+        self.callback = callback
+        self.schedule = schedule
+        self.on_complete = on_complete
+        self.timeout = timeout
+        self.max_retries = max_retries
+
+        # ids of the players who haven't acked yet
+        self.outstanding = set()
+        self.retries = 0
+        self.done = False
+        # set if we gave up on somebody instead of hearing back
+        self.timed_out = False
+        self._timer = None
+        # when the event was last sent, for ack round trip times
+        self._sent_at = None
+
+    def start(self):
+        self.outstanding = set(p.player_id for p in self.game.players)
+
+        self._sent_at = default_timer()
+        self.send(None, self.callback)
+
+        if not self.outstanding:
+            self._resolve()
+        else:
+            self._arm()
+
+    def ack(self, player_id):
+        if self.done or player_id not in self.outstanding:
+            return
+
+        ACK_SECONDS.observe(default_timer() - self._sent_at, (self.ack_type,))
+        self.outstanding.discard(player_id)
+
+        if not self.outstanding:
+            self._resolve()
+
+    def pending(self):
+        # anyone who left since isn't waited on
+        return [p for p in self.game.players if p.player_id in self.outstanding]
+
+    def cancel(self):
+        self.done = True
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _arm(self):
+        delay = min(self.timeout * ACK_BACKOFF ** self.retries, ACK_MAX_TIMEOUT)
+        self._timer = self.schedule(delay, self._retry)
+
+    def _retry(self):
+        self._timer = None
+        if self.done:
+            return
+
+        pending = self.pending()
+        if not pending:
+            self._resolve()
+        elif self.retries >= self.max_retries:
+            # don't hold the game up forever for one dead client, they
+            # can catch up with get_current_action when they come back
+            self.timed_out = True
+            ACK_TIMEOUTS.inc((self.ack_type,))
+            self._resolve()
+        else:
+            self.retries += 1
+            ACK_RETRIES.inc((self.ack_type,))
+            ACK_RESENDS.inc((self.ack_type,), len(pending))
+            self._sent_at = default_timer()
+            self.send(pending, self.callback)
+            self._arm()
+
+    def _resolve(self):
+        self.cancel()
+        if self.on_complete is not None:
+            self.on_complete()
+
+
+class AckBarriers(object):
+    '''
+    keeps track of the current barrier for every (game_id, ack_type)
+
+    starting a barrier for an event that is already being waited on
+    replaces the old one, since the new event supersedes it
+    '''
+
+    def __init__(self, schedule):
+        self.schedule = schedule
+        # game_id -> {ack_type: AckBarrier}
+        self._barriers = {}
+        self._seqs = count(1)
+
+    def start(self, game, ack_type, send, on_complete=None):
+        if ack_type not in ACK_TYPES:
+            raise AscendantError('Unknown ack type: {}'.format(ack_type))
+
+        game_barriers = self._barriers.setdefault(game.game_id, {})
+
+        old = game_barriers.get(ack_type)
+        if old is not None:
+            old.cancel()
+
+        def complete():
+            if game_barriers.get(ack_type) is barrier:
+                del game_barriers[ack_type]
+            if on_complete is not None:
+                on_complete()
+
+        seq = next(self._seqs)
+        barrier = AckBarrier(game, ack_type, seq, send, self._callback(game.game_id, ack_type, seq),
+                             self.schedule, on_complete=complete)
+        game_barriers[ack_type] = barrier
+        barrier.start()
+        return barrier
+
+    def get(self, game_id, ack_type):
+        return self._barriers.get(game_id, {}).get(ack_type)
+
+    def _callback(self, game_id, ack_type, seq):
+        '''
+        the ack callback for one barrier. clients ack with their player
+        id, everything else comes from the barrier
+        '''
+        def callback(data=None, *args):
+            # clients ack events they don't handle with nothing
+            if isinstance(data, dict):
+                self.ack(game_id, ack_type, data.get('player_id'), seq)
+        return callback
+
+    def callback(self, game_id, ack_type):
+        '''
+        the ack callback for the event being waited on right now, for
+        sending it to someone again outside of the barrier. None if
+        nothing is being waited on
+        '''
+        barrier = self.get(game_id, ack_type)
+        return barrier.callback if barrier is not None else None
+
+    def ack(self, game_id, ack_type, player_id, seq):
+        barrier = self.get(game_id, ack_type)
+        if barrier is None or barrier.seq != seq:
+            ACK_STALE.inc((ack_type,))
+            return
+        barrier.ack(player_id)
+
+    def cancel_game(self, game_id):
+        for barrier in self._barriers.pop(game_id, {}).values():
+            barrier.cancel()
+
+    def __len__(self):
+        return sum(len(game_barriers) for game_barriers in self._barriers.values())
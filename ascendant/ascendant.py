@@ -11,48 +11,115 @@ This particular library assumes that all the data necessary for each function to
 # python libraries
 import random
 import math
+from functools import wraps
 from string import ascii_uppercase as uppercase
 
 # local libraries
 
 # constants are defined in settings, also holds AscendantError
-from settings import *
-from errors import *
+from .settings import *
+from .errors import *
 
 class Player(object):
     """Game player class"""
 
+    # there can be a lot of these, so skip the per-instance __dict__
+    __slots__ = ('player_id', 'name', 'team', 'ready')
+
     def __init__(self, player_id, name):
         self.player_id = player_id
         self.name = name
         self.team = TEAM_NONE
         self.ready = False
-        
-        self.acks = {
-            'do_proposal_vote': False,
-            'mission_vote_result': False,
-            'proposal_vote_result': False,
-            'update_players': False,
-            'assign_roles': False,
-            'propose_mission': False
-        }
 
     def to_dict(self, show_team=False):
         return {'id': self.player_id, 'name': self.name, 'team': self.team if show_team else -1}
 
+    def to_state(self):
+        '''
+        everything needed to rebuild the player, unlike to_dict this
+        always has the team
+        '''
+        return {'id': self.player_id, 'name': self.name, 'team': self.team, 'ready': self.ready}
+
+    @classmethod
+    def from_state(cls, state):
+        player = cls(state['id'], state['name'])
+        player.team = state['team']
+        player.ready = state['ready']
+        return player
+
+def recorded(encode=None, decode=None):
+    '''
+    for the AscendantGame methods that change the game. once the method
+    returns, the call is passed on to the game's listener (if it has
+    one) as (game_id, method name, args) so it can be replayed later.
+    encode turns the args into plain json-able data, decode turns that
+    back into args
+    '''
+    def wrap(method):
+        name = method.__name__
+
+        @wraps(method)
+        def record(self, *args):
+            result = method(self, *args)
+            if self.listener is not None:
+                self.listener(self.game_id, name, encode(args) if encode else list(args))
+            return result
+
+        record.decode = decode
+        return record
+    return wrap
+
+
+def _encode_players(args):
+    return [[p.to_state() for p in args[0]]]
+
+def _decode_players(args):
+    return [[Player.from_state(p) for p in args[0]]]
+
+
 class GameRound(object):
+    __slots__ = (
+        'num_required_to_fail',
+        'num_on_mission',
+        'stalled',
+        'players_on_mission',
+        'votes',
+        'mission_votes',
+        'approvals',
+        'rejections',
+        'mission_passes',
+        'mission_fails',
+        'number_failed_proposals'
+    )
+
     def __init__(self, num_required_to_fail, num_on_mission):
         self.num_required_to_fail = num_required_to_fail
         self.num_on_mission = num_on_mission
 
         self.stalled = 0
         self.players_on_mission = []
-        self.votes = {}
-        self.mission_votes = {}
+        self.reset_votes()
+        self.reset_mission_votes()
         # starts at -1 since each start_proposal call 
         # increments it by 1
         self.number_failed_proposals = -1
 
+    @classmethod
+    def for_round(cls, rules, n_players, round_num):
+        '''
+        make a round straight from the RuleSet tables
+        '''
+        to_send = rules.to_send[n_players] if 0 <= n_players < len(rules.to_send) else None
+        if to_send is None:
+            raise AscendantError('Rules {} can\'t be played with {} players'.format(rules.name, n_players))
+
+        if not 0 <= round_num < len(to_send):
+            raise AscendantError('Rules {} only have {} rounds, not {}'.format(rules.name, len(to_send), round_num + 1))
+
+        return cls(rules.to_fail[n_players][round_num], to_send[round_num])
+
     def set_mission_members(self, member_list):
         # this shouldn't ever happen
         if len(member_list) != self.num_on_mission:
@@ -63,30 +130,131 @@ class GameRound(object):
 
         self.players_on_mission = member_list
 
+    # votes are counted as they come in, so nothing ever has to go
+    # through all of them. a player's first vote is the one that counts
+
+    def reset_votes(self):
+        self.votes = {}
+        self.approvals = 0
+        self.rejections = 0
+
+    def reset_mission_votes(self):
+        self.mission_votes = {}
+        self.mission_passes = 0
+        self.mission_fails = 0
+
     def vote(self, pid, vote):
-        self.votes[pid] = bool(vote)
+        '''
+        returns false if the player has already voted
+        '''
+        if pid in self.votes:
+            return False
+
+        vote = bool(vote)
+        self.votes[pid] = vote
+        if vote:
+            self.approvals += 1
+        else:
+            self.rejections += 1
+        return True
 
     def mission_vote(self, pid, vote):
-        if pid in self.players_on_mission:
-            self.mission_votes[pid] = bool(vote)
+        '''
+        returns false if the player isn't on the mission or has already
+        voted
+        '''
+        if pid in self.mission_votes or pid not in self.players_on_mission:
+            return False
+
+        vote = bool(vote)
+        self.mission_votes[pid] = vote
+        if vote:
+            self.mission_passes += 1
+        else:
+            self.mission_fails += 1
+        return True
+
+    def num_votes(self):
+        return self.approvals + self.rejections
+
+    def num_mission_votes(self):
+        return self.mission_passes + self.mission_fails
+
+    def tally(self):
+        '''
+        [approvals, rejections], for broadcasting
+        '''
+        return [self.approvals, self.rejections]
+
+    def mission_tally(self):
+        '''
+        [passes, fails], for broadcasting
+        '''
+        return [self.mission_passes, self.mission_fails]
+
+    def to_state(self):
+        return {
+            'num_required_to_fail': self.num_required_to_fail,
+            'num_on_mission': self.num_on_mission,
+            'stalled': self.stalled,
+            'players_on_mission': self.players_on_mission,
+            'votes': self.votes,
+            'mission_votes': self.mission_votes,
+            'number_failed_proposals': self.number_failed_proposals
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        game_round = cls(state['num_required_to_fail'], state['num_on_mission'])
+        game_round.stalled = state['stalled']
+        game_round.players_on_mission = state['players_on_mission']
+        # the counts aren't saved, they're quicker to redo than to store
+        for pid, vote in state['votes'].items():
+            game_round.vote(pid, vote)
+        for pid, vote in state['mission_votes'].items():
+            game_round.mission_vote(pid, vote)
+        game_round.number_failed_proposals = state['number_failed_proposals']
+        return game_round
 
 
 # class that keeps track of the game state
 class AscendantGame(object):
+    __slots__ = (
+        'game_id',
+        'rules',
+        'state',
+        'players',
+        '_players_by_id',
+        'leader_index',
+        'creator',
+        'good_won',
+        'bad_won',
+        'round_passes',
+        'round_num',
+        'current_round',
+        'version',
+        'generation',
+        'sync_version',
+        'published',
+        'listener'
+    )
 
     @staticmethod
     def gen_id():
         return ''.join(random.choice(uppercase) for _ in range(4))
 
     # init file takes the game_id and Player that is
-    # the creator
-    def __init__(self, game_id, creator):
+    # the creator, and optionally the RuleSet to play with
+    def __init__(self, game_id, creator, rules=DEFAULT_RULES):
         self.game_id = game_id
+        self.rules = rules
 
         self.state = GAMESTATE_JOINING
 
-        # player list
+        # player list, in seat order
         self.players = [creator]
+        # player_id -> Player, has to be kept in sync with self.players
+        self._players_by_id = {creator.player_id: creator}
         self.leader_index = -1
         
         # keep track of creator
@@ -103,6 +271,25 @@ class AscendantGame(object):
         self.round_num = -1
         self.current_round = None
 
+        # bumped by the game store every time the game is saved
+        self.version = 0
+
+        # bumped whenever something the room broadcasts show changes,
+        # so cached payloads know when they're out of date
+        self.generation = 0
+
+        # goes up with every broadcast to the room, so rejoining players
+        # can say what they've seen. the broadcasts themselves are kept
+        # in the sync log, see sync.py
+        self.sync_version = 0
+
+        # the deltas published by the update going on, which the service
+        # puts in the sync log once it's saved. like listener, never saved
+        self.published = None
+
+        # called with every change to the game, see recorded
+        self.listener = None
+
 
     '''
     returns true if the player can be added to the map,
@@ -110,53 +297,63 @@ class AscendantGame(object):
    
     look into seeing if this needs to have a thread lock
     '''
+    @recorded(encode=lambda args: [args[0].to_state()], decode=lambda args: [Player.from_state(args[0])])
     def add_player(self, player):        
-        if len(self.players) < MAX_NUM_OF_PLAYERS:
+        if len(self.players) < MAX_NUM_OF_PLAYERS and player.player_id not in self._players_by_id:
             self.players.append(player)
+            self._players_by_id[player.player_id] = player
+            self.generation += 1
             return True
         else:
             return False
 
+    @recorded(encode=_encode_players, decode=_decode_players)
+    def set_players(self, players):
+        '''
+        replace or reorder the player list, keeping the id lookup in sync
+        '''
+        self.players = list(players)
+        self._players_by_id = dict((p.player_id, p) for p in self.players)
+        self.generation += 1
+
     def all_voted(self):
-        return len(self.current_round.votes) >= len(self.players)
+        return self.current_round.num_votes() >= len(self.players)
 
+    @recorded()
     def start_round(self):
-        # safe the round pass/fail so we can send when someone rejoins
-        if self.current_round:
-            self.round_passes.append(self.get_mission_votes())
-
-        n_players = len(self.players)
+        self.current_round = GameRound.for_round(self.rules, len(self.players), self.round_num + 1)
         self.round_num += 1
-        to_send = {
-            5: [2, 3, 2, 3, 3],
-            6: [2, 3, 3, 3, 4],
-            7: [2, 3, 3, 4, 4],
-            8: [3, 4, 4, 5, 5],
-            9: [3, 4, 4, 5, 5],
-            10: [3, 4, 4, 5, 5]
-        }
-        to_fail = {
-            5: [1, 1, 1, 1, 1],
-            6: [1, 1, 1, 1, 1],
-            7: [1, 1, 1, 2, 1],
-            8: [1, 1, 1, 2, 1],
-            9: [1, 1, 1, 2, 1],
-            10: [1, 1, 1, 2, 1],
-        }
-        self.current_round = GameRound(to_fail[n_players][self.round_num], to_send[n_players][self.round_num])
+        self.generation += 1
 
+    @recorded()
     def start_proposal(self):
         self.current_round.number_failed_proposals += 1
         self.leader_index = (self.leader_index + 1) % len(self.players)
         self.state = GAMESTATE_PROPOSING
-        self.current_round.votes = {}
+        self.current_round.reset_votes()
+        self.generation += 1
 
+    @recorded()
     def start_mission_voting(self):
         self.state = GAMESTATE_MISSION_VOTE
-        self.current_round.mission_votes = {}
+        self.current_round.reset_mission_votes()
+
+    @recorded()
+    def vote(self, pid, vote):
+        '''
+        returns false if the vote doesn't count, because they've
+        already voted or aren't in the game
+        '''
+        if pid not in self._players_by_id:
+            return False
+        return self.current_round.vote(pid, vote)
+
+    @recorded()
+    def mission_vote(self, pid, vote):
+        return self.current_round.mission_vote(pid, vote)
 
     def all_mission_voted(self):
-        return len(self.current_round.mission_votes) >= self.current_round.num_on_mission
+        return self.current_round.num_mission_votes() >= self.current_round.num_on_mission
 
     def is_ready_to_start(self):
         return self.how_many_needed_to_start() == 0
@@ -168,42 +365,56 @@ class AscendantGame(object):
         '''
         return max(MIN_NUM_OF_PLAYERS - len(self.players), 0)
 
+    @recorded()
+    def set_ready(self, pid):
+        player = self._players_by_id.get(pid)
+        if player is None:
+            return False
+        player.ready = True
+        return True
+
     def all_ready(self):
         return all(p.ready for p in self.players)
     
     def all_seen_votes(self):
         return all(p.seen_vote for p in self.players)
 
-    def get_votes(self):    
-        passed = sum(1 if v else -1 for v in self.current_round.votes.values()) > 0
-
-        if not passed:
-            self.current_round.number_failed_proposals += 1
+    def get_votes(self):
+        # failed proposals are counted by start_proposal, when the
+        # next leader takes over, so this doesn't change anything
+        current_round = self.current_round
+        if self.rules.ties_pass:
+            passed = current_round.approvals >= current_round.rejections
         else:
-            self.current_round.number_failed_proposals = 0
+            passed = current_round.approvals > current_round.rejections
+        return passed, current_round.votes
 
-        return passed, self.current_round.votes
-
-    def get_mission_votes(self):    
-        fail_votes = len([v for v in self.current_round.mission_votes.values() if not v])
-        # returns true if it passes
-        if not (fail_votes >= self.current_round.num_required_to_fail):
-            self.good_won += 1;
-            return True
+    @recorded()
+    def get_mission_votes(self):
+        '''
+        count the mission votes and score the round, only call this
+        once per round
+        '''
+        passed = self.current_round.mission_fails < self.current_round.num_required_to_fail
+        if passed:
+            self.good_won += 1
         else:
-            self.bad_won += 1;
-            return False
+            self.bad_won += 1
+
+        # save the round pass/fail so we can send when someone rejoins
+        self.round_passes.append(passed)
+        return passed
 
     def get_player(self, pid):
-        'much inefficient, very O(n)'
-        for player in self.players:
-            if player.player_id == pid:
-                return player
-        return None
+        return self._players_by_id.get(pid)
 
+    @recorded()
     def remove_player(self, pid):
-        if self.state == GAMESTATE_JOINING and self.get_player(pid) in self.players:
-            self.players.remove(self.get_player(pid))
+        player = self._players_by_id.get(pid)
+        if self.state == GAMESTATE_JOINING and player is not None:
+            self.players.remove(player)
+            del self._players_by_id[pid]
+            self.generation += 1
             return True
         return False
 
@@ -215,12 +426,23 @@ class AscendantGame(object):
             return self.current_round.number_failed_proposals
         return 0
 
+    @recorded()
+    def record_delta(self, event, payload):
+        '''
+        number a broadcast (payload is the encoded json), returns the
+        delta: [sync_version, event, payload]
+        '''
+        self.sync_version += 1
+        return [self.sync_version, event, payload]
+
     def get_current_state(self):
         return self.state
 
+    @recorded()
     def set_mission_members(self, pids):
         self.state = GAMESTATE_PROPOSAL_VOTE
         self.current_round.set_mission_members(pids)
+        self.generation += 1
 
     def start_game(self):
         '''
@@ -233,31 +455,90 @@ class AscendantGame(object):
             # yell at the developer who didn't check this
             raise AscendantError("Not Enough Players")
 
-        shuffled_players = self.players[:]
-        random.shuffle(shuffled_players)
+        seats = list(range(len(self.players)))
+        random.shuffle(seats)
 
         # Essentially it is split up such that 2/3
         # of the players are good and 1/3 are bad
-        n_good = int(2.0/3.0 * len(self.players))
+        n_good = int(GOOD_FRACTION * len(self.players))
 
-        for player in shuffled_players[0:n_good]:
-            player.team = TEAM_GOOD
-        for player in shuffled_players[n_good:]:
-            player.team = TEAM_BAD
+        teams = [TEAM_GOOD] * len(self.players)
+        for seat in seats[n_good:]:
+            teams[seat] = TEAM_BAD
+
+        # the outcome of the shuffle is what gets recorded, so a replay
+        # ends up with the same teams
+        self.assign_teams(teams)
+
+    @recorded()
+    def assign_teams(self, teams):
+        '''
+        give every player their team, in seat order
+        '''
+        for player, team in zip(self.players, teams):
+            player.team = team
 
         self.state = GAMESTATE_READYING
+        self.generation += 1
+
+    @recorded()
+    def finish(self):
+        '''
+        mark the game as over, so no more votes or proposals are taken
+        '''
+        self.state = GAMESTATE_OVER
 
     def is_over(self):
-        if self.good_won == NUM_WINS or self.bad_won == NUM_WINS:
+        if self.good_won >= self.rules.num_wins or self.bad_won >= self.rules.num_wins:
             return True
-        elif self.current_round.number_failed_proposals == MAX_NUM_ROUND_FAILS:
+        elif self.current_round.number_failed_proposals >= self.rules.max_num_round_fails:
             return True
         else:
             return False
 
-    def all_acks_received(self, ack_type):
-        for player in self.players:
-            if (player.acks[ack_type] == False):
-                return False
-        return True
+    def to_state(self):
+        '''
+        the whole game as plain json-able data, for the game store
+        '''
+        return {
+            'game_id': self.game_id,
+            'rules': self.rules.name,
+            'version': self.version,
+            'generation': self.generation,
+            'sync_version': self.sync_version,
+            'state': self.state,
+            'players': [p.to_state() for p in self.players],
+            'leader_index': self.leader_index,
+            'creator': self.creator.to_state(),
+            'good_won': self.good_won,
+            'bad_won': self.bad_won,
+            'round_passes': self.round_passes,
+            'round_num': self.round_num,
+            'current_round': self.current_round.to_state() if self.current_round else None
+        }
 
+    @classmethod
+    def from_state(cls, state):
+        players = [Player.from_state(p) for p in state['players']]
+
+        # the creator is usually one of the players, but they might
+        # have left while the game was still joining
+        creator_id = state['creator']['id']
+        creator = next((p for p in players if p.player_id == creator_id), None)
+        if creator is None:
+            creator = Player.from_state(state['creator'])
+
+        game = cls(state['game_id'], creator, RULES[state['rules']])
+        game.set_players(players)
+        game.version = state['version']
+        game.generation = state['generation']
+        game.sync_version = state['sync_version']
+        game.state = state['state']
+        game.leader_index = state['leader_index']
+        game.good_won = state['good_won']
+        game.bad_won = state['bad_won']
+        game.round_passes = state['round_passes']
+        game.round_num = state['round_num']
+        if state['current_round'] is not None:
+            game.current_round = GameRound.from_state(state['current_round'])
+        return game
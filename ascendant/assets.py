@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+
+"""
+Static Assets
+=============
+
+Builds the files in static/ for serving with long lived caching, and finds them again for the server.
+
+The build copies every asset to static/dist/ under a name with a hash of its contents in it (`js/application.3f2a9c1e0b7d.js`), so a built file never changes and browsers can keep it forever. CSS is built after everything else, with every `url()` in it pointing at the built name. Scripts and stylesheets that aren't minified already are minified with rjsmin and rcssmin, which are in requirements.txt (without them they're copied as they are), and anything that compresses gets a `.gz` next to it, and a `.br` if brotli is installed. static/dist/manifest.json maps every asset to its built name.
+
+Run it from the top of the repo, Heroku does it on deploy (see bin/post_compile):
+
+    python -m ascendant.assets
+
+On the server, `AssetManifest.url` is the asset_url template global, and `AssetManifest.find` picks the best precompressed file for a request. Without a build everything is served straight from static/ as before.
+"""
+
+from __future__ import print_function
+
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+from .settings import *
+
+MANIFEST_NAME = 'manifest.json'
+
+# already compressed, gzip wouldn't get anywhere
+COMPRESSIBLE = ('.css', '.js', '.svg', '.eot', '.ttf', '.html', '.json')
+
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+# preferred first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+# not everywhere knows the fonts
+mimetypes.add_type('application/vnd.ms-fontobject', '.eot')
+mimetypes.add_type('font/ttf', '.ttf')
+mimetypes.add_type('font/woff', '.woff')
+mimetypes.add_type('image/svg+xml', '.svg')
+
+
+def fingerprint(name, content):
+    root, ext = posixpath.splitext(name)
+    return '{}.{}{}'.format(root, hashlib.sha1(content).hexdigest()[:ASSET_HASH_LENGTH], ext)
+
+
+def minify(name, content):
+    if '.min.' in name:
+        return content
+    if name.endswith('.js') and rjsmin is not None:
+        return rjsmin.jsmin(content.decode('utf-8')).encode('utf-8')
+    if name.endswith('.css') and rcssmin is not None:
+        return rcssmin.cssmin(content.decode('utf-8')).encode('utf-8')
+    return content
+
+
+def rewrite_css_urls(name, content, manifest):
+    '''
+    point url()s in a stylesheet at the built files. they're relative
+    to the stylesheet, and might have a ?query or #fragment on the end
+    '''
+    directory = posixpath.dirname(name)
+
+    def rewrite(match):
+        quote, url = match.group(1), match.group(2)
+        if url.startswith(('data:', 'http:', 'https:', '//', '/')):
+            return match.group(0)
+
+        path, suffix = re.match(r'^([^?#]*)(.*)$', url).groups()
+        target = posixpath.normpath(posixpath.join(directory, path))
+        if target not in manifest:
+            return match.group(0)
+
+        built = posixpath.relpath(manifest[target], directory)
+        return 'url({0}{1}{2}{0})'.format(quote, built, suffix)
+
+    return CSS_URL.sub(rewrite, content.decode('utf-8')).encode('utf-8')
+
+
+def compress(path, content):
+    '''
+    write precompressed copies of a built file, if they come out smaller
+    '''
+    out = []
+
+    buf = _gzip(content)
+    if len(buf) < len(content):
+        out.append((path + '.gz', buf))
+    if brotli is not None:
+        buf = brotli.compress(content)
+        if len(buf) < len(content):
+            out.append((path + '.br', buf))
+
+    for compressed_path, buf in out:
+        with open(compressed_path, 'wb') as f:
+            f.write(buf)
+
+
+def _gzip(content):
+    # no timestamp or filename, so the same file always comes out the same
+    buf = io.BytesIO()
+    with gzip.GzipFile(filename='', mode='wb', fileobj=buf, compresslevel=9, mtime=0) as f:
+        f.write(content)
+    return buf.getvalue()
+
+
+def build(static_dir, dist_dir=None, verbose=False):
+    '''
+    build everything in static_dir into dist_dir, which is emptied out
+    first. returns the manifest
+    '''
+    dist_dir = dist_dir or os.path.join(static_dir, ASSET_DIST)
+    if os.path.isdir(dist_dir):
+        shutil.rmtree(dist_dir)
+
+    names = []
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = sorted(d for d in dirs if os.path.join(root, d) != dist_dir)
+        for filename in sorted(files):
+            path = os.path.join(root, filename)
+            names.append(os.path.relpath(path, static_dir).replace(os.sep, '/'))
+
+    # stylesheets last, so whatever they point at is built already
+    names.sort(key=lambda name: name.endswith('.css'))
+
+    manifest = {}
+    for name in names:
+        with open(os.path.join(static_dir, *name.split('/')), 'rb') as f:
+            content = f.read()
+
+        content = minify(name, content)
+        if name.endswith('.css'):
+            content = rewrite_css_urls(name, content, manifest)
+
+        built = fingerprint(name, content)
+        path = os.path.join(dist_dir, *built.split('/'))
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(content)
+        if name.endswith(COMPRESSIBLE):
+            compress(path, content)
+
+        manifest[name] = built
+        if verbose:
+            print('{} -> {}'.format(name, built))
+
+    with open(os.path.join(dist_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def accepted_encodings(accept_encoding):
+    '''
+    the content codings an Accept-Encoding header accepts and the ones it
+    refuses (q=0, or a q we can't read), as two sets. '*' stands for
+    every coding that isn't named
+    '''
+    accepted, refused = set(), set()
+    for item in accept_encoding.split(','):
+        params = item.split(';')
+        coding = params[0].strip().lower()
+        if not coding:
+            continue
+
+        q = 1.0
+        for param in params[1:]:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        (accepted if q > 0 else refused).add(coding)
+    return accepted, refused
+
+
+class AssetManifest(object):
+    '''
+    the built assets, for templates and for serving them. without a
+    manifest (nothing's been built) urls go to the files in static/
+    '''
+
+    def __init__(self, static_dir, dist_dir=None):
+        self.static_dir = static_dir
+        self.dist_dir = dist_dir or os.path.join(static_dir, ASSET_DIST)
+
+        try:
+            with open(os.path.join(self.dist_dir, MANIFEST_NAME)) as f:
+                self.manifest = json.load(f)
+        except IOError:
+            self.manifest = {}
+
+        # built name -> (content type, encodings it's precompressed
+        # in), and only these get served
+        self._built = {}
+        for built in self.manifest.values():
+            path = os.path.join(self.dist_dir, *built.split('/'))
+            encodings = [(encoding, suffix) for encoding, suffix in ENCODINGS if os.path.exists(path + suffix)]
+            self._built[built] = (mimetypes.guess_type(built)[0] or 'application/octet-stream', encodings)
+
+    def url(self, name):
+        built = self.manifest.get(name)
+        if built is None:
+            return '/static/' + name
+        return ASSET_URL_PREFIX + built
+
+    def find(self, built, accept_encoding=''):
+        '''
+        (path, content type, content encoding) of the best file to send
+        for a built asset, or None if there's no such asset. content
+        encoding is None for the file as is
+        '''
+        if built not in self._built:
+            return None
+        content_type, encodings = self._built[built]
+
+        path = os.path.join(self.dist_dir, *built.split('/'))
+        if encodings and accept_encoding:
+            accepted, refused = accepted_encodings(accept_encoding)
+            for encoding, suffix in encodings:
+                if encoding not in refused and (encoding in accepted or '*' in accepted):
+                    return path + suffix, content_type, encoding
+        return path, content_type, None
+
+
+def response_headers(encoding=None):
+    '''
+    headers for sending a built asset. they never change, so they can
+    be cached for as long as browsers will keep them
+    '''
+    headers = {
+        'Cache-Control': 'public, max-age={}, immutable'.format(ASSET_MAX_AGE),
+        'Vary': 'Accept-Encoding'
+    }
+    if encoding is not None:
+        headers['Content-Encoding'] = encoding
+    return headers
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Builds the static assets for long lived caching')
+    parser.add_argument('--static', default='static', help='the static directory')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args()
+
+    manifest = build(args.static, verbose=args.verbose)
+    print('built {} assets into {}'.format(len(manifest), os.path.join(args.static, ASSET_DIST)))
+    if rjsmin is None or rcssmin is None or brotli is None:
+        print('(pip install rjsmin rcssmin brotli to minify and brotli them too)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+
+"""
+Balance Simulator
+=================
+
+Plays huge batches of games as numpy arrays to see how balanced a set of rules is.
+
+Every game in a batch is a row, and each step of the simulation plays one proposal in every game that isn't over yet: the leader picks a team, everybody votes on it, and if it passes the team plays the mission. The rules come straight from the RuleSet tables in settings, and teams are split with GOOD_FRACTION the same way AscendantGame.start_game does it.
+
+The players follow a simple strategy:
+
+- the leader always goes on the mission, with the rest of the team picked at random
+- good players approve a proposal with probability approve_good, bad players with approve_bad
+- good players always pass missions, bad players fail them with probability sabotage
+
+Run it from the top of the repo:
+
+    python -m ascendant.balance -n 1000000
+    python -m ascendant.balance --rules house --sabotage 0.8
+
+tests/test_balance.py plays the same strategy through AscendantGame one game at a time too, and fails if the two disagree by more than chance allows.
+
+Needs numpy, which the server itself doesn't.
+"""
+
+from __future__ import division, print_function
+
+import argparse
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .errors import *
+from .settings import *
+
+# the ways a game can end
+GOOD_WINS = 0
+BAD_WINS_MISSIONS = 1
+BAD_WINS_PROPOSALS = 2
+OUTCOMES = ('good wins', 'bad by missions', 'bad by proposals')
+
+# games per batch, so a million games doesn't need gigabytes of arrays
+BATCH_SIZE = 100000
+
+
+class Strategy(object):
+    '''
+    how the simulated players play
+    '''
+
+    def __init__(self, approve_good=0.7, approve_bad=0.5, sabotage=0.8, good_fraction=GOOD_FRACTION):
+        self.approve_good = approve_good
+        self.approve_bad = approve_bad
+        self.sabotage = sabotage
+        self.good_fraction = good_fraction
+
+
+def _tables(rules, n_players):
+    to_send = rules.to_send[n_players] if 0 <= n_players < len(rules.to_send) else None
+    if to_send is None:
+        raise AscendantError('Rules {} can\'t be played with {} players'.format(rules.name, n_players))
+    return np.array(to_send), np.array(rules.to_fail[n_players])
+
+
+def simulate_batch(rng, rules, n_players, n_games, strategy):
+    '''
+    play n_games games at once, returns an array with the OUTCOMES
+    index of every game and one with how many proposals each took
+    '''
+    to_send, to_fail = _tables(rules, n_players)
+    games = np.arange(n_games)
+
+    # random teams, the first n_good of a random shuffle are good
+    n_good = int(strategy.good_fraction * n_players)
+    seats = rng.random((n_games, n_players)).argsort(axis=1).argsort(axis=1)
+    bad = seats >= n_good
+    approve = np.where(bad, strategy.approve_bad, strategy.approve_good)
+
+    good_won = np.zeros(n_games, dtype=np.int8)
+    bad_won = np.zeros(n_games, dtype=np.int8)
+    round_num = np.zeros(n_games, dtype=np.int8)
+    failed_proposals = np.zeros(n_games, dtype=np.int8)
+    proposals = np.zeros(n_games, dtype=np.int16)
+    outcome = np.full(n_games, -1, dtype=np.int8)
+    leader = np.zeros(n_games, dtype=np.int8)
+
+    live = games
+    while len(live):
+        n_live = len(live)
+        rounds = np.minimum(round_num[live], len(to_send) - 1)
+        num_on_mission = to_send[rounds]
+
+        # the leader plus the lowest random keys of everybody else
+        keys = rng.random((n_live, n_players))
+        keys[np.arange(n_live), leader[live]] = -1.0
+        rank = keys.argsort(axis=1).argsort(axis=1)
+        on_mission = rank < num_on_mission[:, None]
+
+        # a majority, or half if ties pass, same as get_votes
+        approvals = (rng.random((n_live, n_players)) < approve[live]).sum(axis=1)
+        passed = 2 * approvals >= n_players if rules.ties_pass else 2 * approvals > n_players
+
+        sabotaged = on_mission & bad[live] & (rng.random((n_live, n_players)) < strategy.sabotage)
+        mission_passed = sabotaged.sum(axis=1) < to_fail[rounds]
+
+        proposals[live] += 1
+        leader[live] = (leader[live] + 1) % n_players
+
+        played = live[passed]
+        good_won[played] += mission_passed[passed]
+        bad_won[played] += ~mission_passed[passed]
+        round_num[played] += 1
+        failed_proposals[played] = 0
+
+        rejected = live[~passed]
+        failed_proposals[rejected] += 1
+
+        outcome[live[good_won[live] >= rules.num_wins]] = GOOD_WINS
+        outcome[live[bad_won[live] >= rules.num_wins]] = BAD_WINS_MISSIONS
+        outcome[rejected[failed_proposals[rejected] >= rules.max_num_round_fails]] = BAD_WINS_PROPOSALS
+
+        live = live[outcome[live] < 0]
+
+    return outcome, proposals
+
+
+def simulate(rules, n_players, n_games, strategy, seed=None, batch_size=BATCH_SIZE):
+    '''
+    returns how many games ended each way (indexed like OUTCOMES) and
+    the mean number of proposals per game
+    '''
+    if np is None:
+        raise AscendantError('The balance simulator needs numpy')
+
+    rng = np.random.default_rng(seed)
+    counts = np.zeros(len(OUTCOMES), dtype=np.int64)
+    total_proposals = 0
+
+    for start in range(0, n_games, batch_size):
+        outcome, proposals = simulate_batch(rng, rules, n_players, min(batch_size, n_games - start), strategy)
+        counts += np.bincount(outcome, minlength=len(OUTCOMES))
+        total_proposals += int(proposals.sum())
+
+    return counts.tolist(), total_proposals / n_games
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Plays huge batches of games to see how balanced the rules are')
+    parser.add_argument('-n', '--games', type=int, default=1000000, help='games per player count')
+    parser.add_argument('-p', '--players', type=int, nargs='+',
+                        default=list(range(MIN_NUM_OF_PLAYERS, MAX_NUM_OF_PLAYERS + 1)))
+    parser.add_argument('--rules', default=DEFAULT_RULES.name, choices=sorted(RULES))
+    parser.add_argument('--approve-good', type=float, default=0.7)
+    parser.add_argument('--approve-bad', type=float, default=0.5)
+    parser.add_argument('--sabotage', type=float, default=0.8)
+    parser.add_argument('--good-fraction', type=float, default=GOOD_FRACTION)
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    rules = RULES[args.rules]
+    strategy = Strategy(args.approve_good, args.approve_bad, args.sabotage, args.good_fraction)
+
+    print('rules {}, {} games per player count'.format(rules.name, args.games))
+    print('{:>7} {:>10} {:>16} {:>17} {:>10} {:>12}'.format(
+        'players', 'good wins', 'bad by missions', 'bad by proposals', 'proposals', 'games/s'))
+    for n_players in args.players:
+        start = time.time()
+        counts, mean_proposals = simulate(rules, n_players, args.games, strategy, args.seed)
+        elapsed = time.time() - start
+        print('{:>7} {:>9.1f}% {:>15.1f}% {:>16.1f}% {:>10.1f} {:>12.0f}'.format(
+            n_players,
+            *([100.0 * c / args.games for c in counts] + [mean_proposals, args.games / elapsed])))
+
+
+if __name__ == '__main__':
+    main()
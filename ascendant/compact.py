@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compact Encoding
+================
+
+A smaller encoding of the events that get broadcast the most, for clients that ask for it.
+
+Player ids are uuids, and the hot events are mostly lists and dicts of them. Clients that create or join a game with `'encoding': 'compact'` get those events as short json arrays instead, with every player as their seat (their index in the player list) and every set of players as a bitmap of seats, bit i for seat i. Everything else, including the deltas in a rejoin ack, is the same json the other clients get.
+
+Clients get the ids that go with the seats from the player lists in the join ack and assign_roles, which are plain json in seat order. Seats only change while the game is filling up, and nothing needs an id before assign_roles. `expand` turns a compact payload back into the json one, given that list.
+
+Compact clients are kept in rooms of their own (the room name plus COMPACT_ROOM), so clients that never asked for it don't see any of this. The service keeps track of which rooms have compact clients in them and doesn't emit to the compact room of one that doesn't, so a game with no compact clients costs no more than it did before.
+"""
+
+import json
+
+from .payloads import encode
+from .settings import *
+
+
+def seats(game):
+    '''
+    player_id -> seat
+    '''
+    return dict((p.player_id, i) for i, p in enumerate(game.players))
+
+
+def bitmap(seat_of, player_ids):
+    bits = 0
+    for player_id in player_ids:
+        if player_id in seat_of:
+            bits |= 1 << seat_of[player_id]
+    return bits
+
+
+def _update_players(payload, seat_of):
+    return [[seat_of.get(p['id'], -1), p['name']] for p in payload]
+
+
+def _propose_mission(payload, seat_of):
+    return [seat_of.get(payload['leader']['id'], -1), payload['mission_number'], payload['number_players']]
+
+
+def _do_proposal_vote(payload, seat_of):
+    return [bitmap(seat_of, payload['players'])]
+
+
+def _proposal_vote_result(payload, seat_of):
+    approvals = [player_id for player_id, vote in payload['votes'].items() if vote]
+    return [int(payload['pass']), bitmap(seat_of, approvals), bitmap(seat_of, payload['players']),
+            payload['failed_proposals']]
+
+
+def _mission_vote_result(payload, seat_of):
+    passes, fails = payload['tally']
+    return [int(payload['pass']), payload['mission_number'], passes, fails]
+
+
+# event -> how to build its compact payload from the json one
+COMPACT_EVENTS = {
+    'update_players': _update_players,
+    'propose_mission': _propose_mission,
+    'do_proposal_vote': _do_proposal_vote,
+    'proposal_vote_result': _proposal_vote_result,
+    'mission_vote_result': _mission_vote_result
+}
+
+
+def compact_payload(game, event, payload):
+    '''
+    the compact version of an event's payload, already encoded, or None
+    if the event doesn't have one. payload can be encoded json too
+    '''
+    build = COMPACT_EVENTS.get(event)
+    if build is None:
+        return None
+    if not isinstance(payload, (dict, list)):
+        payload = json.loads(payload)
+    return encode(build(payload, seats(game)))
+
+
+def _bits(bits, players):
+    return [p['id'] for seat, p in enumerate(players) if bits & (1 << seat)]
+
+
+def _player(players, seat):
+    # somebody who joined after the list the client has
+    if 0 <= seat < len(players):
+        return players[seat]
+    return {'id': None, 'name': None, 'team': -1}
+
+
+def expand(event, data, players):
+    '''
+    the json payload back from a compact one, what a compact client
+    does. players is the player list from the join ack or assign_roles,
+    in seat order. sets of players come back in seat order, and a
+    player who isn't in the list gets None for an id
+    '''
+    if event == 'update_players':
+        return [{'id': _player(players, seat)['id'], 'name': name, 'team': -1} for seat, name in data]
+    elif event == 'propose_mission':
+        leader, mission_number, number_players = data
+        leader = _player(players, leader)
+        return {'leader': {'id': leader['id'], 'name': leader['name'], 'team': -1},
+                'mission_number': mission_number, 'number_players': number_players}
+    elif event == 'do_proposal_vote':
+        return {'players': _bits(data[0], players)}
+    elif event == 'proposal_vote_result':
+        passed, approvals, mission, failed_proposals = data
+        # everybody votes, so whoever didn't approve rejected
+        votes = dict((p['id'], bool(approvals & (1 << seat))) for seat, p in enumerate(players))
+        n_approvals = sum(votes.values())
+        return {'pass': bool(passed), 'votes': votes, 'tally': [n_approvals, len(votes) - n_approvals],
+                'players': _bits(mission, players), 'failed_proposals': failed_proposals}
+    elif event == 'mission_vote_result':
+        passed, mission_number, passes, fails = data
+        return {'pass': bool(passed), 'mission_number': mission_number, 'tally': [passes, fails]}
+    return data
@@ -25,3 +25,17 @@ class NotEnoughPlayers(AscendantError):
         AscendantError.__init__(self, description)
 
 
+
+class GameNotFound(AscendantError):
+    '''
+    Error for a game id that isn't in the game store
+    '''
+    def __init__(self, description):
+        AscendantError.__init__(self, description)
+
+class StaleGame(AscendantError):
+    '''
+    Error for saving a game that someone else saved first
+    '''
+    def __init__(self, description):
+        AscendantError.__init__(self, description)
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+
+"""
+Event Log
+=========
+
+Keeps the in-process games on disk, so a restarted worker gets them back.
+
+Every call that changes a game (see `recorded` in ascendant.py) is appended to a log as one line of json: `[game_id, method, args]`, plus `create` and `delete` lines for games coming and going. Random steps are recorded by their outcome (assign_teams has the teams, not the shuffle), so replaying the log always ends up with the same games.
+
+Handlers never wait on the disk. Events are buffered in memory, and `run` writes and fsyncs everything buffered every LOG_FLUSH_INTERVAL seconds (a group commit), so a crash loses at most that much. Every LOG_SNAPSHOT_INTERVAL seconds the log starts a new segment and writes a snapshot of every game, and the older segments are deleted.
+
+On startup `recover` loads the newest snapshot and replays the segments written after it.
+
+The Redis store already keeps games somewhere that survives a restart, so this only goes with the memory store.
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+from .ascendant import AscendantGame
+from .errors import *
+from .settings import *
+from .store import GameStore, MemoryGameStore
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_NAME = 'events-{:08d}.log'
+SNAPSHOT_NAME = 'snapshot-{:08d}.json'
+FILE_PATTERN = re.compile(r'^(events|snapshot)-(\d{8})\.(log|json)$')
+
+
+def replay(games, lines):
+    '''
+    apply logged events to games, a dict of game_id -> AscendantGame
+    '''
+    for line in lines:
+        try:
+            game_id, name, args = json.loads(line)
+        except ValueError:
+            # a crash in the middle of a write leaves half a line at
+            # the end of the segment, and there's nothing after it
+            logger.warning('skipping unreadable event: %r', line)
+            continue
+
+        if name == 'create':
+            games[game_id] = AscendantGame.from_state(args[0])
+        elif name == 'delete':
+            games.pop(game_id, None)
+        elif game_id in games:
+            method = getattr(games[game_id], name)
+            decode = getattr(method, 'decode', None)
+            method(*(decode(args) if decode else args))
+
+
+class EventLog(object):
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.store = None
+
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._segment = None
+        self._file = None
+        self._last_snapshot = time.time()
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _path(self, name, seq):
+        return os.path.join(self.directory, name.format(seq))
+
+    def _files(self):
+        '''
+        (kind, seq, path) for everything in the log directory, oldest first
+        '''
+        files = []
+        for filename in os.listdir(self.directory):
+            match = FILE_PATTERN.match(filename)
+            if match:
+                files.append((match.group(1), int(match.group(2)), os.path.join(self.directory, filename)))
+        return sorted(files, key=lambda f: f[1])
+
+    def record(self, game_id, name, args):
+        '''
+        buffer an event, this is the listener every logged game gets
+        '''
+        line = json.dumps([game_id, name, args], separators=(',', ':'))
+        with self._lock:
+            self._buffer.append(line)
+
+    def _take_buffer(self):
+        with self._lock:
+            lines, self._buffer = self._buffer, []
+        return lines
+
+    def _write(self, lines):
+        if lines:
+            self._file.write(''.join(line + '\n' for line in lines))
+            self._file.flush()
+
+    def flush(self, sync=os.fsync):
+        '''
+        write out and fsync everything buffered so far. sync is called
+        with the file descriptor, so it can be pushed off to a thread
+        '''
+        lines = self._take_buffer()
+        if lines:
+            self._write(lines)
+            sync(self._file.fileno())
+
+    def recover(self, store):
+        '''
+        load the games back into store (which should be empty) and
+        start logging. returns the store to use from now on
+        '''
+        if not isinstance(store, MemoryGameStore):
+            raise AscendantError('The event log only works with the memory game store')
+
+        files = self._files()
+        snapshots = [f for f in files if f[0] == 'snapshot']
+
+        games = {}
+        start = 0
+        if snapshots:
+            _, start, path = snapshots[-1]
+            with open(path) as f:
+                for state in json.load(f):
+                    games[state['game_id']] = AscendantGame.from_state(state)
+
+        segments = [f for f in files if f[0] == 'events' and f[1] >= start]
+        for _, _, path in segments:
+            with open(path) as f:
+                replay(games, f.read().splitlines())
+
+        for game in games.values():
+            game.listener = self.record
+            store.add(game)
+
+        self.store = LoggedGameStore(store, self)
+        self._segment = max([start] + [f[1] for f in segments])
+        self._file = open(self._path(SEGMENT_NAME, self._segment), 'a')
+
+        # start fresh, so the next restart doesn't replay all that again
+        self.snapshot()
+
+        logger.info('recovered %d games from %s', len(games), self.directory)
+        return self.store
+
+    def snapshot(self, sync=os.fsync):
+        '''
+        start a new segment and save every game, then drop the files
+        the snapshot replaces
+        '''
+        self.flush(sync)
+
+        # from here until the new segment is open nothing can yield, so
+        # no handler can change a game in between: every change is
+        # either in the snapshot or in the new segment, never both
+        self._write(self._take_buffer())
+        old_file = self._file
+        self._segment += 1
+        self._file = open(self._path(SEGMENT_NAME, self._segment), 'a')
+        states = [game.to_state() for game in self.store]
+
+        sync(old_file.fileno())
+        old_file.close()
+
+        path = self._path(SNAPSHOT_NAME, self._segment)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(states, f, separators=(',', ':'))
+            f.flush()
+            sync(f.fileno())
+        os.rename(path + '.tmp', path)
+
+        for _, seq, old_path in self._files():
+            if seq < self._segment:
+                os.remove(old_path)
+
+        self._last_snapshot = time.time()
+
+    def snapshot_due(self, snapshot_interval=LOG_SNAPSHOT_INTERVAL):
+        return time.time() - self._last_snapshot >= snapshot_interval
+
+    def run(self, sleep, interval=LOG_FLUSH_INTERVAL, snapshot_interval=LOG_SNAPSHOT_INTERVAL, sync=os.fsync):
+        '''
+        group commit forever, meant to be run in its own greenlet
+        '''
+        while True:
+            sleep(interval)
+            if self.snapshot_due(snapshot_interval):
+                self.snapshot(sync)
+            else:
+                self.flush(sync)
+
+    def close(self):
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+
+
+class LoggedGameStore(GameStore):
+    '''
+    a memory store that logs games being added and deleted, and hooks
+    every added game up to the log
+    '''
+
+    def __init__(self, store, log):
+        self.store = store
+        self.log = log
+
+    def get(self, game_id):
+        return self.store.get(game_id)
+
+    def add(self, game):
+        if not self.store.add(game):
+            return False
+        self.log.record(game.game_id, 'create', [game.to_state()])
+        game.listener = self.log.record
+        return True
+
+    def update(self, game_id, func):
+        return self.store.update(game_id, func)
+
+    def save(self, game):
+        self.store.save(game)
+
+    def delete(self, game_id):
+        if game_id in self.store:
+            self.store.delete(game_id)
+            self.log.record(game_id, 'delete', [])
+
+    def ids(self):
+        return self.store.ids()
+
+    def __contains__(self, game_id):
+        return game_id in self.store
+
+    def __iter__(self):
+        return iter(self.store)
+
+    def __len__(self):
+        return len(self.store)
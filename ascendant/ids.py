@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+
+"""
+Game IDs
+========
+
+Hands out the 4 letter game codes.
+
+Instead of drawing random codes and retrying until one isn't taken (which gets slower the fuller the server is), the allocator walks a counter through all 26^4 codes, scrambled with a keyed Feistel permutation so the codes still look random. Every allocation is constant time and never collides. Codes of games that have ended go on a free list, which is only used once the counter runs out, so a code isn't reused while people might still remember it.
+
+The Redis allocator keeps the key, the counter and the free list in Redis so every worker draws from the same sequence.
+"""
+
+import random
+from collections import deque
+from string import ascii_uppercase as uppercase
+
+from .errors import *
+
+ID_LENGTH = 4
+ID_SPACE = len(uppercase) ** ID_LENGTH
+
+# the feistel network works on HALF_BITS * 2 bit numbers, the smallest
+# even number of bits that covers ID_SPACE
+HALF_BITS = 10
+HALF_MASK = (1 << HALF_BITS) - 1
+FEISTEL_ROUNDS = 4
+
+
+def encode(code):
+    letters = []
+    for _ in range(ID_LENGTH):
+        code, i = divmod(code, len(uppercase))
+        letters.append(uppercase[i])
+    return ''.join(reversed(letters))
+
+
+def is_game_id(game_id):
+    '''
+    whether game_id looks like a game code, without asking anybody
+    '''
+    return isinstance(game_id, (str, type(u''))) and len(game_id) == ID_LENGTH \
+        and all(letter in uppercase for letter in game_id)
+
+
+def decode(game_id):
+    code = 0
+    for letter in game_id:
+        code = code * len(uppercase) + uppercase.index(letter)
+    return code
+
+
+class Permutation(object):
+    '''
+    keyed permutation of range(ID_SPACE)
+    '''
+
+    def __init__(self, key):
+        rng = random.Random(key)
+        self.round_keys = [rng.getrandbits(32) for _ in range(FEISTEL_ROUNDS)]
+
+    def _feistel(self, x):
+        left, right = x >> HALF_BITS, x & HALF_MASK
+        for round_key in self.round_keys:
+            mixed = ((right ^ round_key) * 0x9E3779B1) & 0xFFFFFFFF
+            left, right = right, left ^ ((mixed >> 13) & HALF_MASK)
+        return (left << HALF_BITS) | right
+
+    def __call__(self, n):
+        # the network permutes 2^20 numbers, so keep going until we land
+        # back inside ID_SPACE. that takes ~2.3 steps on average
+        x = self._feistel(n)
+        while x >= ID_SPACE:
+            x = self._feistel(x)
+        return x
+
+
+class GameIdAllocator(object):
+    '''
+    allocates game ids for a single process
+    '''
+
+    def __init__(self, key=None):
+        self.permute = Permutation(random.getrandbits(64) if key is None else key)
+        self._next = 0
+        self._free = deque()
+        self._live = set()
+
+    def allocate(self):
+        if self._next < ID_SPACE:
+            code = self.permute(self._next)
+            self._next += 1
+        elif self._free:
+            code = self._free.popleft()
+        else:
+            raise AscendantError('Out of game ids')
+
+        game_id = encode(code)
+        self._live.add(game_id)
+        return game_id
+
+    def release(self, game_id):
+        # ids that aren't live are ignored, so releasing twice can't
+        # put an id on the free list twice
+        if game_id in self._live:
+            self._live.remove(game_id)
+            self._free.append(decode(game_id))
+
+    def claim(self, game_id):
+        '''
+        marks an id that's already in use as live, for recovered games
+        '''
+        self._live.add(game_id)
+
+    def __contains__(self, game_id):
+        return game_id in self._live
+
+    def __len__(self):
+        return len(self._live)
+
+
+class RedisGameIdAllocator(object):
+    '''
+    allocates game ids shared by every worker, every step is a single
+    atomic redis command
+    '''
+
+    def __init__(self, redis, prefix='ascendant:ids:'):
+        self.redis = redis
+        self.next_key = prefix + 'next'
+        self.free_key = prefix + 'free'
+        self.live_key = prefix + 'live'
+
+        # the first worker to get here picks the key for everybody
+        key_key = prefix + 'key'
+        self.redis.setnx(key_key, random.getrandbits(64))
+        self.permute = Permutation(int(self.redis.get(key_key)))
+
+    def allocate(self):
+        n = self.redis.incr(self.next_key) - 1
+        if n < ID_SPACE:
+            game_id = encode(self.permute(n))
+        else:
+            game_id = self.redis.lpop(self.free_key)
+            if game_id is None:
+                raise AscendantError('Out of game ids')
+            if isinstance(game_id, bytes):
+                game_id = game_id.decode('utf-8')
+
+        self.redis.sadd(self.live_key, game_id)
+        return game_id
+
+    def release(self, game_id):
+        if self.redis.srem(self.live_key, game_id):
+            self.redis.rpush(self.free_key, game_id)
+
+    def claim(self, game_id):
+        self.redis.sadd(self.live_key, game_id)
+
+    def __contains__(self, game_id):
+        return bool(self.redis.sismember(self.live_key, game_id))
+
+    def __len__(self):
+        return self.redis.scard(self.live_key)
+
+
+def make_allocator(store):
+    '''
+    an allocator to go with the game store, shared if the store is
+    '''
+    redis = getattr(store, 'redis', None)
+    if redis is not None:
+        return RedisGameIdAllocator(redis)
+    return GameIdAllocator()
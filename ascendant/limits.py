@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+"""
+Limits
+======
+
+Rate limits and admission control for the socket.io events.
+
+Every event a client sends takes a token from a bucket for its session and from one for its game. The buckets refill at a steady rate up to a burst, so nobody playing normally ever notices, but a client stuck in a loop (say reconnecting and asking for get_current_action, which sends something back every time) gets an error ack instead of flooding its game's room. The game's bucket caps a whole table, however many connections its players have.
+
+Events for a game that doesn't exist are turned away before the game store is touched: the game id has to look like one and be live in the id allocator, which is a set lookup (one SISMEMBER with redis) instead of loading and unpickling a game.
+
+Past MAX_GAMES live games, creating one gets an error ack, and past MAX_CONNECTIONS a worker refuses new connections, so a full server tells newcomers so right away and the games already going keep their latency. Games are counted by the id allocator, so with redis that's every worker's games. Buckets and connections are per worker, like the reaper.
+"""
+
+import time
+
+from .ids import is_game_id
+from .metrics import Counter
+from .settings import *
+
+LIMITED = Counter('ascendant_limited_total', 'Events and connections that were turned away', ('reason',))
+
+# buckets that have filled back up are let go every this many takes
+SWEEP_EVERY = 10000
+
+
+class TokenBuckets(object):
+    '''
+    a token bucket per key, refilling `rate` tokens a second up to `burst`
+    '''
+
+    def __init__(self, rate, burst, clock=time.time):
+        self.rate = float(rate)
+        self.burst = burst
+        self.clock = clock
+
+        # key -> (tokens, when they were counted)
+        self._buckets = {}
+        self._takes = 0
+
+    def take(self, key, cost=1):
+        '''
+        0 if the key had cost tokens to spare, otherwise how many seconds
+        until it will
+        '''
+        self._takes += 1
+        if self._takes >= SWEEP_EVERY:
+            self.sweep()
+
+        now = self.clock()
+        tokens, then = self._buckets.get(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - then) * self.rate)
+
+        if tokens < cost:
+            self._buckets[key] = (tokens, now)
+            return (cost - tokens) / self.rate
+
+        self._buckets[key] = (tokens - cost, now)
+        return 0
+
+    def forget(self, key):
+        self._buckets.pop(key, None)
+
+    def sweep(self):
+        '''
+        drops every bucket that has filled back up, it's the same as a
+        new one. keys that are never forgotten go this way
+        '''
+        self._takes = 0
+        now = self.clock()
+        full = [key for key, (tokens, then) in self._buckets.items()
+                if tokens + (now - then) * self.rate >= self.burst]
+        for key in full:
+            del self._buckets[key]
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class Limits(object):
+    '''
+    `game_ids` is the server's id allocator, which knows the live games
+    '''
+
+    def __init__(self, game_ids, max_games=MAX_GAMES, max_connections=MAX_CONNECTIONS, clock=time.time):
+        self.game_ids = game_ids
+        self.max_games = max_games
+        self.max_connections = max_connections
+
+        self.sessions = TokenBuckets(SESSION_EVENT_RATE, SESSION_EVENT_BURST, clock)
+        self.games = TokenBuckets(GAME_EVENT_RATE, GAME_EVENT_BURST, clock)
+        self.connections = set()
+
+    def connect(self, sid):
+        '''
+        False if the worker is full and the connection should be refused
+        '''
+        if len(self.connections) >= self.max_connections:
+            LIMITED.inc(('connections',))
+            return False
+        self.connections.add(sid)
+        return True
+
+    def disconnect(self, sid):
+        self.connections.discard(sid)
+        self.sessions.forget(sid)
+
+    def end_game(self, game_id):
+        self.games.forget(game_id)
+
+    def check(self, sid, data, cost=1, game=True, new_game=False):
+        '''
+        None if the event can go ahead, otherwise the error to ack with.
+        `game` is whether the event is for an existing game (data has its
+        game_id), `new_game` whether it makes one
+        '''
+        wait = self.sessions.take(sid, cost)
+        if wait:
+            return self._slow_down('session', wait)
+
+        if new_game and len(self.game_ids) >= self.max_games:
+            LIMITED.inc(('games',))
+            return {'success': False, 'game_id': None, 'error_message': 'The server is full, try again later'}
+
+        if not game:
+            return None
+
+        game_id = data.get('game_id') if isinstance(data, dict) else None
+        if not is_game_id(game_id) or game_id not in self.game_ids:
+            LIMITED.inc(('unknown_game',))
+            return {'success': False, 'error_message': 'No such game'}
+
+        wait = self.games.take(game_id, cost)
+        if wait:
+            return self._slow_down('game', wait)
+        return None
+
+    def _slow_down(self, reason, wait):
+        LIMITED.inc((reason,))
+        return {'success': False, 'error_message': 'Slow down', 'retry_after': round(wait, 3)}
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+"""
+Lobby
+=====
+
+The games that are still waiting for players, for the list of games to join.
+
+The server keeps the index up to date as players join and leave and games start or go away, so listing never has to look through the game store. Lobbies are bucketed by how many players they have, fullest first since those are the ones about to start, and oldest first within a bucket. Full lobbies aren't listed.
+
+Lots of clients poll the list, so it's served from a snapshot that's rebuilt at most every LOBBY_SNAPSHOT_TTL seconds, and every page of it is only encoded once. Like the reaper, each worker only knows about the games it has seen.
+"""
+
+import time
+from collections import OrderedDict
+
+from .payloads import encode
+from .settings import *
+
+
+class LobbyIndex(object):
+
+    def __init__(self, ttl=LOBBY_SNAPSHOT_TTL, clock=time.time):
+        self.ttl = ttl
+        self.clock = clock
+
+        # number of players -> {game_id: listing}, oldest first
+        self._buckets = dict((n, OrderedDict()) for n in range(1, MAX_NUM_OF_PLAYERS))
+        # game_id -> the bucket it's in
+        self._bucket_of = {}
+
+        # listings, fullest first, as of _snapshot_at
+        self._snapshot = None
+        self._snapshot_at = None
+        # (page, per_page, min_players, max_players) -> RawJSON
+        self._pages = {}
+
+    def update(self, game):
+        '''
+        call this whenever a game's players or state might have changed
+        '''
+        n_players = len(game.players)
+        if game.get_current_state() != GAMESTATE_JOINING or n_players not in self._buckets:
+            self.remove(game.game_id)
+            return
+
+        if self._bucket_of.get(game.game_id) == n_players:
+            return
+
+        self.remove(game.game_id)
+        self._buckets[n_players][game.game_id] = {
+            'game_id': game.game_id,
+            'creator': game.creator.name,
+            'players': n_players,
+            'rules': game.rules.name
+        }
+        self._bucket_of[game.game_id] = n_players
+
+    def remove(self, game_id):
+        n_players = self._bucket_of.pop(game_id, None)
+        if n_players is not None:
+            del self._buckets[n_players][game_id]
+
+    def _fresh_snapshot(self):
+        now = self.clock()
+        if self._snapshot is None or now - self._snapshot_at >= self.ttl:
+            self._snapshot = [(n, list(self._buckets[n].values())) for n in sorted(self._buckets, reverse=True)]
+            self._snapshot_at = now
+            self._pages = {}
+        return self._snapshot
+
+    def page(self, page=0, per_page=LOBBY_PAGE_SIZE, min_players=1, max_players=MAX_NUM_OF_PLAYERS):
+        '''
+        one page of lobbies with min_players to max_players players, as
+        json ready to send. page counts from 0
+        '''
+        page = max(int(page), 0)
+        per_page = min(max(int(per_page), 1), LOBBY_MAX_PAGE_SIZE)
+        min_players = min(max(int(min_players), 1), MAX_NUM_OF_PLAYERS)
+        max_players = min(max(int(max_players), 1), MAX_NUM_OF_PLAYERS)
+
+        snapshot = self._fresh_snapshot()
+        key = (page, per_page, min_players, max_players)
+        if key in self._pages:
+            return self._pages[key]
+
+        buckets = [listings for n, listings in snapshot if min_players <= n <= max_players]
+        total = sum(len(listings) for listings in buckets)
+
+        # skip whole buckets until the page starts, then take from as
+        # many buckets as it takes to fill it
+        games = []
+        skip = page * per_page
+        for listings in buckets:
+            if skip >= len(listings):
+                skip -= len(listings)
+                continue
+            games.extend(listings[skip:skip + per_page - len(games)])
+            skip = 0
+            if len(games) == per_page:
+                break
+
+        result = encode({
+            'games': games,
+            'page': page,
+            'per_page': per_page,
+            'total': total
+        })
+        # pages past the end are all the same, don't fill up on them
+        if games:
+            self._pages[key] = result
+        return result
+
+    def __len__(self):
+        return len(self._bucket_of)
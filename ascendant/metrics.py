@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+"""
+Metrics
+=======
+
+Counters, gauges and histograms, rendered in the Prometheus text format for the /metrics route.
+
+Recording is just a dict update, so it's cheap enough for every handler call and every ack. Anything that would be expensive to keep up to date (like how many games are in each state) is a gauge with a function instead, which only runs when /metrics is scraped.
+"""
+
+from bisect import bisect_left
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# in seconds, handlers are quick but acks go over the network
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# every metric that gets created, in order
+REGISTRY = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(n, _escape(v)) for n, v in zip(names, values)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Metric(object):
+    '''
+    base for all the metrics. labels are given as a tuple of values, in
+    the same order as the label names the metric was created with
+    '''
+    kind = 'untyped'
+
+    def __init__(self, name, help, labels=(), registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {}
+        if registry is not None:
+            registry.append(self)
+
+    def samples(self):
+        '''
+        (suffix, label names, label values, value) for every sample
+        '''
+        for labels, value in sorted(self._values.items()):
+            yield '', self.label_names, labels, value
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.help), '# TYPE {} {}'.format(self.name, self.kind)]
+        for suffix, names, values, value in self.samples():
+            lines.append('{}{}{} {}'.format(self.name, suffix, _format_labels(names, values), _format_value(value)))
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, labels=(), amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def get(self, labels=()):
+        return self._values.get(labels, 0)
+
+
+class Gauge(Metric):
+    '''
+    either set directly, or from a function that's called on every
+    render and returns {labels: value}
+    '''
+    kind = 'gauge'
+
+    def __init__(self, name, help, labels=(), registry=REGISTRY, function=None):
+        Metric.__init__(self, name, help, labels, registry)
+        self.function = function
+
+    def set(self, value, labels=()):
+        self._values[labels] = value
+
+    def get(self, labels=()):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        if self.function is not None:
+            self._values = dict(self.function())
+        return Metric.samples(self)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), registry=REGISTRY, buckets=DEFAULT_BUCKETS):
+        Metric.__init__(self, name, help, labels, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, labels=()):
+        entry = self._values.get(labels)
+        if entry is None:
+            # a count for every bucket plus +Inf, then the sum
+            entry = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+
+        entry[bisect_left(self.buckets, value)] += 1
+        entry[-1] += value
+
+    def count(self, labels=()):
+        entry = self._values.get(labels)
+        return sum(entry[:-1]) if entry else 0
+
+    def samples(self):
+        names = self.label_names + ('le',)
+        for labels, entry in sorted(self._values.items()):
+            total = 0
+            for bound, n in zip(self.buckets + (float('inf'),), entry):
+                total += n
+                yield '_bucket', names, labels + (_format_value(float(bound)),), total
+            yield '_sum', self.label_names, labels, entry[-1]
+            yield '_count', self.label_names, labels, total
+
+
+def render(registry=REGISTRY):
+    return '\n'.join(metric.render() for metric in registry) + '\n'
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+"""
+Outbox
+======
+
+Merges bursts of broadcasts to the same room.
+
+When a whole table joins from a shared link, every join broadcasts `update_players` again, and every one of those starts its own ack barrier. The outbox holds coalescing events like that and only sends the latest one, since it supersedes the rest. Each new one holds the room for another COALESCE_WINDOW, so a burst of joins goes out as a single broadcast once it settles down, but nothing is held for more than COALESCE_MAX_DELAY after the first one, so a steady trickle still gets sent. Anything else is sent right away, after whatever is still being held for the room, so the room always gets events in the order they happened.
+"""
+
+from collections import deque
+
+from .metrics import Counter
+from .settings import *
+
+COALESCED = Counter('ascendant_broadcasts_coalesced_total', 'Broadcasts that were never sent because a newer one replaced them', ('event',))
+
+
+class Outbox(object):
+    '''
+    `schedule` is called as schedule(delay, func) and has to return
+    something with a cancel() method, like eventlet.spawn_after does.
+    every event is posted with a send function, which is called with
+    no arguments when it's the event's turn to go out
+    '''
+
+    def __init__(self, schedule, window=COALESCE_WINDOW, max_delay=COALESCE_MAX_DELAY, coalesce=COALESCED_EVENTS):
+        self.schedule = schedule
+        self.window = window
+        self.max_delay = max_delay
+        self.coalesce = coalesce
+
+        # room -> deque of [event, send], oldest first
+        self._queues = {}
+        # room -> [the window's timer, the max delay's timer], either
+        # of which flushes it
+        self._timers = {}
+
+    def post(self, room, event, send):
+        queue = self._queues.get(room)
+
+        if event not in self.coalesce:
+            if queue:
+                queue.append([event, send])
+                self.flush(room)
+            else:
+                send()
+            return
+
+        if queue is None:
+            queue = self._queues[room] = deque()
+
+        if queue and queue[-1][0] == event:
+            # nothing else has been posted since, so the new one can
+            # just take its place
+            queue[-1][1] = send
+            COALESCED.inc((event,))
+        else:
+            queue.append([event, send])
+
+        timers = self._timers.get(room)
+        if timers is None:
+            self._timers[room] = [self.schedule(self.window, lambda: self.flush(room)),
+                                  self.schedule(self.max_delay, lambda: self.flush(room))]
+        else:
+            # start the window over
+            timers[0].cancel()
+            timers[0] = self.schedule(self.window, lambda: self.flush(room))
+
+    def _cancel_timers(self, room):
+        for timer in self._timers.pop(room, ()):
+            timer.cancel()
+
+    def flush(self, room):
+        '''
+        send everything being held for the room, in order
+        '''
+        self._cancel_timers(room)
+
+        queue = self._queues.pop(room, None)
+        while queue:
+            queue.popleft()[1]()
+
+    def discard(self, room):
+        '''
+        drop everything being held for the room without sending it
+        '''
+        self._cancel_timers(room)
+        self._queues.pop(room, None)
+
+    def __len__(self):
+        return sum(len(queue) for queue in self._queues.values())
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+"""
+Payloads
+========
+
+The payloads that get broadcast to a whole game room.
+
+Every game has a generation number that goes up whenever something the broadcasts show changes (players joining or leaving, teams, rounds, leaders). Payloads are built and json encoded once per generation and the encoded json is reused from then on, for every retry and every room. Only saved games fill the cache: with the redis store, two tries at an update (on one worker or two) can both get to the next generation with different players, and the one that isn't saved mustn't leave its payload behind. PayloadJSON is the json module socketio encodes packets with, and it drops the already encoded json straight into the packet.
+"""
+
+import json
+import random
+
+
+class RawJSON(str):
+    '''
+    json that has already been encoded. PayloadJSON puts it in the packet
+    as is, instead of encoding it again as a string
+    '''
+    __slots__ = ()
+
+
+def encode(payload):
+    return RawJSON(json.dumps(payload, separators=(',', ':')))
+
+
+class PayloadJSON(object):
+    '''
+    stands in for the json module when socketio encodes packets
+    '''
+
+    def __init__(self, json_module=json):
+        self._json = json_module
+        # something no real payload will ever contain
+        self._marker = '@@raw-json-{:x}-{{}}@@'.format(random.getrandbits(64))
+
+    def dumps(self, obj, *args, **kwargs):
+        raws = []
+        obj = self._swap(obj, raws)
+
+        out = self._json.dumps(obj, *args, **kwargs)
+        for i, raw in enumerate(raws):
+            out = out.replace('"{}"'.format(self._marker.format(i)), raw, 1)
+        return out
+
+    def loads(self, *args, **kwargs):
+        return self._json.loads(*args, **kwargs)
+
+    def _swap(self, obj, raws):
+        '''
+        replace every RawJSON in obj with a marker string, so it can be
+        swapped back in after encoding
+        '''
+        if isinstance(obj, RawJSON):
+            raws.append(obj)
+            return self._marker.format(len(raws) - 1)
+        elif isinstance(obj, dict):
+            return dict((k, self._swap(v, raws)) for k, v in obj.items())
+        elif isinstance(obj, (list, tuple)):
+            return [self._swap(v, raws) for v in obj]
+        return obj
+
+
+class PayloadCache(object):
+    '''
+    encoded payloads for every game, kept until the game's generation
+    moves on
+    '''
+
+    def __init__(self):
+        # game_id -> {kind: (generation, RawJSON)}
+        self._cache = {}
+
+    def get(self, game, kind, build, cache=True):
+        '''
+        the encoded payload for the game as it is. cache=False for a game
+        that hasn't been saved yet: another try at the same update can
+        get to the same generation with different players, so only
+        saved games fill the cache
+        '''
+        entries = self._cache.setdefault(game.game_id, {})
+
+        entry = entries.get(kind)
+        if entry is not None and entry[0] == game.generation:
+            return entry[1]
+
+        payload = encode(build(game))
+        if cache:
+            entries[kind] = (game.generation, payload)
+        return payload
+
+    def discard(self, game_id):
+        self._cache.pop(game_id, None)
+
+
+def players_payload(game):
+    return [p.to_dict() for p in game.players]
+
+
+def team_players_payload(game):
+    '''
+    the player list with everyone's team showing, which is what the bad
+    team gets in assign_roles. the good team gets players_payload
+    '''
+    return [p.to_dict(show_team=True) for p in game.players]
+
+
+def propose_mission_payload(game):
+    return {
+        'leader': game.get_leader().to_dict(),
+        'mission_number': game.round_num,
+        'number_players': game.current_round.num_on_mission,
+    }
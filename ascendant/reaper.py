@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+"""
+Reaper
+======
+
+Evicts games that nobody is playing anymore.
+
+Games normally go away when they end or when the last player leaves, but abandoned lobbies and games where everybody disconnected would otherwise stay around forever. The reaper remembers when every game was last touched, evicts the ones that have been idle longer than the TTL for their state, and keeps the number of games under a cap by evicting the least recently used ones.
+"""
+
+import time
+from collections import OrderedDict
+
+from .metrics import Counter
+from .settings import *
+
+EVICTED = Counter('ascendant_games_evicted_total', 'Games the reaper threw out', ('reason',))
+
+
+class GameReaper(object):
+    '''
+    `evict` is called with the game_id of every game that should go.
+    the store is only used to check whether someone else (another
+    worker) has changed the game since we last saw it
+    '''
+
+    def __init__(self, store, evict, ttls=GAME_TTLS, default_ttl=GAME_TTL,
+                 max_games=MAX_LIVE_GAMES, clock=time.time):
+        self.store = store
+        self.evict = evict
+        self.ttls = ttls
+        self.default_ttl = default_ttl
+        self.max_games = max_games
+        self.clock = clock
+
+        # game_id -> (last touched, state, version, number of players),
+        # least recent first
+        self._seen = OrderedDict()
+
+        self.evicted_idle = 0
+        self.evicted_lru = 0
+
+    def touch(self, game):
+        self._seen.pop(game.game_id, None)
+        self._seen[game.game_id] = (self.clock(), game.get_current_state(), game.version, len(game.players))
+
+        while len(self._seen) > self.max_games:
+            game_id = next(iter(self._seen))
+            self._seen.pop(game_id)
+            self.evicted_lru += 1
+            EVICTED.inc(('lru',))
+            self.evict(game_id)
+
+    def forget(self, game_id):
+        self._seen.pop(game_id, None)
+
+    def sweep(self):
+        now = self.clock()
+        shortest = min([self.default_ttl] + list(self.ttls.values()))
+
+        expired = []
+        for game_id, (seen, state, version, _) in self._seen.items():
+            idle = now - seen
+            # everything after this was touched even more recently
+            if idle <= shortest:
+                break
+            if idle > self.ttls.get(state, self.default_ttl):
+                expired.append((game_id, version))
+
+        for game_id, version in expired:
+            game = self.store.get(game_id)
+
+            if game is not None and game.version != version:
+                # someone else has been playing it
+                self.touch(game)
+            else:
+                self._seen.pop(game_id, None)
+                self.evicted_idle += 1
+                EVICTED.inc(('idle',))
+                self.evict(game_id)
+
+    def run(self, sleep, interval=REAPER_INTERVAL):
+        '''
+        sweep forever, meant to be run in its own greenlet
+        '''
+        while True:
+            sleep(interval)
+            self.sweep()
+
+    def census(self):
+        '''
+        how many games there are in each state, and how many games have
+        each number of players, as of when they were last touched
+        '''
+        states = {}
+        sizes = {}
+        for _, state, _, n_players in self._seen.values():
+            states[state] = states.get(state, 0) + 1
+            sizes[n_players] = sizes.get(n_players, 0) + 1
+        return states, sizes
+
+    def stats(self):
+        return {
+            'live_games': len(self._seen),
+            'evicted_idle': self.evicted_idle,
+            'evicted_lru': self.evicted_lru
+        }
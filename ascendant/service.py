@@ -0,0 +1,665 @@
+# -*- coding: utf-8 -*-
+
+"""
+Game Service
+============
+
+What every socket.io event does, for both server.py and async_server.py.
+
+The service has the game store, the ack barriers, the outbox, the payload cache, the lobby, the limits and the reaper, and a method for every event in EVENTS that takes the client's sid and the event's data and returns the ack. The servers only do the transport: each hands the service a `Transport` that emits to rooms, puts clients in rooms and schedules timers its own way, and calls the service from its socket.io handlers.
+
+Nothing in here blocks on anything but the game store, so the same code runs on eventlet and on asyncio.
+"""
+
+import logging
+import uuid
+
+from . import ascendant
+from .acks import AckBarriers
+from .compact import compact_payload
+from .ids import make_allocator
+from .limits import Limits
+from .lobby import LobbyIndex
+from .metrics import Counter, Gauge, Histogram
+from .outbox import Outbox
+from .payloads import PayloadCache, RawJSON, encode, players_payload, team_players_payload, propose_mission_payload
+from .reaper import GameReaper
+from .sync import make_sync_log
+from .settings import *
+
+logger = logging.getLogger('ascendant.service')
+
+HANDLER_SECONDS = Histogram('ascendant_handler_seconds', 'Time spent handling each socket.io event', ('event',))
+HANDLER_ERRORS = Counter('ascendant_handler_errors_total', 'Socket.io handlers that raised', ('event',))
+
+# every event the clients send, with the keyword arguments for its rate
+# limits (see Limits.check). each is handled by the method of the same name
+EVENTS = {
+    'create': {'game': False, 'new_game': True},
+    'join': {},
+    'start': {},
+    'ready': {},
+    'leave': {},
+    'propose_mission': {},
+    'proposal_vote': {},
+    'mission_vote': {},
+    'list_games': {'game': False},
+    'get_current_action': {'cost': GET_ACTION_COST}
+}
+
+
+class Transport(object):
+    '''
+    how the service gets things to the clients, which is everything a
+    server has to provide
+    '''
+
+    def schedule(self, delay, func):
+        '''
+        calls func() in delay seconds, returns something with a cancel()
+        method
+        '''
+        raise NotImplementedError
+
+    def emit(self, room, event, args, callback=None):
+        '''
+        sends event to a room, with each item of the args tuple as an
+        argument. it can hold up the green thread calling it, but never
+        a whole event loop
+        '''
+        raise NotImplementedError
+
+    def spawn(self, func, *args, **kwargs):
+        '''
+        calls func(*args, **kwargs) without waiting for it, for sending
+        to lots of rooms at once
+        '''
+        raise NotImplementedError
+
+    def enter_room(self, sid, room):
+        raise NotImplementedError
+
+
+class GameService(object):
+
+    def __init__(self, games, transport, registry=None, shared_rooms=False):
+        self.games = games
+        self.transport = transport
+
+        # room -> sids of the compact clients in it, so emits can skip
+        # compact rooms nobody is in, and sid -> those rooms. only this
+        # worker's clients are in here, so if the rooms are shared with
+        # other workers (through a message queue) every emit goes to both
+        self.shared_rooms = shared_rooms
+        self.compact_members = {}
+        self._compact_rooms = {}
+
+        # hands out game ids, shared between workers if the store is
+        self.game_ids = make_allocator(games)
+
+        # rate limits, and turning away games and connections once we're full
+        self.limits = Limits(self.game_ids)
+
+        # events we're waiting on acks for, one per (game_id, ack_type)
+        self.barriers = AckBarriers(transport.schedule)
+
+        # holds bursts of broadcasts to a room so only the latest goes out
+        self.outbox = Outbox(transport.schedule)
+
+        # encoded broadcast payloads, reused until the game changes
+        self.payloads = PayloadCache()
+
+        # the latest broadcasts of every game, for players who rejoin
+        self.sync_log = make_sync_log(games)
+
+        # the games still waiting for players, for list_games
+        self.lobby = LobbyIndex()
+
+        # throws out games that have been sitting around unplayed. the
+        # server runs it
+        self.reaper = GameReaper(games, self.evict_game)
+
+        # recovered games are live, and get the usual time to idle
+        # before they're evicted
+        for game in games:
+            self.game_ids.claim(game.game_id)
+            self.reaper.touch(game)
+            self.lobby.update(game)
+
+        # these are only counted up when /metrics is asked for them. the
+        # server passes in REGISTRY for its one service; anything else
+        # (like the tests) making services doesn't want them in there
+        Gauge('ascendant_games', 'Games by state', ('state',), registry=registry,
+              function=lambda: dict(((GAMESTATE_NAMES[state],), n) for state, n in self.reaper.census()[0].items()))
+        Gauge('ascendant_games_by_players', 'Games by how many players they have', ('players',), registry=registry,
+              function=lambda: dict(((n_players,), n) for n_players, n in self.reaper.census()[1].items()))
+        Gauge('ascendant_ack_barriers', 'Events still waiting on acks', registry=registry,
+              function=lambda: {(): len(self.barriers)})
+        Gauge('ascendant_broadcasts_held', 'Broadcasts the outbox is holding back', registry=registry,
+              function=lambda: {(): len(self.outbox)})
+        Gauge('ascendant_connections', 'Clients connected to this worker', registry=registry,
+              function=lambda: {(): len(self.limits.connections)})
+
+    # sending
+
+    def update(self, game_id, func):
+        '''
+        games.update, putting the deltas published by the try that got
+        saved in the sync log
+        '''
+        published = []
+
+        def attempt(game):
+            # the store can call this more than once, only the last
+            # try's deltas are the real ones
+            del published[:]
+            game.published = published
+            try:
+                return func(game)
+            finally:
+                game.published = None
+
+        game, result = self.games.update(game_id, attempt)
+        for delta in published:
+            self.sync_log.append(game_id, delta)
+        return game, result
+
+    def publish(self, game, event, payload):
+        '''
+        call this inside self.update for anything that's going to be
+        broadcast, so it's numbered with the game's sync version and kept
+        for players who rejoin once the update is saved. returns the delta
+        to broadcast once the update is done
+        '''
+        # encode it once, every retry and every rejoin sends the same json
+        if not isinstance(payload, RawJSON):
+            payload = encode(payload)
+        delta = game.record_delta(event, payload)
+        game.published.append(delta)
+        return delta
+
+    def publish_proposal(self, game):
+        return self.publish(game, 'propose_mission', self.payload(game, 'propose_mission', propose_mission_payload))
+
+    def payload(self, game, kind, build):
+        '''
+        payloads.get, except that inside self.update what gets built isn't
+        cached, since the try might not be the one that gets saved
+        '''
+        return self.payloads.get(game, kind, build, cache=game.published is None)
+
+    def broadcast(self, game, delta, on_complete=None):
+        '''
+        send a delta to the whole game room and keep re-sending it to
+        anyone who hasn't acked it. on_complete is called once everyone has
+
+        the sync version goes along as a second argument, which clients can
+        send back when they rejoin. it goes through the outbox, so it might
+        be held back a bit and replaced by a newer one
+        '''
+        version, event, payload = delta
+        compact = compact_payload(game, event, payload)
+
+        def send(players, ack):
+            if players is None:
+                self.emit_to(game.game_id, event, payload, compact, version, callback=ack)
+            else:
+                self.send_each(event, players, lambda player: payload, compact, ack, version)
+
+        self.outbox.post(game.game_id, event, lambda: self.barriers.start(game, event, send, on_complete))
+
+    def send_each(self, event, players, payload_for, compact, ack, *args):
+        '''
+        emit to each player's own room, all at once instead of one by one.
+        args are sent after the payload
+        '''
+        for player in players:
+            self.transport.spawn(self.emit_to, player.player_id, event, payload_for(player), compact,
+                                 *args, callback=ack)
+
+    def emit_to(self, room, event, payload, compact, *args, **kwargs):
+        '''
+        emit to a room and to the compact clients' version of it. compact
+        is what they get instead of payload, None if it's the same
+        '''
+        self.transport.emit(room, event, (payload,) + args, **kwargs)
+        if self.shared_rooms or self.compact_members.get(room):
+            self.transport.emit(room + COMPACT_ROOM, event, (payload if compact is None else compact,) + args,
+                                **kwargs)
+
+    def join_rooms(self, sid, data, *rooms):
+        '''
+        join rooms, or their compact versions if the client asked for that.
+        returns the encoding the client is getting
+        '''
+        encoding = ENCODING_COMPACT if data.get('encoding') == ENCODING_COMPACT else 'json'
+        for room in rooms:
+            if encoding == ENCODING_COMPACT:
+                self.transport.enter_room(sid, room + COMPACT_ROOM)
+                self.compact_members.setdefault(room, set()).add(sid)
+                self._compact_rooms.setdefault(sid, set()).add(room)
+            else:
+                self.transport.enter_room(sid, room)
+        return encoding
+
+    def disconnect(self, sid):
+        '''
+        the client is gone, and socket.io has taken it out of its rooms
+        '''
+        for room in self._compact_rooms.pop(sid, ()):
+            members = self.compact_members.get(room)
+            if members is not None:
+                members.discard(sid)
+                if not members:
+                    del self.compact_members[room]
+
+    # games coming and going
+
+    def end_game(self, game_id):
+        self.games.delete(game_id)
+        self.outbox.discard(game_id)
+        self.barriers.cancel_game(game_id)
+        self.payloads.discard(game_id)
+        self.sync_log.discard(game_id)
+        self.compact_members.pop(game_id, None)
+        self.lobby.remove(game_id)
+        self.limits.end_game(game_id)
+        self.reaper.forget(game_id)
+        self.game_ids.release(game_id)
+
+    def evict_game(self, game_id):
+        logger.info('evicting idle game %s', game_id)
+        self.end_game(game_id)
+
+    def announce_proposal(self, game_id, proposal):
+        '''
+        tell the room who's picking the next mission, or end the game if
+        it's over. the game has already moved on by the time this is
+        called, and proposal is the delta published when it did
+
+        a barrier can finish late, after the game has moved on again. if
+        anything was published since the proposal it's stale, and whatever
+        replaced it gets announced by its own barrier
+        '''
+        game = self.games.get(game_id)
+        if game is None:
+            return
+
+        state = game.get_current_state()
+        if state == GAMESTATE_OVER:
+            self.end_game(game_id)
+        elif state == GAMESTATE_PROPOSING and proposal is not None and proposal[0] == game.sync_version:
+            self.broadcast(game, proposal)
+
+    # the events
+
+    def propose_mission(self, sid, data):
+        # get data needed for player
+        game_id = data['game_id']
+        player_id = data['player_id']
+        player_ids = data['player_ids']
+
+        def propose(game):
+            if game.get_current_state() != GAMESTATE_PROPOSING:
+                return {'success': False, 'error_message': 'Not proposing right now'}, None
+
+            if player_id != game.get_leader().player_id:
+                return {'success': False, 'error_message': 'u r no leader'}, None
+
+            if len(player_ids) != game.current_round.num_on_mission:
+                return {'success': False, 'error_message': 'bad number of players'}, None
+
+            game.set_mission_members(player_ids)
+            return {'success': True}, self.publish(game, 'do_proposal_vote', {'players': player_ids})
+
+        game, (result, delta) = self.update(game_id, propose)
+        self.reaper.touch(game)
+
+        if delta is not None:
+            self.broadcast(game, delta)
+
+        return result
+
+    def mission_vote(self, sid, data):
+        # get data needed for player
+        game_id = data['game_id']
+        player_id = data['player_id']
+        vote = data['vote']
+
+        # counting the votes and moving on to the next round happen in the
+        # same update, so a late vote can't count the mission twice
+        def cast_vote(game):
+            if game.get_current_state() != GAMESTATE_MISSION_VOTE:
+                return None
+
+            game.mission_vote(player_id, vote)
+
+            if not game.all_mission_voted():
+                return None
+
+            result = self.publish(game, 'mission_vote_result', {
+                'pass': game.get_mission_votes(),
+                'mission_number': game.round_num,
+                'tally': game.current_round.mission_tally()
+            })
+
+            if game.is_over():
+                game.finish()
+                return result, None
+
+            game.start_round()
+            game.start_proposal()
+            return result, self.publish_proposal(game)
+
+        game, deltas = self.update(game_id, cast_vote)
+        self.reaper.touch(game)
+
+        if deltas is not None:
+            result, proposal = deltas
+            logger.debug('game %s: everybody voted on the mission, passed: %s', game_id, game.round_passes[-1])
+
+            # announce the next leader once everyone has seen the result
+            self.broadcast(game, result, on_complete=lambda: self.announce_proposal(game_id, proposal))
+
+        return {'success': True}
+
+    def proposal_vote(self, sid, data):
+        # get data needed for player
+        game_id = data['game_id']
+        player_id = data['player_id']
+        vote = data['vote']
+
+        # same as mission votes, the proposal is settled in the same update
+        # as the vote that finished it
+        def cast_vote(game):
+            if game.get_current_state() != GAMESTATE_PROPOSAL_VOTE:
+                return None
+
+            game.vote(player_id, vote)
+
+            if not game.all_voted():
+                return None
+
+            passed, votes = game.get_votes()
+            # a failed proposal starts the next one, which clears the votes
+            tally = game.current_round.tally()
+
+            if passed:
+                game.start_mission_voting()
+            else:
+                # redo the proposal with the next leader, which counts
+                # this one as failed
+                game.start_proposal()
+                if game.is_over():
+                    game.finish()
+
+            result = self.publish(game, 'proposal_vote_result', {
+                'pass': passed,
+                'votes': votes,
+                'tally': tally,
+                'players': game.current_round.players_on_mission,
+                'failed_proposals': game.current_round.number_failed_proposals
+            })
+            proposal = self.publish_proposal(game) if game.get_current_state() == GAMESTATE_PROPOSING else None
+            return passed, result, proposal
+
+        game, deltas = self.update(game_id, cast_vote)
+        self.reaper.touch(game)
+
+        logger.debug('game %s: player %s voted %s', game_id, player_id, vote)
+        if deltas is not None:
+            passed, result, proposal = deltas
+            logger.debug('game %s: everybody voted on the proposal, passed: %s', game_id, passed)
+
+            # a failed proposal goes to the next leader
+            self.broadcast(game, result,
+                           on_complete=None if passed else lambda: self.announce_proposal(game_id, proposal))
+
+        return {'success': True}
+
+    def create(self, sid, data):
+        # grab the info need to make a player
+        creator_id = str(uuid.uuid4())
+        name = data['name']
+
+        # make a player and a game
+        creator = ascendant.Player(creator_id, name)
+        rules = RULES.get(data.get('rules'), DEFAULT_RULES)
+        game = ascendant.AscendantGame(self.game_ids.allocate(), creator, rules)
+
+        # allocated ids are never in use, but don't clobber a game if
+        # something left one behind
+        while not self.games.add(game):
+            game.game_id = self.game_ids.allocate()
+        game_id = game.game_id
+        self.reaper.touch(game)
+        self.lobby.update(game)
+
+        logger.debug('game %s created', game_id)
+        # add the user to the game room
+        encoding = self.join_rooms(sid, data, game_id, creator.player_id)
+
+        # emit the creation back to the client
+        return {'game_id': game_id, 'player': creator.to_dict(), 'creator_id': creator.player_id, 'encoding': encoding}
+
+    def join(self, sid, data):
+        # get data needed for player
+        game_id = str(data['game_id'])
+        player_id = str(uuid.uuid4())
+        name = data['name']
+        old_id = data['old_id']
+
+        game = self.games.get(game_id)
+        # limits checked it was there, but it can be ended since
+        if game is None:
+            return {'success': False, 'error_message': 'No such game'}
+        self.reaper.touch(game)
+
+        encoding = self.join_rooms(sid, data, game_id)
+
+        player = game.get_player(old_id)
+
+        if player:
+
+            logger.debug('game %s: player %s is rejoining', game_id, old_id)
+
+            self.join_rooms(sid, data, old_id)
+
+            rejoin = {
+                'success': True,
+                'encoding': encoding,
+                'game_id': game_id,
+                'creator_id': game.creator.player_id,
+                'rejoin': game.get_current_state() != GAMESTATE_JOINING,
+                'ready': player.ready,
+                'player': player.to_dict(),
+                'version': game.sync_version
+            }
+
+            # a player who was only gone for a bit just gets what they missed
+            deltas = self.sync_log.since(game_id, data.get('last_version'), game.sync_version)
+            if deltas is not None:
+                # the ones from redis have been through json
+                rejoin['deltas'] = [[v, event, RawJSON(payload)] for v, event, payload in deltas]
+            else:
+                rejoin.update({
+                    'players': self.payloads.get(game, 'update_players', players_payload),
+                    'round_passes': game.round_passes,
+                    'failed_proposals': game.get_failed_proposals()
+                })
+            return rejoin
+
+        if game.get_current_state() != GAMESTATE_JOINING:
+            return {'success': False, 'error_message': 'The game has already started, and you\'re not in it!'}
+
+        def join(game):
+            # create the player and join the game
+            player = ascendant.Player(player_id, name)
+
+            # Check if it's the creator rejoining after leaving
+            if old_id == game.creator.player_id:
+                player = game.creator
+
+            # the game might have started since we looked
+            if game.get_current_state() != GAMESTATE_JOINING or not game.add_player(player):
+                return None, None
+            return player, self.publish(game, 'update_players', self.payload(game, 'update_players', players_payload))
+
+        game, (player, delta) = self.update(game_id, join)
+        self.reaper.touch(game)
+        self.lobby.update(game)
+        success = player is not None
+
+        logger.debug('game %s: joining, success: %s', game_id, success)
+
+        self.join_rooms(sid, data, player_id)
+
+        if not success:
+            return {'success': False, 'error_message': 'Unable to join game'}
+
+        self.broadcast(game, delta)
+        return {
+            'success': True,
+            'game_id': game_id,
+            'creator_id': game.creator.player_id,
+            'player': player.to_dict(),
+            'players': self.payloads.get(game, 'update_players', players_payload),
+            'version': delta[0],
+            'encoding': encoding
+        }
+
+    def start(self, sid, data):
+        # get data needed for player
+        game_id = data['game_id']
+
+        def start(game):
+            if game.get_current_state() != GAMESTATE_JOINING or not game.is_ready_to_start():
+                return False
+            game.start_game()
+            return True
+
+        game, started = self.update(game_id, start)
+        self.reaper.touch(game)
+        self.lobby.update(game)
+
+        if not started:
+            return {'success': False, 'error_message': 'You need at least five players to start'}
+
+        # there are only two views of the players, one for each team,
+        # so encode those once and send everybody theirs all at once
+        views = {
+            TEAM_GOOD: self.payloads.get(game, 'update_players', players_payload),
+            TEAM_BAD: self.payloads.get(game, 'team_players', team_players_payload)
+        }
+
+        def assign_roles(player):
+            return {'player': player.to_dict(show_team=True), 'players': views[player.team]}
+
+        def send(players, ack):
+            self.send_each('assign_roles', game.players if players is None else players, assign_roles, None, ack)
+
+        # through the outbox like any broadcast, so an update_players it's
+        # still holding gets there before the roles do
+        self.outbox.post(game_id, 'assign_roles', lambda: self.barriers.start(game, 'assign_roles', send))
+
+        return {'success': True}
+
+    def ready(self, sid, data):
+        # get data needed for player
+        game_id = data['game_id']
+        player_id = data['player_id']
+
+        def ready(game):
+            game.set_ready(player_id)
+
+            # only the first time everyone is ready starts the game
+            if game.get_current_state() != GAMESTATE_READYING or not game.all_ready():
+                return None
+            game.start_round()
+            game.start_proposal()
+            return self.publish_proposal(game)
+
+        game, proposal = self.update(game_id, ready)
+        self.reaper.touch(game)
+
+        logger.debug('game %s: player %s is ready', game_id, player_id)
+
+        if proposal:
+            logger.debug('game %s: everybody is ready', game_id)
+            self.broadcast(game, proposal)
+
+        return {'success': True}
+
+    def leave(self, sid, data):
+        # get data needed for player
+        game_id = data['game_id']
+        player_id = data['player_id']
+
+        def leave(game):
+            if not game.remove_player(player_id):
+                return None
+            return self.publish(game, 'update_players', self.payload(game, 'update_players', players_payload))
+
+        game, delta = self.update(game_id, leave)
+        success = delta is not None
+        self.reaper.touch(game)
+        self.lobby.update(game)
+
+        logger.debug('game %s: player %s leaving, success: %s', game_id, player_id, success)
+
+        if len(game.players) == 0:
+            logger.debug('game %s: no players left, deleting it', game_id)
+            self.end_game(game_id)
+        elif success:
+            self.broadcast(game, delta)
+
+        return {'success': success}
+
+    def list_games(self, sid, data=None):
+        # everything's optional, see LobbyIndex.page
+        data = data or {}
+        try:
+            return self.lobby.page(data.get('page', 0), data.get('per_page', LOBBY_PAGE_SIZE),
+                                   data.get('min_players', 1), data.get('max_players', MAX_NUM_OF_PLAYERS))
+        except (TypeError, ValueError):
+            return {'success': False, 'error_message': 'Bad page'}
+
+    def get_current_action(self, sid, data):
+        game_id = data['game_id']
+        player_id = data['player_id']
+
+        game = self.games.get(game_id)
+        if game is None:
+            return {'success': False, 'error_message': 'No such game'}
+        self.reaper.touch(game)
+
+        state = game.get_current_state()
+
+        def send(event, payload):
+            # acked to whatever the room is waiting on for this event
+            self.emit_to(player_id, event, payload, compact_payload(game, event, payload),
+                         callback=self.barriers.callback(game_id, event))
+
+        if state == GAMESTATE_PROPOSING:
+            # this will trigger a leader setting, even if they're not the leader
+            send('propose_mission', self.payloads.get(game, 'propose_mission', propose_mission_payload))
+        elif state == GAMESTATE_PROPOSAL_VOTE:
+
+            # votes are a dict, so should we bother to check if
+            # they already voted...?
+            # yes, so they can't change their vote
+            # --Kyle Bashour, talking to himself
+
+            if player_id not in game.current_round.votes.keys():
+                send('do_proposal_vote', {'players': game.current_round.players_on_mission})
+        elif state == GAMESTATE_MISSION_VOTE:
+
+            if player_id not in game.current_round.mission_votes.keys():
+                passed, votes = game.get_votes()
+                send('proposal_vote_result', {
+                    'pass': passed,
+                    'votes': votes,
+                    'tally': game.current_round.tally(),
+                    'players': game.current_round.players_on_mission,
+                    'failed_proposals': game.current_round.number_failed_proposals
+                })
@@ -7,6 +7,8 @@ Settings
 General/global settings file
 """
 
+from collections import namedtuple
+
 TEAM_NONE = -1
 TEAM_GOOD = 0
 TEAM_BAD = 1
@@ -14,12 +16,174 @@ TEAM_BAD = 1
 MAX_NUM_OF_PLAYERS = 10
 MIN_NUM_OF_PLAYERS = 5
 
+# how much of the table start_game puts on the good team, rounded down
+GOOD_FRACTION = 2.0 / 3.0
+
 GAMESTATE_JOINING = 0
 GAMESTATE_STARTED = 1
 GAMESTATE_READYING = 2
 GAMESTATE_PROPOSING = 3
 GAMESTATE_PROPOSAL_VOTE = 4
 GAMESTATE_MISSION_VOTE = 5
+GAMESTATE_OVER = 6
+
+# for logs and metrics
+GAMESTATE_NAMES = {
+    GAMESTATE_JOINING: 'joining',
+    GAMESTATE_STARTED: 'started',
+    GAMESTATE_READYING: 'readying',
+    GAMESTATE_PROPOSING: 'proposing',
+    GAMESTATE_PROPOSAL_VOTE: 'proposal_vote',
+    GAMESTATE_MISSION_VOTE: 'mission_vote',
+    GAMESTATE_OVER: 'over'
+}
 
 NUM_WINS = 3
 MAX_NUM_ROUND_FAILS = 5
+
+# A set of rules for the missions. to_send and to_fail are tuples indexed
+# by the number of players (None for player counts that can't play), each
+# holding one entry per round: how many players go on the mission, and how
+# many fail votes it takes to fail it. ties_pass is whether a proposal
+# vote that comes out even passes, otherwise it takes a majority
+RuleSet = namedtuple('RuleSet', ['name', 'to_send', 'to_fail', 'num_wins', 'max_num_round_fails', 'ties_pass'])
+
+def make_rules(name, to_send, to_fail, num_wins=NUM_WINS, max_num_round_fails=MAX_NUM_ROUND_FAILS, ties_pass=False):
+    '''
+    build a RuleSet from dicts of {num_players: [per round values]},
+    and register it in RULES so games can be created with it by name
+    '''
+    def by_player_count(table):
+        return tuple(tuple(table[n]) if n in table else None for n in range(MAX_NUM_OF_PLAYERS + 1))
+
+    rules = RuleSet(name, by_player_count(to_send), by_player_count(to_fail), num_wins, max_num_round_fails,
+                    ties_pass)
+    RULES[name] = rules
+    return rules
+
+RULES = {}
+
+STANDARD_RULES = make_rules('standard',
+    to_send={
+        5: [2, 3, 2, 3, 3],
+        6: [2, 3, 3, 3, 4],
+        7: [2, 3, 3, 4, 4],
+        8: [3, 4, 4, 5, 5],
+        9: [3, 4, 4, 5, 5],
+        10: [3, 4, 4, 5, 5]
+    },
+    to_fail={
+        5: [1, 1, 1, 1, 1],
+        6: [1, 1, 1, 1, 1],
+        7: [1, 1, 1, 2, 1],
+        8: [1, 1, 1, 2, 1],
+        9: [1, 1, 1, 2, 1],
+        10: [1, 1, 1, 2, 1],
+    }
+)
+
+# the rules as written in docs/rules.md, where just one fail vote
+# fails any mission and a tied proposal vote passes
+HOUSE_RULES = make_rules('house',
+    to_send=dict((n, STANDARD_RULES.to_send[n]) for n in range(MIN_NUM_OF_PLAYERS, MAX_NUM_OF_PLAYERS + 1)),
+    to_fail=dict((n, [1, 1, 1, 1, 1]) for n in range(MIN_NUM_OF_PLAYERS, MAX_NUM_OF_PLAYERS + 1)),
+    ties_pass=True
+)
+
+DEFAULT_RULES = STANDARD_RULES
+
+# ack barriers re-send an event to the players who haven't acked it
+# after ACK_TIMEOUT seconds, backing off by ACK_BACKOFF each retry
+ACK_TIMEOUT = 1.0
+ACK_BACKOFF = 2.0
+ACK_MAX_TIMEOUT = 8.0
+ACK_MAX_RETRIES = 6
+
+# how many emits to separate player rooms can be in flight at once
+EMIT_POOL_SIZE = 200
+
+# broadcasts of these events to a room are held until none has come
+# in for COALESCE_WINDOW seconds, but never longer than
+# COALESCE_MAX_DELAY, and only the latest one is sent
+COALESCE_WINDOW = 0.1
+COALESCE_MAX_DELAY = 0.5
+COALESCED_EVENTS = frozenset(['update_players'])
+
+# games nobody has touched for this many seconds get evicted. lobbies
+# get abandoned a lot more than games do, so they go sooner
+GAME_TTL = 60 * 60
+GAME_TTLS = {
+    GAMESTATE_JOINING: 15 * 60,
+    GAMESTATE_OVER: 60
+}
+# most games to keep around, the least recently used go first
+MAX_LIVE_GAMES = 10000
+# seconds between looking for idle games
+REAPER_INTERVAL = 30
+
+# every event a client sends takes a token from a bucket for its
+# session and one for its game (see limits.py). they refill this many
+# tokens a second, up to the burst
+SESSION_EVENT_RATE = 5
+SESSION_EVENT_BURST = 20
+GAME_EVENT_RATE = 30
+GAME_EVENT_BURST = 100
+# get_current_action sends something back every time, so it costs more
+GET_ACTION_COST = 4
+# new games are turned away past this many (so the reaper's lru
+# eviction is only a backstop), and new connections to a worker past
+# MAX_CONNECTIONS
+MAX_GAMES = MAX_LIVE_GAMES
+MAX_CONNECTIONS = 20000
+
+# clients that ask for the compact encoding (see compact.py) are put in
+# the game's and their own room with this on the end, instead
+ENCODING_COMPACT = 'compact'
+COMPACT_ROOM = '/compact'
+
+# the list of lobbies is rebuilt at most this often (in seconds), and
+# handed out this many at a time unless a client asks for more
+LOBBY_SNAPSHOT_TTL = 1.0
+LOBBY_PAGE_SIZE = 20
+LOBBY_MAX_PAGE_SIZE = 100
+
+# the static assets get built into static/ASSET_DIST (see assets.py),
+# with this much of a hash of their contents in their names, and served
+# from under ASSET_URL_PREFIX with caching for ASSET_MAX_AGE seconds
+ASSET_DIST = 'dist'
+ASSET_HASH_LENGTH = 12
+ASSET_URL_PREFIX = '/assets/'
+ASSET_MAX_AGE = 365 * 24 * 60 * 60
+
+# how many of the latest broadcasts the sync log keeps for every game, for
+# players who rejoin to catch up on. anyone who missed more gets the
+# whole game
+SYNC_MAX_DELTAS = 20
+
+# rooms are spread over this many redis channels in the socket.io
+# message queue, every worker only listens to the ones it has rooms on.
+# it has to be the same for every worker
+MQ_SHARDS = 256
+# acks for a room broadcast from another worker are taken until this
+# many newer broadcasts have been sent to the room
+MQ_ROOM_CALLBACKS = 100
+
+# how many times the game store retries a read-modify-write when
+# another worker saved the same game first
+STORE_MAX_RETRIES = 10
+
+# the event log writes and fsyncs everything buffered this often (in
+# seconds), so a crash loses at most this much
+LOG_FLUSH_INTERVAL = 0.05
+# and starts over from a fresh snapshot this often
+LOG_SNAPSHOT_INTERVAL = 5 * 60
+
+# every event the players have to ack
+ACK_TYPES = (
+    'do_proposal_vote',
+    'mission_vote_result',
+    'proposal_vote_result',
+    'update_players',
+    'assign_roles',
+    'propose_mission'
+)
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+"""
+Sharded Message Queue
+=====================
+
+A socket.io client manager that splits the redis message queue into shards.
+
+With the stock RedisManager every worker publishes every emit to one channel, and every worker gets and unpickles all of it, whether or not it has anyone in the room. Here a room's emits go to `channel:shard`, where the shard is the crc32 of the room name mod MQ_SHARDS. A worker only subscribes to the shards it has rooms on, subscribing when a room first gets someone in it and unsubscribing once the last of its rooms on that shard is empty. So a worker only gets traffic for its own games, plus whatever hashes to the same shards.
+
+Emits to the whole namespace still go to the plain channel, which every worker listens to. Ack callbacks go back on a channel of their own for the worker that's waiting on them, instead of to everyone. A client's own sid room only ever exists on the worker it's connected to, so emits to one are delivered right there without going through redis.
+
+This also fixes acks across workers, which never made it back with the stock manager: the ack went to whichever worker delivered the event, and a room's callback was dropped after the first client acked. Here they go back to the worker that sent the event, and a room's callback takes every client's ack until MQ_ROOM_CALLBACKS newer ones replace it.
+"""
+
+import pickle
+import zlib
+from functools import partial
+
+from socketio import RedisManager
+from socketio.base_manager import BaseManager
+
+from .settings import *
+
+
+class ShardedRedisManager(RedisManager):
+
+    name = 'sharded-redis'
+
+    def __init__(self, url='redis://localhost:6379/0', channel='socketio', write_only=False, shards=MQ_SHARDS):
+        super(ShardedRedisManager, self).__init__(url, channel=channel, write_only=write_only)
+        self.shards = shards
+        self.host_channel = '{}:host:{}'.format(channel, self.host_id)
+        # shard channel -> (namespace, room) for every room we have here
+        self._hosted = {}
+
+    def shard_channel(self, room):
+        shard = (zlib.crc32(room.encode('utf-8')) & 0xffffffff) % self.shards
+        return '{}:{}'.format(self.channel, shard)
+
+    def _channel_for(self, data):
+        if data['method'] == 'callback':
+            return '{}:host:{}'.format(self.channel, data['host_id'])
+        if data.get('room') is not None:
+            return self.shard_channel(data['room'])
+        return self.channel
+
+    def _publish(self, data):
+        if data['method'] == 'emit' and data.get('callback') is not None:
+            data['host_id'] = self.host_id
+        return self.redis.publish(self._channel_for(data), pickle.dumps(data))
+
+    def _listen(self):
+        self.pubsub.subscribe(self.channel, self.host_channel, *self._hosted)
+        for message in self.pubsub.listen():
+            if message['type'] == 'message' and 'data' in message:
+                yield message['data']
+
+    def _is_local_sid(self, namespace, room):
+        return room in self.rooms.get(namespace, {}).get(None, {})
+
+    def emit(self, event, data, namespace=None, room=None, skip_sid=None, callback=None):
+        namespace = namespace or '/'
+        if room is not None and self._is_local_sid(namespace, room):
+            return BaseManager.emit(self, event, data, namespace, room=room, skip_sid=skip_sid, callback=callback)
+        return super(ShardedRedisManager, self).emit(event, data, namespace=namespace, room=room,
+                                                     skip_sid=skip_sid, callback=callback)
+
+    def _handle_emit(self, message):
+        remote_callback = message.get('callback')
+        if remote_callback is None or 'host_id' not in message:
+            return super(ShardedRedisManager, self)._handle_emit(message)
+
+        callback = partial(self._return_callback, message['host_id'], *remote_callback)
+        BaseManager.emit(self, message['event'], message['data'], namespace=message.get('namespace'),
+                         room=message.get('room'), skip_sid=message.get('skip_sid'), callback=callback)
+
+    def _generate_ack_id(self, sid, namespace, callback):
+        id = super(ShardedRedisManager, self)._generate_ack_id(sid, namespace, callback)
+        namespace = namespace or '/'
+        if not self._is_local_sid(namespace, sid):
+            # a room's callbacks are kept for every ack, so drop the old ones
+            self.callbacks[sid][namespace].pop(id - MQ_ROOM_CALLBACKS, None)
+        return id
+
+    def trigger_callback(self, sid, namespace, id, data):
+        if self._is_local_sid(namespace, sid):
+            return super(ShardedRedisManager, self).trigger_callback(sid, namespace, id, data)
+
+        callback = self.callbacks.get(sid, {}).get(namespace, {}).get(id)
+        if callback is not None:
+            callback(*data)
+
+    def enter_room(self, sid, namespace, room):
+        super(ShardedRedisManager, self).enter_room(sid, namespace, room)
+        # sid rooms are delivered locally, see emit
+        if room is None or room == sid or self.write_only:
+            return
+
+        channel = self.shard_channel(room)
+        rooms = self._hosted.setdefault(channel, set())
+        if not rooms and self.pubsub.connection is not None:
+            # before the listener starts, it subscribes to everything
+            # in _hosted itself
+            self.pubsub.subscribe(channel)
+        rooms.add((namespace, room))
+
+    def _clean_rooms(self):
+        # leave_room only marks a client as gone, rooms are really
+        # emptied out here
+        removals = self.pending_removals
+        super(ShardedRedisManager, self)._clean_rooms()
+
+        for namespace, room, sid in removals:
+            if room is None or room in self.rooms.get(namespace, {}):
+                continue
+            channel = self.shard_channel(room)
+            rooms = self._hosted.get(channel)
+            if rooms is None or (namespace, room) not in rooms:
+                continue
+            rooms.discard((namespace, room))
+            if not rooms:
+                del self._hosted[channel]
+                if self.pubsub.connection is not None:
+                    self.pubsub.unsubscribe(channel)
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+
+"""
+Game Store
+==========
+
+Where the server keeps its games.
+
+The in-process store is just a dict, which only works with a single worker. The Redis store keeps every game serialized in Redis so any number of workers can share them. Changes to a game go through `update`, which does an atomic read-modify-write: the game is saved with a version number, and if someone else saved it in the meantime the change is retried on a fresh copy.
+
+Either way, updates to the same game happen one at a time. The in-process store holds a lock per game while it runs an update, and the Redis store retries anything that raced. Different games never wait on each other.
+"""
+
+import json
+import threading
+
+try:
+    from redis.exceptions import WatchError
+except ImportError:
+    # only the redis store needs it, and that can't be used without redis
+    class WatchError(Exception):
+        pass
+
+from .ascendant import AscendantGame
+from .settings import *
+from .errors import *
+
+
+class GameStore(object):
+    '''
+    interface for all the game stores
+    '''
+
+    def get(self, game_id):
+        '''
+        returns the game, or None if there isn't one with that id
+        '''
+        raise NotImplementedError
+
+    def add(self, game):
+        '''
+        saves a new game, returns false if the id is already taken
+        '''
+        raise NotImplementedError
+
+    def save(self, game):
+        '''
+        saves a game that came from get, raises StaleGame if it has
+        been saved by someone else since
+        '''
+        raise NotImplementedError
+
+    def delete(self, game_id):
+        raise NotImplementedError
+
+    def ids(self):
+        raise NotImplementedError
+
+    def update(self, game_id, func):
+        '''
+        calls func(game) and saves the game afterwards, retrying with a
+        fresh copy if it was saved by someone else in the meantime.
+        func can be called more than once, so it should only change the
+        game and not do anything else (like emitting)
+
+        returns (game, whatever func returned)
+        '''
+        for _ in range(STORE_MAX_RETRIES):
+            game = self.get(game_id)
+            if game is None:
+                raise GameNotFound('No game with id {}'.format(game_id))
+
+            result = func(game)
+            try:
+                self.save(game)
+            except StaleGame:
+                continue
+            return game, result
+
+        raise StaleGame('Gave up saving game {} after {} tries'.format(game_id, STORE_MAX_RETRIES))
+
+    def __contains__(self, game_id):
+        return self.get(game_id) is not None
+
+    def __iter__(self):
+        for game_id in self.ids():
+            game = self.get(game_id)
+            if game is not None:
+                yield game
+
+    def __len__(self):
+        return len(list(self.ids()))
+
+
+class MemoryGameStore(GameStore):
+    '''
+    keeps the games in this process, so there can only be one worker
+
+    lock is what every game's lock is made with. threading.RLock turns
+    into a green lock once eventlet has monkey patched things
+    '''
+
+    def __init__(self, lock=threading.RLock):
+        self._games = {}
+        self._locks = {}
+        self._make_lock = lock
+
+    def get(self, game_id):
+        return self._games.get(game_id)
+
+    def add(self, game):
+        if game.game_id in self._games:
+            return False
+        self._locks[game.game_id] = self._make_lock()
+        self._games[game.game_id] = game
+        return True
+
+    def update(self, game_id, func):
+        lock = self._locks.get(game_id)
+        if lock is None:
+            raise GameNotFound('No game with id {}'.format(game_id))
+
+        with lock:
+            return GameStore.update(self, game_id, func)
+
+    def save(self, game):
+        # get hands out the live game, so there's nothing to write back
+        game.version += 1
+
+    def delete(self, game_id):
+        self._games.pop(game_id, None)
+        self._locks.pop(game_id, None)
+
+    def ids(self):
+        return list(self._games.keys())
+
+    def __contains__(self, game_id):
+        return game_id in self._games
+
+    def __iter__(self):
+        return iter(list(self._games.values()))
+
+    def __len__(self):
+        return len(self._games)
+
+
+class RedisGameStore(GameStore):
+    '''
+    keeps every game as a redis hash with a version and a json state,
+    so it can be shared by all the workers
+    '''
+
+    def __init__(self, redis, prefix='ascendant:game:'):
+        self.redis = redis
+        self.prefix = prefix
+
+    def _key(self, game_id):
+        return self.prefix + game_id
+
+    def get(self, game_id):
+        state = self.redis.hget(self._key(game_id), 'state')
+        if state is None:
+            return None
+        if isinstance(state, bytes):
+            state = state.decode('utf-8')
+        return AscendantGame.from_state(json.loads(state))
+
+    def add(self, game):
+        key = self._key(game.game_id)
+
+        with self.redis.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                if pipe.exists(key):
+                    return False
+                game.version = 1
+                pipe.multi()
+                pipe.hset(key, mapping=self._fields(game))
+                pipe.execute()
+            except WatchError:
+                return False
+        return True
+
+    def save(self, game):
+        key = self._key(game.game_id)
+
+        with self.redis.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                version = pipe.hget(key, 'version')
+                if version is None or int(version) != game.version:
+                    raise StaleGame('Game {} is not at version {}'.format(game.game_id, game.version))
+
+                game.version += 1
+                pipe.multi()
+                pipe.hset(key, mapping=self._fields(game))
+                pipe.execute()
+            except WatchError:
+                game.version -= 1
+                raise StaleGame('Game {} was saved by someone else'.format(game.game_id))
+
+    def delete(self, game_id):
+        self.redis.delete(self._key(game_id))
+
+    def ids(self):
+        for key in self.redis.scan_iter(match=self.prefix + '*'):
+            if isinstance(key, bytes):
+                key = key.decode('utf-8')
+            yield key[len(self.prefix):]
+
+    def _fields(self, game):
+        return {'version': game.version, 'state': json.dumps(game.to_state())}
+
+
+def make_store(url):
+    '''
+    memory:// for the in-process store, redis:// (or rediss://) for a
+    shared one. fakeredis:// uses an in-process fake redis, which is
+    handy for exercising the redis store locally
+    '''
+    if url.startswith('memory://'):
+        return MemoryGameStore()
+    elif url.startswith('fakeredis://'):
+        import fakeredis
+        return RedisGameStore(fakeredis.FakeStrictRedis())
+    elif url.startswith('redis://') or url.startswith('rediss://'):
+        import redis
+        return RedisGameStore(redis.StrictRedis.from_url(url))
+    raise AscendantError('Unknown game store: {}'.format(url))
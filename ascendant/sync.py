@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+"""
+Sync Log
+========
+
+The latest broadcasts of every game, for players who rejoin to catch up on.
+
+Every broadcast to a game room is a delta, `[sync_version, event, encoded payload]`, and the game itself only keeps its sync_version. The deltas are kept here instead of in the game, so they don't make every save of the game bigger: the last SYNC_MAX_DELTAS of them per game, in a deque for a single process or in a capped Redis list shared by every worker. They're only ever a shortcut, anything that isn't here just means a rejoining player gets the whole game instead.
+"""
+
+import json
+from collections import deque
+
+from .settings import *
+
+
+def missed(deltas, version, sync_version):
+    '''
+    the deltas after version up to sync_version, in order, or None if any
+    of them are missing (or version doesn't make sense). deltas can be in
+    any order, they're saved by whichever update gets there first
+    '''
+    if not isinstance(version, int) or isinstance(version, bool) or not 0 <= version <= sync_version:
+        return None
+
+    by_version = dict((delta[0], delta) for delta in deltas)
+    try:
+        return [by_version[v] for v in range(version + 1, sync_version + 1)]
+    except KeyError:
+        return None
+
+
+class SyncLog(object):
+    '''
+    the latest deltas of every game in this process
+    '''
+
+    def __init__(self, size=SYNC_MAX_DELTAS):
+        self.size = size
+        # game_id -> deque of deltas
+        self._deltas = {}
+
+    def append(self, game_id, delta):
+        deltas = self._deltas.get(game_id)
+        if deltas is None:
+            deltas = self._deltas[game_id] = deque(maxlen=self.size)
+        deltas.append(delta)
+
+    def since(self, game_id, version, sync_version):
+        return missed(self._deltas.get(game_id, ()), version, sync_version)
+
+    def discard(self, game_id):
+        self._deltas.pop(game_id, None)
+
+
+class RedisSyncLog(object):
+    '''
+    the latest deltas of every game, in a redis list per game
+    '''
+
+    def __init__(self, redis, size=SYNC_MAX_DELTAS, prefix='ascendant:sync:'):
+        self.redis = redis
+        self.size = size
+        self.prefix = prefix
+
+    def append(self, game_id, delta):
+        key = self.prefix + game_id
+        with self.redis.pipeline() as pipe:
+            pipe.rpush(key, json.dumps(delta, separators=(',', ':')))
+            pipe.ltrim(key, -self.size, -1)
+            pipe.execute()
+
+    def since(self, game_id, version, sync_version):
+        # the payloads come back as strings of json, same as they went in
+        deltas = [json.loads(delta) for delta in self.redis.lrange(self.prefix + game_id, 0, -1)]
+        return missed(deltas, version, sync_version)
+
+    def discard(self, game_id):
+        self.redis.delete(self.prefix + game_id)
+
+
+def make_sync_log(store):
+    '''
+    a sync log to go with the game store, shared if the store is
+    '''
+    redis = getattr(store, 'redis', None)
+    if redis is not None:
+        return RedisSyncLog(redis)
+    return SyncLog()
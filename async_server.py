@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+
+"""
+Async Server
+============
+
+The same game server as server.py, on asyncio instead of eventlet: python-socketio's AsyncServer on aiohttp, speaking exactly the same socket.io protocol (see docs/socketio-spec.md). Everything the events do is in ascendant/service.py, shared with server.py, so all this does is the transport: emits are tasks on the event loop, and the ack barriers and the outbox run on its timers.
+
+    python async_server.py
+    python benchmarks/loadtest.py --ramp 1 10 50 100
+
+The redis game store makes blocking calls, so it holds up the whole event loop. Compare the two servers with GAME_STORE_URL=memory://.
+
+Needs the packages in requirements-async.txt.
+"""
+
+import asyncio
+import logging
+import os
+from functools import partial, wraps
+from timeit import default_timer
+
+import jinja2
+import socketio
+from aiohttp import web
+
+from ascendant.assets import AssetManifest, response_headers
+from ascendant.eventlog import EventLog
+from ascendant.metrics import CONTENT_TYPE, REGISTRY, render as render_metrics
+from ascendant.payloads import PayloadJSON
+from ascendant.service import GameService, Transport, EVENTS, HANDLER_SECONDS, HANDLER_ERRORS
+from ascendant.settings import *
+from ascendant.store import make_store
+
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'WARNING'))
+logger = logging.getLogger('ascendant.async_server')
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+GAME_STORE_URL = os.environ.get('GAME_STORE_URL', 'memory://')
+GAME_LOG_DIR = os.environ.get('GAME_LOG_DIR')
+
+# same as server.py, no message queue unless there's a redis to use
+REDIS_URL = os.environ.get('REDISCLOUD_URL')
+REDIS_CHAN = 'game'
+
+
+async def emit_local(manager, event, data, namespace, room=None, skip_sid=None, callback=None):
+    '''
+    what AsyncManager.emit does, sending to this worker's clients in a
+    room. python-socketio 4.x hands asyncio.wait bare coroutines there,
+    which python 3.11 refuses, so this gathers them instead
+    '''
+    if namespace not in manager.rooms or room not in manager.rooms[namespace]:
+        return
+    if not isinstance(skip_sid, list):
+        skip_sid = [skip_sid]
+
+    sends = []
+    for sid in manager.get_participants(namespace, room):
+        if sid not in skip_sid:
+            ack_id = manager._generate_ack_id(sid, namespace, callback) if callback is not None else None
+            sends.append(manager.server._emit_internal(sid, event, data, namespace, ack_id))
+    await asyncio.gather(*sends)
+
+
+class LocalManager(socketio.AsyncManager):
+    '''
+    the client manager for a single worker
+    '''
+
+    async def emit(self, event, data, namespace, room=None, skip_sid=None, callback=None, **kwargs):
+        await emit_local(self, event, data, namespace, room, skip_sid, callback)
+
+
+class RedisManager(socketio.AsyncRedisManager):
+    '''
+    the client manager when the workers share rooms through redis. the
+    emits that reach this worker's clients go through emit_local
+    '''
+
+    async def emit(self, event, data, namespace=None, room=None, skip_sid=None, callback=None, **kwargs):
+        if kwargs.get('ignore_queue'):
+            return await emit_local(self, event, data, namespace, room, skip_sid, callback)
+        return await super().emit(event, data, namespace, room, skip_sid, callback, **kwargs)
+
+    async def _handle_emit(self, message):
+        # same as AsyncPubSubManager, acks go back to the worker that emitted
+        remote_callback = message.get('callback')
+        callback = None
+        if remote_callback is not None and len(remote_callback) == 3:
+            callback = partial(self._return_callback, message.get('host_id'), *remote_callback)
+        await emit_local(self, message['event'], message['data'], message.get('namespace'),
+                         message.get('room'), message.get('skip_sid'), callback)
+
+
+# PayloadJSON lets emits reuse json that was already encoded
+client_manager = RedisManager(REDIS_URL, channel=REDIS_CHAN) if REDIS_URL else LocalManager()
+sio = socketio.AsyncServer(async_mode='aiohttp', client_manager=client_manager, json=PayloadJSON(),
+                           cors_allowed_origins='*')
+app = web.Application()
+sio.attach(app)
+
+games = make_store(GAME_STORE_URL)
+game_log = None
+if GAME_LOG_DIR:
+    game_log = EventLog(GAME_LOG_DIR)
+    games = game_log.recover(games)
+
+
+def log_failure(task):
+    '''
+    nothing awaits the emits, so their errors would go unnoticed
+    '''
+    if not task.cancelled() and task.exception() is not None:
+        logger.error('emit failed', exc_info=task.exception())
+
+
+class AsyncioTransport(Transport):
+
+    def schedule(self, delay, func):
+        return asyncio.get_event_loop().call_later(delay, func)
+
+    def emit(self, room, event, args, callback=None):
+        # tasks start in the order they're made, so a room still gets
+        # its events in order
+        task = asyncio.ensure_future(sio.emit(event, args, room=room, callback=callback))
+        task.add_done_callback(log_failure)
+
+    def spawn(self, func, *args, **kwargs):
+        # emit doesn't wait for anything already
+        func(*args, **kwargs)
+
+    def enter_room(self, sid, room):
+        sio.enter_room(sid, room)
+
+
+# everything the events do, see ascendant/service.py
+service = GameService(games, AsyncioTransport(), registry=REGISTRY, shared_rooms=REDIS_URL is not None)
+limits = service.limits
+lobby = service.lobby
+reaper = service.reaper
+
+# the page only depends on the asset manifest, so render it the once
+assets = AssetManifest(os.path.join(ROOT, 'static'))
+templates = jinja2.Environment(loader=jinja2.FileSystemLoader(os.path.join(ROOT, 'templates')), autoescape=True)
+templates.globals['asset_url'] = assets.url
+index_page = templates.get_template('index.html').render()
+
+
+def on(event):
+    '''
+    sio.on, timing every call
+    '''
+    def wrap(handler):
+        labels = (event,)
+
+        @wraps(handler)
+        async def timed(*args):
+            start = default_timer()
+            try:
+                return await handler(*args)
+            except Exception:
+                HANDLER_ERRORS.inc(labels)
+                raise
+            finally:
+                HANDLER_SECONDS.observe(default_timer() - start, labels)
+
+        return sio.on(event)(timed)
+    return wrap
+
+
+def limited(cost=1, game=True, new_game=False):
+    '''
+    goes under on(), see server.py
+    '''
+    def wrap(handler):
+
+        @wraps(handler)
+        async def checked(sid, data=None):
+            refused = limits.check(sid, data, cost, game, new_game)
+            if refused is not None:
+                logger.info('refused %s from %s: %s', handler.__name__, sid, refused['error_message'])
+                return refused
+            return await handler(sid, data)
+
+        return checked
+    return wrap
+
+
+async def run_reaper():
+    while True:
+        await asyncio.sleep(REAPER_INTERVAL)
+        reaper.sweep()
+
+
+async def run_game_log():
+    '''
+    the same group commit as EventLog.run, with the fsync in a thread
+    '''
+    loop = asyncio.get_event_loop()
+    while True:
+        await asyncio.sleep(LOG_FLUSH_INTERVAL)
+        if game_log.snapshot_due():
+            # only every few minutes, so it can block
+            game_log.snapshot()
+        else:
+            fds = []
+            game_log.flush(sync=fds.append)
+            for fd in fds:
+                await loop.run_in_executor(None, os.fsync, fd)
+
+
+async def start_background(app):
+    app['background'] = [asyncio.ensure_future(run_reaper())]
+    if game_log is not None:
+        app['background'].append(asyncio.ensure_future(run_game_log()))
+
+
+async def stop_background(app):
+    for task in app['background']:
+        task.cancel()
+    if game_log is not None:
+        game_log.close()
+
+
+app.on_startup.append(start_background)
+app.on_cleanup.append(stop_background)
+
+
+async def hello(request):
+    return web.Response(text=index_page, content_type='text/html')
+
+
+async def asset(request):
+    # precompressed at build time, and FileResponse sendfile()s it
+    found = assets.find(request.match_info['filename'], request.headers.get('Accept-Encoding'))
+    if found is None:
+        raise web.HTTPNotFound()
+
+    path, content_type, encoding = found
+    headers = response_headers(encoding)
+    headers['Content-Type'] = content_type
+    return web.FileResponse(path, headers=headers)
+
+
+async def stats(request):
+    return web.json_response(reaper.stats())
+
+
+async def list_games(request):
+    args = request.query
+    try:
+        page = lobby.page(args.get('page', 0), args.get('per_page', LOBBY_PAGE_SIZE),
+                          args.get('min_players', 1), args.get('max_players', MAX_NUM_OF_PLAYERS))
+    except ValueError:
+        raise web.HTTPBadRequest()
+    return web.Response(text=page, content_type='application/json')
+
+
+async def metrics(request):
+    return web.Response(body=render_metrics().encode('utf-8'), headers={'Content-Type': CONTENT_TYPE})
+
+
+app.router.add_get('/', hello)
+app.router.add_get(ASSET_URL_PREFIX + '{filename:.+}', asset)
+app.router.add_static('/static', os.path.join(ROOT, 'static'))
+app.router.add_get('/stats', stats)
+app.router.add_get('/games', list_games)
+app.router.add_get('/metrics', metrics)
+
+
+@sio.on('connect')
+async def on_connect(sid, environ):
+    if not limits.connect(sid):
+        logger.info('refused connection from %s, the server is full', sid)
+        raise socketio.exceptions.ConnectionRefusedError('The server is full, try again later')
+
+
+@sio.on('disconnect')
+async def on_disconnect(sid):
+    limits.disconnect(sid)
+    service.disconnect(sid)
+
+
+def handler_for(event):
+    '''
+    the socket.io handler for an event, which hands it to the service
+    '''
+    handle = getattr(service, event)
+
+    async def handler(sid, data=None):
+        return handle(sid, data)
+
+    handler.__name__ = 'on_' + event
+    return handler
+
+
+for event, limit in EVENTS.items():
+    on(event)(limited(**limit)(handler_for(event)))
+
+
+if __name__ == '__main__':
+    web.run_app(app, port=int(os.environ.get('PORT', 5000)))
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+
+"""
+Engine Benchmark
+================
+
+Plays whole games straight through ascendant.ascendant, with no sockets involved, and reports what every engine call costs.
+
+    python benchmarks/engine.py --save benchmarks/baselines/engine.json
+    python benchmarks/engine.py --compare benchmarks/baselines/engine.json
+
+Every game draws random strategies (how often players approve proposals, how often the bad team sabotages missions) from a seeded rng, and the teams are shuffled with the same seed, so runs are repeatable. The report has ns per call and net memory blocks allocated per call for each operation, plus how many whole games a single core gets through when nothing is being measured. With --compare, any operation that got slower (or allocates more) than the baseline allows exits non-zero.
+
+benchmarks/baselines/engine.json is the committed baseline, saved with the first command above. Timings only compare on the same kind of machine, so a CI runner that isn't like the one it was saved on should save its own from the base branch first and compare the change against that:
+
+    git checkout master && python benchmarks/engine.py --save /tmp/engine.json
+    git checkout - && python benchmarks/engine.py --compare /tmp/engine.json
+
+The block counts don't depend on the machine, so those compare against the committed one anywhere.
+
+Needs python 3.
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ascendant.ascendant import AscendantGame, Player
+from ascendant.settings import *
+
+OPS = (
+    'add_player',
+    'start_game',
+    'start_round',
+    'start_proposal',
+    'set_mission_members',
+    'vote',
+    'get_votes',
+    'start_mission_voting',
+    'mission_vote',
+    'get_mission_votes',
+    'is_over',
+)
+
+# a game that goes on longer than this is stuck, not unlucky
+MAX_PROPOSALS = 100
+
+
+def seeded(seed):
+    '''
+    the rng for a run. start_game shuffles the teams with the random
+    module itself, so that gets the same seed, or the teams (and so
+    every game after the first) would be different every run
+    '''
+    random.seed(seed)
+    return random.Random(seed)
+
+
+def play(rng, n_players, call):
+    '''
+    one whole game, the same way server.py drives the engine. every
+    engine call goes through call(op, func, *args)
+    '''
+    approve = rng.uniform(0.3, 0.9)
+    sabotage = rng.random()
+
+    ids = ['player-{}'.format(i) for i in range(n_players)]
+    game = AscendantGame('BNCH', Player(ids[0], ids[0]))
+    for pid in ids[1:]:
+        call('add_player', game.add_player, Player(pid, pid))
+
+    call('start_game', game.start_game)
+    call('start_round', game.start_round)
+    call('start_proposal', game.start_proposal)
+
+    for _ in range(MAX_PROPOSALS):
+        team = rng.sample(ids, game.current_round.num_on_mission)
+        call('set_mission_members', game.set_mission_members, team)
+
+        for pid in ids:
+            call('vote', game.vote, pid, rng.random() < approve)
+        passed, votes = call('get_votes', game.get_votes)
+
+        if passed:
+            call('start_mission_voting', game.start_mission_voting)
+            for pid in team:
+                bad = game.get_player(pid).team == TEAM_BAD
+                call('mission_vote', game.mission_vote, pid, not (bad and rng.random() < sabotage))
+            call('get_mission_votes', game.get_mission_votes)
+
+            if call('is_over', game.is_over):
+                return
+            call('start_round', game.start_round)
+            call('start_proposal', game.start_proposal)
+        else:
+            call('start_proposal', game.start_proposal)
+            if call('is_over', game.is_over):
+                return
+
+
+class Recorder(object):
+    '''
+    times every call, or counts the memory blocks it leaves allocated
+    '''
+
+    def __init__(self, allocations=False):
+        self.totals = dict((op, 0) for op in OPS)
+        self.counts = dict((op, 0) for op in OPS)
+        self.allocations = allocations
+
+    def __call__(self, op, func, *args):
+        if self.allocations:
+            before = sys.getallocatedblocks()
+            result = func(*args)
+            self.totals[op] += sys.getallocatedblocks() - before
+        else:
+            start = time.perf_counter_ns()
+            result = func(*args)
+            self.totals[op] += time.perf_counter_ns() - start
+        self.counts[op] += 1
+        return result
+
+    def per_call(self, overhead=0):
+        return dict((op, max(self.totals[op] / float(self.counts[op]) - overhead, 0.0))
+                    for op in OPS if self.counts[op])
+
+
+def overhead(allocations=False, samples=200000):
+    '''
+    what measuring costs by itself, to take off every measurement
+    '''
+    recorder = Recorder(allocations)
+    noop = lambda: None
+    for _ in range(samples):
+        recorder('is_over', noop)
+    return recorder.per_call()['is_over']
+
+
+def run(n_games, n_players, seed, repeat):
+    gc.collect()
+
+    # plain games per second with nothing measured, best of repeat
+    games_per_sec = 0
+    for _ in range(repeat):
+        rng = seeded(seed)
+        start = time.perf_counter()
+        for _ in range(n_games):
+            play(rng, n_players, lambda op, func, *args: func(*args))
+        games_per_sec = max(games_per_sec, n_games / (time.perf_counter() - start))
+
+    # the best of a few runs is the one with the least noise in it
+    ns = None
+    for _ in range(repeat):
+        timer = Recorder()
+        rng = seeded(seed)
+        for _ in range(n_games):
+            play(rng, n_players, timer)
+        run_ns = timer.per_call(overhead())
+        ns = run_ns if ns is None else dict((op, min(ns[op], run_ns[op])) for op in ns)
+
+    # allocations don't change run to run, so fewer games will do
+    blocks = Recorder(allocations=True)
+    rng = seeded(seed)
+    for _ in range(min(n_games, 2000)):
+        play(rng, n_players, blocks)
+
+    return {
+        'games': n_games,
+        'players': n_players,
+        'games_per_sec': games_per_sec,
+        'ns': ns,
+        'blocks': blocks.per_call(overhead(allocations=True)),
+        'calls': timer.counts
+    }
+
+
+def compare(result, baseline, tolerance):
+    '''
+    returns a list of the operations that regressed
+    '''
+    regressions = []
+    for op, ns in sorted(result['ns'].items()):
+        base = baseline['ns'].get(op)
+        if base is not None and ns > base * (1 + tolerance) and ns - base > 20:
+            regressions.append('{}: {:.0f} ns, baseline {:.0f} ns'.format(op, ns, base))
+
+        base_blocks = baseline['blocks'].get(op)
+        if base_blocks is not None and result['blocks'][op] > base_blocks + 0.5:
+            regressions.append('{}: {:.1f} blocks, baseline {:.1f}'.format(op, result['blocks'][op], base_blocks))
+
+    if result['games_per_sec'] < baseline['games_per_sec'] * (1 - tolerance):
+        regressions.append('whole games: {:.0f}/s, baseline {:.0f}/s'.format(
+            result['games_per_sec'], baseline['games_per_sec']))
+    return regressions
+
+
+def report(result, baseline=None):
+    print('{} games with {} players, {:.0f} games/s on one core'.format(
+        result['games'], result['players'], result['games_per_sec']))
+    print('{:<22} {:>10} {:>10} {:>8} {:>12}'.format('op', 'calls', 'ns/call', 'blocks', 'baseline ns'))
+    for op in OPS:
+        if op not in result['ns']:
+            continue
+        base = baseline['ns'].get(op) if baseline else None
+        print('{:<22} {:>10} {:>10.0f} {:>8.1f} {:>12}'.format(
+            op, result['calls'][op], result['ns'][op], result['blocks'].get(op, 0.0),
+            '{:.0f}'.format(base) if base is not None else '-'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('-n', '--games', type=int, default=20000)
+    parser.add_argument('-p', '--players', type=int, default=MAX_NUM_OF_PLAYERS)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=3, help='take the best of this many runs')
+    parser.add_argument('--save', metavar='PATH', help='save the results as a baseline')
+    parser.add_argument('--compare', metavar='PATH', help='fail if slower than this baseline')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='how much slower counts as a regression')
+    args = parser.parse_args()
+
+    result = run(args.games, args.players, args.seed, args.repeat)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    report(result, baseline)
+
+    if args.save:
+        directory = os.path.dirname(args.save)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(args.save, 'w') as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+        print('saved baseline to {}'.format(args.save))
+
+    if baseline is not None:
+        regressions = compare(result, baseline, args.tolerance)
+        if regressions:
+            print('\nregressions:')
+            for regression in regressions:
+                print('  ' + regression)
+            sys.exit(1)
+        print('\nno regressions')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+"""
+Game ID Benchmark
+=================
+
+Create throughput when the server is already half and 90% full, comparing the old draw-random-and-retry loop with the allocator.
+
+    python benchmarks/ids.py
+    python benchmarks/ids.py --fill 0.5 0.9 0.99 -n 20000
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ascendant.ascendant import AscendantGame
+from ascendant.ids import GameIdAllocator, ID_SPACE
+
+
+def bench_random(fill, n):
+    '''
+    the old way: random ids, retried until one isn't in the registry
+    '''
+    games = {}
+    while len(games) < int(ID_SPACE * fill):
+        games[AscendantGame.gen_id()] = True
+
+    def create():
+        for _ in range(n):
+            game_id = AscendantGame.gen_id()
+            while game_id in games:
+                game_id = AscendantGame.gen_id()
+            games[game_id] = True
+
+    return timeit.timeit(create, number=1)
+
+
+def bench_allocator(fill, n):
+    ids = GameIdAllocator()
+    games = {}
+    for _ in range(int(ID_SPACE * fill)):
+        games[ids.allocate()] = True
+
+    def create():
+        for _ in range(n):
+            games[ids.allocate()] = True
+
+    return timeit.timeit(create, number=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--fill', type=float, nargs='+', default=[0.5, 0.9])
+    parser.add_argument('-n', '--creates', type=int, default=10000)
+    args = parser.parse_args()
+
+    print('{:>6} {:>18} {:>18}'.format('full', 'random (ids/s)', 'allocator (ids/s)'))
+    for fill in args.fill:
+        # can't create more games than there is room for
+        n = min(args.creates, int(ID_SPACE * (1 - fill)))
+        print('{:>5.0f}% {:>18.0f} {:>18.0f}'.format(
+            fill * 100, n / bench_random(fill, n), n / bench_allocator(fill, n)))
+
+
+if __name__ == '__main__':
+    main()
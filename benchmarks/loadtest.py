@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+
+"""
+Load Test
+=========
+
+Plays lots of whole games at once against a running server, over the same socket.io events the apps use (see docs/socketio-spec.md): create, join, start, ready, propose_mission, proposal_vote and mission_vote, acking every event the server sends.
+
+Start a server on localhost first. Leave REDISCLOUD_URL unset so there's no message queue, and use GAME_STORE_URL=fakeredis:// to go through the redis game store without a redis server:
+
+    GAME_STORE_URL=fakeredis:// python server.py
+    python benchmarks/loadtest.py --ramp 1 10 50 100 --players 5 10
+
+async_server.py plays the same games, so the same ramp compares the two. With --encoding compact the bots ask for the compact encoding of the hot events (see ascendant/compact.py), and turn it back into the usual payloads.
+
+Each stage of the ramp plays that many games at the same time and reports calls and events per second, latency histograms for every call, and how many events the server sent per game.
+
+Needs python 3 and the packages in benchmarks/requirements.txt.
+"""
+
+import argparse
+import asyncio
+import collections
+import json
+import os
+import random
+import sys
+import time
+
+import socketio
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ascendant.compact import expand
+
+# the server stops sending anything once a game is over, so a game
+# that's been quiet this long is considered finished
+DEFAULT_IDLE_TIMEOUT = 5.0
+
+# latency histogram buckets, in ms
+BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+NUM_WINS = 3
+
+
+class Stats(object):
+
+    def __init__(self):
+        self.latencies = collections.defaultdict(list)
+        self.received = collections.Counter()
+        # json bytes of every payload received, as sent
+        self.payload_bytes = collections.Counter()
+        self.errors = collections.Counter()
+        self.completed = 0
+        self.idled_out = 0
+
+    def calls(self):
+        return sum(len(v) for v in self.latencies.values())
+
+    def events(self):
+        return sum(self.received.values())
+
+
+class Bot(object):
+    '''
+    one player, with its own socket.io connection
+    '''
+
+    def __init__(self, game, name):
+        self.game = game
+        self.name = name
+        self.stats = game.stats
+        self.player_id = None
+        self.team = None
+        # the player list in seat order, for the compact encoding
+        self.players = []
+
+        self.proposed = set()
+        self.voted = False
+        self.mission_voted = False
+
+        self.sio = socketio.AsyncClient(reconnection=False)
+        for event in ('update_players', 'assign_roles', 'propose_mission', 'do_proposal_vote',
+                      'proposal_vote_result', 'mission_vote_result'):
+            self.sio.on(event, self._handler(event))
+
+    async def connect(self, url, transports):
+        await self.sio.connect(url, transports=transports)
+
+    async def disconnect(self):
+        await self.sio.disconnect()
+
+    async def call(self, event, data):
+        start = time.perf_counter()
+        try:
+            result = await self.sio.call(event, data, timeout=self.game.args.call_timeout)
+        except socketio.exceptions.TimeoutError:
+            self.stats.errors[event + ' timeout'] += 1
+            return None
+        self.stats.latencies[event].append((time.perf_counter() - start) * 1000.0)
+        if isinstance(result, dict) and result.get('success') is False:
+            self.stats.errors[event] += 1
+        return result
+
+    def later(self, coro):
+        # acks go back when the handler returns, so anything else the
+        # event kicks off happens after that
+        asyncio.ensure_future(coro)
+
+    def _handler(self, event):
+        # broadcasts come with the game's sync version after the payload
+        async def handle(data, version=None):
+            self.stats.received[event] += 1
+            self.stats.payload_bytes[event] += len(json.dumps(data, separators=(',', ':')))
+            self.game.touch()
+            if event == 'assign_roles':
+                self.players = data['players']
+            elif self.game.args.encoding == 'compact':
+                data = expand(event, data, self.players)
+            getattr(self, 'on_' + event)(data)
+            return {'game_id': self.game.game_id, 'player_id': self.player_id, 'ack_type': event}
+        return handle
+
+    def on_update_players(self, players):
+        pass
+
+    def on_assign_roles(self, data):
+        if self.team is None:
+            self.team = data['player']['team']
+            self.later(self.call('ready', {'game_id': self.game.game_id, 'player_id': self.player_id}))
+
+    def on_propose_mission(self, data):
+        self.voted = False
+        key = (data['mission_number'], data['leader']['id'], self.game.failed_proposals)
+        if data['leader']['id'] != self.player_id or key in self.proposed:
+            return
+        self.proposed.add(key)
+
+        team = random.sample(self.game.player_ids(), data['number_players'])
+        self.later(self.call('propose_mission', {
+            'game_id': self.game.game_id,
+            'player_id': self.player_id,
+            'player_ids': team
+        }))
+
+    def on_do_proposal_vote(self, data):
+        self.mission_voted = False
+        if self.voted:
+            return
+        self.voted = True
+
+        vote = random.random() < self.game.args.approve
+        self.later(self.call('proposal_vote', {
+            'game_id': self.game.game_id,
+            'player_id': self.player_id,
+            'vote': vote
+        }))
+
+    def on_proposal_vote_result(self, data):
+        self.game.failed_proposals = data['failed_proposals']
+        if not data['pass'] or self.player_id not in data['players'] or self.mission_voted:
+            return
+        self.mission_voted = True
+
+        # the good team always passes missions, the bad team fails some
+        vote = self.team != 1 or random.random() >= self.game.args.sabotage
+        self.later(self.call('mission_vote', {
+            'game_id': self.game.game_id,
+            'player_id': self.player_id,
+            'vote': vote
+        }))
+
+    def on_mission_vote_result(self, data):
+        # every bot gets this, so only the creator keeps score
+        if self is self.game.bots[0]:
+            self.game.record_mission(data['pass'])
+
+
+class Game(object):
+
+    def __init__(self, args, stats, n_players):
+        self.args = args
+        self.stats = stats
+        self.game_id = None
+        self.failed_proposals = 0
+        self.wins = [0, 0]
+        self.done = asyncio.Event()
+        self.last_event = time.monotonic()
+        self.bots = [Bot(self, 'bot {}'.format(i)) for i in range(n_players)]
+
+    def player_ids(self):
+        return [b.player_id for b in self.bots]
+
+    def touch(self):
+        self.last_event = time.monotonic()
+
+    def record_mission(self, passed):
+        self.wins[0 if passed else 1] += 1
+        if max(self.wins) >= NUM_WINS:
+            self.done.set()
+
+    async def play(self):
+        await asyncio.gather(*(b.connect(self.args.url, self.args.transports) for b in self.bots))
+        try:
+            creator = self.bots[0]
+            created = await creator.call('create', {'name': creator.name, 'encoding': self.args.encoding})
+            if created is None:
+                return
+            self.game_id = created['game_id']
+            creator.player_id = created['creator_id']
+
+            for bot in self.bots[1:]:
+                joined = await bot.call('join', {'game_id': self.game_id, 'name': bot.name, 'old_id': None,
+                                                 'encoding': self.args.encoding})
+                if not joined or not joined.get('success'):
+                    return
+                bot.player_id = joined['player']['id']
+
+            await creator.call('start', {'game_id': self.game_id, 'player_id': creator.player_id})
+
+            while not self.done.is_set():
+                try:
+                    await asyncio.wait_for(self.done.wait(), timeout=0.5)
+                except asyncio.TimeoutError:
+                    if time.monotonic() - self.last_event > self.args.idle_timeout:
+                        self.stats.idled_out += 1
+                        return
+            self.stats.completed += 1
+        finally:
+            await asyncio.gather(*(b.disconnect() for b in self.bots), return_exceptions=True)
+
+
+def histogram(samples):
+    counts = [0] * (len(BUCKETS) + 1)
+    for sample in samples:
+        for i, bucket in enumerate(BUCKETS):
+            if sample <= bucket:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+    labels = ['<={}'.format(b) for b in BUCKETS] + ['>{}'.format(BUCKETS[-1])]
+    return ' '.join('{}:{}'.format(l, c) for l, c in zip(labels, counts) if c)
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+def report(concurrency, n_players, stats, elapsed, n_games, show_histograms):
+    print('== {} games at once, {} players each'.format(concurrency, n_players))
+    print('   {:.1f}s, {} finished, {} went quiet, errors: {}'.format(
+        elapsed, stats.completed, stats.idled_out, dict(stats.errors) or 'none'))
+    print('   {:.0f} calls/s, {:.0f} server events/s, {:.1f} server events per game'.format(
+        stats.calls() / elapsed, stats.events() / elapsed, stats.events() / float(n_games)))
+    print('   {:<16} {:>7} {:>8} {:>8} {:>8}'.format('call', 'count', 'p50 ms', 'p90 ms', 'p99 ms'))
+    for event in sorted(stats.latencies):
+        samples = stats.latencies[event]
+        print('   {:<16} {:>7} {:>8.1f} {:>8.1f} {:>8.1f}'.format(
+            event, len(samples), percentile(samples, 0.5), percentile(samples, 0.9), percentile(samples, 0.99)))
+        if show_histograms:
+            print('   {:<16} {}'.format('', histogram(samples)))
+    print('   events received: {}'.format(dict(stats.received)))
+    print('   payload bytes per event: {}'.format(
+        dict((event, stats.payload_bytes[event] // n) for event, n in stats.received.items())))
+
+
+async def run_stage(args, concurrency, n_players):
+    stats = Stats()
+    games = [Game(args, stats, n_players) for _ in range(concurrency)]
+    start = time.perf_counter()
+    await asyncio.gather(*(g.play() for g in games))
+    report(concurrency, n_players, stats, time.perf_counter() - start, len(games), args.histograms)
+
+
+async def main(args):
+    for n_players in args.players:
+        for concurrency in args.ramp:
+            await run_stage(args, concurrency, n_players)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--ramp', type=int, nargs='+', default=[1, 10, 50],
+                        help='how many games to play at once, one stage per number')
+    parser.add_argument('--players', type=int, nargs='+', default=[5])
+    parser.add_argument('--approve', type=float, default=0.7, help='chance a bot approves a proposal')
+    parser.add_argument('--sabotage', type=float, default=0.5, help='chance a bad bot fails a mission')
+    parser.add_argument('--call-timeout', type=float, default=10.0)
+    parser.add_argument('--idle-timeout', type=float, default=DEFAULT_IDLE_TIMEOUT)
+    parser.add_argument('--transports', nargs='+', default=['websocket'])
+    parser.add_argument('--encoding', choices=['json', 'compact'], default='json',
+                        help='the encoding the bots ask the server for')
+    parser.add_argument('--histograms', action='store_true', help='print a latency histogram for every call')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    asyncio.run(main(parse_args()))
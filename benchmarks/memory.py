@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+"""
+Memory Benchmark
+================
+
+Creates a bunch of games with a full table of players each and reports how many bytes every game costs.
+
+    python benchmarks/memory.py -n 10000
+    python benchmarks/memory.py -n 10000 --started
+
+Uses tracemalloc when it's there (python 3), and otherwise walks the objects adding up sys.getsizeof.
+"""
+
+import argparse
+import gc
+import os
+import sys
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ascendant.ascendant import AscendantGame, Player
+from ascendant.settings import *
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+def make_games(n_games, n_players, started):
+    games = {}
+    for i in range(n_games):
+        creator = Player(str(uuid.uuid4()), 'player 0')
+        game = AscendantGame('G{:07d}'.format(i), creator)
+        for j in range(1, n_players):
+            game.add_player(Player(str(uuid.uuid4()), 'player {}'.format(j)))
+
+        if started:
+            game.start_game()
+            game.start_round()
+            game.start_proposal()
+
+        games[game.game_id] = game
+    return games
+
+
+def deep_size(obj, seen=None):
+    '''
+    rough size of obj and everything it holds on to, counting shared
+    objects once. good enough when tracemalloc isn't around
+    '''
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_size(v, seen) for v in obj)
+    else:
+        for cls in type(obj).__mro__:
+            for name in getattr(cls, '__slots__', ()):
+                if hasattr(obj, name):
+                    size += deep_size(getattr(obj, name), seen)
+        if hasattr(obj, '__dict__'):
+            size += deep_size(obj.__dict__, seen)
+    return size
+
+
+def measure(n_games, n_players, started):
+    gc.collect()
+
+    if tracemalloc is not None:
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        games = make_games(n_games, n_players, started)
+        gc.collect()
+        total = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+    else:
+        games = make_games(n_games, n_players, started)
+        # the rules tables are shared by every game, don't count them
+        total = deep_size(games, seen=set(id(r) for r in RULES.values()))
+
+    return total, games
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('-n', '--games', type=int, default=10000)
+    parser.add_argument('-p', '--players', type=int, default=MAX_NUM_OF_PLAYERS)
+    parser.add_argument('--started', action='store_true', help='start every game instead of leaving them joining')
+    args = parser.parse_args()
+
+    total, games = measure(args.games, args.players, args.started)
+
+    print('{} games with {} players ({})'.format(
+        len(games), args.players, 'started' if args.started else 'joining'))
+    print('total: {:.1f} MiB'.format(total / (1024.0 * 1024.0)))
+    print('per game: {:.0f} bytes'.format(total / float(len(games))))
+    print('method: {}'.format('tracemalloc' if tracemalloc is not None else 'getsizeof'))
+
+
+if __name__ == '__main__':
+    main()
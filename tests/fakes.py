@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+"""
+Fakes
+=====
+
+A clock and a socket.io transport for driving the server code without a server: timers only go off when a test moves the clock on, and emits go into a queue until a test delivers them.
+"""
+
+import json
+from collections import deque
+
+from ascendant.service import Transport
+
+
+class Timer(object):
+
+    def __init__(self, when, func):
+        self.when = when
+        self.func = func
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class FakeClock(object):
+    '''
+    stands in for eventlet.spawn_after and loop.call_later
+    '''
+
+    def __init__(self):
+        self.now = 0.0
+        self.timers = []
+
+    def schedule(self, delay, func):
+        timer = Timer(self.now + delay, func)
+        self.timers.append(timer)
+        return timer
+
+    def pending(self):
+        return [t for t in self.timers if not t.cancelled]
+
+    def advance(self, seconds):
+        '''
+        move the clock on, going off with every timer due by then in order
+        '''
+        end = self.now + seconds
+        while True:
+            due = [t for t in self.pending() if t.when <= end]
+            if not due:
+                break
+            timer = min(due, key=lambda t: t.when)
+            self.timers.remove(timer)
+            self.now = max(self.now, timer.when)
+            timer.func()
+        self.now = end
+
+
+class Message(object):
+
+    def __init__(self, sid, room, event, args, callback):
+        self.sid = sid
+        self.room = room
+        self.event = event
+        self.args = args
+        self.callback = callback
+
+    @property
+    def payload(self):
+        # broadcasts are encoded already, replies to one client aren't
+        payload = self.args[0]
+        return json.loads(payload) if isinstance(payload, str) else payload
+
+
+class FakeTransport(Transport):
+    '''
+    every emit is queued for each client in the room, and only gets to
+    them (and acked) when the test calls deliver
+    '''
+
+    def __init__(self, clock=None):
+        self.clock = clock or FakeClock()
+        self.rooms = {}
+        self.queue = deque()
+        # sid -> every Message it was sent
+        self.received = {}
+        # sid -> player_id, for acking like the apps do
+        self.players = {}
+        # sids whose acks are held back
+        self.slow = set()
+        self.held = []
+
+    def schedule(self, delay, func):
+        return self.clock.schedule(delay, func)
+
+    def emit(self, room, event, args, callback=None):
+        for sid in sorted(self.rooms.get(room, ())):
+            self.queue.append(Message(sid, room, event, args, callback))
+
+    def spawn(self, func, *args, **kwargs):
+        func(*args, **kwargs)
+
+    def enter_room(self, sid, room):
+        self.rooms.setdefault(room, set()).add(sid)
+
+    def deliver(self):
+        '''
+        hand every queued message to its client, which acks it with its
+        player id. acks can send more, which are delivered too
+        '''
+        while self.queue:
+            message = self.queue.popleft()
+            self.received.setdefault(message.sid, []).append(message)
+            if message.sid in self.slow:
+                self.held.append(message)
+            else:
+                self.ack(message)
+
+    def ack(self, message):
+        if message.callback is not None:
+            message.callback({'player_id': self.players.get(message.sid), 'ack_type': message.event})
+
+    def release(self, sid):
+        '''
+        the acks a slow client was holding back finally come in
+        '''
+        self.slow.discard(sid)
+        held = [m for m in self.held if m.sid == sid]
+        self.held = [m for m in self.held if m.sid != sid]
+        for message in held:
+            self.ack(message)
+        self.deliver()
+
+    def events(self, sid, event=None):
+        return [m for m in self.received.get(sid, ()) if event is None or m.event == event]
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+
+"""
+Ack Barriers
+============
+
+AckBarriers against a fake clock and a send that only writes down who it sent to, so the retries and the backoff happen when the test says so.
+"""
+
+import pytest
+
+from ascendant.acks import AckBarriers
+from ascendant.ascendant import AscendantGame, Player
+from ascendant.errors import *
+from ascendant.settings import *
+
+from fakes import FakeClock
+
+EVENT = 'propose_mission'
+N_PLAYERS = 5
+
+
+class Sends(object):
+    '''
+    the send a barrier is given. keeps every (players, callback) it was
+    called with, players being None for the whole room
+    '''
+
+    def __init__(self, game):
+        self.game = game
+        self.calls = []
+
+    def __call__(self, players, callback):
+        self.calls.append((players, callback))
+
+    def sent_to(self, i):
+        players = self.calls[i][0]
+        return sorted(p.player_id for p in (self.game.players if players is None else players))
+
+    def ack(self, player_id, i=-1):
+        # the way a client acks, with its player id
+        self.calls[i][1]({'player_id': player_id, 'ack_type': EVENT})
+
+
+def new_game():
+    ids = ['p{}'.format(i) for i in range(N_PLAYERS)]
+    game = AscendantGame('ACKS', Player(ids[0], ids[0]))
+    for pid in ids[1:]:
+        game.add_player(Player(pid, pid))
+    return game, ids
+
+
+def start():
+    clock = FakeClock()
+    barriers = AckBarriers(clock.schedule)
+    game, ids = new_game()
+    sends = Sends(game)
+    completed = []
+    barrier = barriers.start(game, EVENT, sends, lambda: completed.append(True))
+    return clock, barriers, barrier, sends, completed, ids
+
+
+def test_everyone_acks_before_the_timeout():
+    clock, barriers, barrier, sends, completed, ids = start()
+    assert sends.sent_to(0) == ids
+
+    for pid in ids[:-1]:
+        sends.ack(pid)
+    assert not completed
+    sends.ack(ids[-1])
+
+    assert completed == [True]
+    assert barriers.get('ACKS', EVENT) is None
+    # the retry timer went with it
+    assert clock.pending() == []
+    clock.advance(ACK_MAX_TIMEOUT * 10)
+    assert len(sends.calls) == 1
+
+
+def test_resends_only_to_who_hasnt_acked():
+    clock, barriers, barrier, sends, completed, ids = start()
+    sends.ack(ids[0])
+    sends.ack(ids[1])
+
+    clock.advance(ACK_TIMEOUT)
+    assert sends.sent_to(1) == ids[2:]
+
+    # an ack to either send counts
+    sends.ack(ids[2], 0)
+    sends.ack(ids[3], 1)
+    clock.advance(ACK_TIMEOUT * ACK_BACKOFF)
+    assert sends.sent_to(2) == ids[4:]
+
+    sends.ack(ids[4])
+    assert completed == [True]
+    assert not barrier.timed_out
+
+
+def test_backs_off_then_gives_up():
+    clock, barriers, barrier, sends, completed, ids = start()
+
+    delays = []
+    while not completed:
+        sent_at = clock.now
+        clock.advance(min(t.when for t in clock.pending()) - clock.now)
+        delays.append(clock.now - sent_at)
+
+    # the first send and one per retry, then the last wait runs out
+    assert len(sends.calls) == ACK_MAX_RETRIES + 1
+    assert delays == [min(ACK_TIMEOUT * ACK_BACKOFF ** i, ACK_MAX_TIMEOUT) for i in range(ACK_MAX_RETRIES + 1)]
+    assert barrier.timed_out
+    assert barriers.get('ACKS', EVENT) is None
+    assert clock.pending() == []
+
+
+def test_stale_ack_is_ignored():
+    clock, barriers, old, sends, completed, ids = start()
+    # the event is sent again before anybody acks the first one
+    new = barriers.start(old.game, EVENT, sends)
+    assert old.done
+
+    for pid in ids:
+        sends.ack(pid, 0)
+    assert new.outstanding == set(ids)
+    assert barriers.get('ACKS', EVENT) is new
+    assert not completed
+
+    for pid in ids:
+        sends.ack(pid, 1)
+    assert new.done
+    # the replaced barrier never completes
+    assert not completed
+
+
+def test_acks_for_someone_else():
+    clock, barriers, barrier, sends, completed, ids = start()
+    # not in the game, acking with nothing, and acking twice
+    sends.ack('somebody else')
+    sends.calls[0][1]()
+    sends.ack(ids[0])
+    sends.ack(ids[0])
+    assert barrier.outstanding == set(ids[1:])
+
+
+def test_leaving_counts_as_acking():
+    clock, barriers, barrier, sends, completed, ids = start()
+    for pid in ids[:-1]:
+        sends.ack(pid)
+    barrier.game.remove_player(ids[-1])
+
+    clock.advance(ACK_TIMEOUT)
+    assert completed == [True]
+    assert len(sends.calls) == 1
+    assert not barrier.timed_out
+
+
+def test_on_complete_chains_the_next_barrier():
+    clock = FakeClock()
+    barriers = AckBarriers(clock.schedule)
+    game, ids = new_game()
+    first, second = Sends(game), Sends(game)
+    done = []
+
+    # the way a result's barrier announces the next proposal
+    barriers.start(game, 'proposal_vote_result', first,
+                   lambda: barriers.start(game, EVENT, second, lambda: done.append(EVENT)))
+    assert not second.calls
+
+    for pid in ids:
+        first.ack(pid)
+    assert second.sent_to(0) == ids
+    assert barriers.get('ACKS', 'proposal_vote_result') is None
+    assert barriers.get('ACKS', EVENT) is not None
+
+    for pid in ids:
+        second.ack(pid)
+    assert done == [EVENT]
+    assert len(barriers) == 0
+
+
+def test_unknown_event():
+    clock = FakeClock()
+    game, ids = new_game()
+    with pytest.raises(AscendantError):
+        AckBarriers(clock.schedule).start(game, 'nope', Sends(game))
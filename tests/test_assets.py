@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+"""
+Static Assets
+=============
+
+Reading Accept-Encoding, and AssetManifest picking which precompressed file to send for it.
+"""
+
+import json
+import os
+
+import pytest
+
+from ascendant.assets import AssetManifest, MANIFEST_NAME, accepted_encodings, build, response_headers
+from ascendant.settings import *
+
+
+@pytest.mark.parametrize('header, accepted, refused', [
+    ('', set(), set()),
+    ('gzip', {'gzip'}, set()),
+    ('gzip, deflate, br', {'gzip', 'deflate', 'br'}, set()),
+    (' GZip ;Q=0.5 ,BR', {'gzip', 'br'}, set()),
+    ('gzip;q=0', set(), {'gzip'}),
+    ('gzip;q=0.0, br;q=0.001', {'br'}, {'gzip'}),
+    ('br;q=1.0, gzip; q=0.8, identity;q=0.1', {'br', 'gzip', 'identity'}, set()),
+    ('*', {'*'}, set()),
+    ('*;q=0', set(), {'*'}),
+    ('gzip, *;q=0', {'gzip'}, {'*'}),
+    # a q we can't read counts as refused
+    ('br;q=lots, gzip', {'gzip'}, {'br'}),
+    ('br;q=, gzip', {'gzip'}, {'br'}),
+    ('br;q=-1', set(), {'br'}),
+    # other parameters don't matter, and empty items are skipped
+    ('gzip;level=9', {'gzip'}, set()),
+    (',,gzip,,', {'gzip'}, set()),
+])
+def test_accepted_encodings(header, accepted, refused):
+    assert accepted_encodings(header) == (accepted, refused)
+
+
+@pytest.fixture
+def manifest(tmpdir):
+    '''
+    a build of a stylesheet, a script and an image, with a brotli file
+    written next to the script whether or not brotli is installed
+    '''
+    static = tmpdir.mkdir('static')
+    static.mkdir('js').join('app.js').write('function hello() {\n    return "hello";\n}\n' * 50)
+    static.mkdir('css').join('app.css').write('body {\n    background: url("../img/bg.png");\n}\n' * 50)
+    static.mkdir('img').join('bg.png').write_binary(b'\x89PNG not really')
+    built = build(str(static))
+
+    js = static.join(ASSET_DIST, built['js/app.js'])
+    js.new(basename=js.basename + '.br').write_binary(b'pretend this is brotli')
+    for path in (js.strpath + '.gz', static.join(ASSET_DIST, built['img/bg.png']).strpath + '.gz'):
+        # the script compresses and the image doesn't
+        assert os.path.exists(path) == path.startswith(js.strpath)
+    return AssetManifest(str(static)), built
+
+
+@pytest.mark.parametrize('header, encoding', [
+    ('', None),
+    ('identity', None),
+    ('gzip', 'gzip'),
+    ('br', 'br'),
+    # br is picked over gzip whatever order they're asked for in
+    ('gzip, br', 'br'),
+    ('br, gzip', 'br'),
+    ('*', 'br'),
+    ('br;q=0, gzip', 'gzip'),
+    ('br;q=0, *', 'gzip'),
+    ('gzip, *;q=0', 'gzip'),
+    ('*;q=0', None),
+    ('br;q=0, gzip;q=0', None),
+    ('br;q=bad, gzip', 'gzip'),
+])
+def test_find_picks_the_best_encoding(manifest, header, encoding):
+    assets, built = manifest
+    path, content_type, found = assets.find(built['js/app.js'], header)
+    assert found == encoding
+    assert content_type in ('application/javascript', 'text/javascript')
+    suffix = {'br': '.br', 'gzip': '.gz', None: ''}[encoding]
+    assert path == os.path.join(assets.dist_dir, *built['js/app.js'].split('/')) + suffix
+    assert os.path.exists(path)
+
+
+def test_find_files_that_arent_compressed(manifest):
+    assets, built = manifest
+    path, content_type, encoding = assets.find(built['img/bg.png'], 'br, gzip')
+    assert encoding is None
+    assert content_type == 'image/png'
+
+    # only built names are served, not the originals or the manifest
+    assert assets.find('img/bg.png', 'gzip') is None
+    assert assets.find(MANIFEST_NAME) is None
+    assert assets.find('../' + built['img/bg.png']) is None
+
+
+def test_urls(manifest):
+    assets, built = manifest
+    assert assets.url('js/app.js') == ASSET_URL_PREFIX + built['js/app.js']
+    assert assets.url('not/built.js') == '/static/not/built.js'
+
+    # the stylesheet points at the built image
+    with open(os.path.join(assets.dist_dir, *built['css/app.css'].split('/'))) as f:
+        css = f.read()
+    assert '../' + built['img/bg.png'] in css
+
+    with open(os.path.join(assets.dist_dir, MANIFEST_NAME)) as f:
+        assert json.load(f) == built
+
+
+def test_no_build(tmpdir):
+    assets = AssetManifest(str(tmpdir))
+    assert assets.url('js/app.js') == '/static/js/app.js'
+    assert assets.find('js/app.js') is None
+
+
+def test_response_headers():
+    assert response_headers()['Cache-Control'] == 'public, max-age={}, immutable'.format(ASSET_MAX_AGE)
+    assert 'Content-Encoding' not in response_headers()
+    assert response_headers('br')['Content-Encoding'] == 'br'
+    assert response_headers('br')['Vary'] == 'Accept-Encoding'
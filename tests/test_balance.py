@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+"""
+Balance Simulator
+=================
+
+The vectorized simulator in ascendant/balance.py has to play the same game as AscendantGame. These play the same strategy through both, one game at a time through the engine, and fail if how often games end each way differs by more than chance allows.
+
+The seeds are fixed, so they pass or fail the same way every time.
+"""
+
+from __future__ import division
+
+import math
+import random
+
+import pytest
+
+pytest.importorskip('numpy')
+
+from ascendant.ascendant import AscendantGame, Player
+from ascendant.balance import OUTCOMES, GOOD_WINS, BAD_WINS_MISSIONS, BAD_WINS_PROPOSALS, Strategy, simulate
+from ascendant.settings import *
+
+GAMES = 5000
+SEED = 1234
+
+# how many standard errors apart the two can be
+Z = 4.0
+
+
+def play_scalar(rng, rules, n_players, strategy):
+    '''
+    one game through AscendantGame, with the same strategy as
+    simulate_batch. returns the OUTCOMES index and the number of
+    proposals
+    '''
+    ids = ['player-{}'.format(i) for i in range(n_players)]
+    game = AscendantGame('SIMU', Player(ids[0], ids[0]), rules)
+    for pid in ids[1:]:
+        game.add_player(Player(pid, pid))
+
+    game.start_game()
+    # start_game always uses GOOD_FRACTION, so redo the split the way
+    # the strategy wants it
+    shuffled = game.players[:]
+    rng.shuffle(shuffled)
+    n_good = int(strategy.good_fraction * n_players)
+    for i, player in enumerate(shuffled):
+        player.team = TEAM_GOOD if i < n_good else TEAM_BAD
+
+    game.start_round()
+    game.start_proposal()
+
+    proposals = 0
+    while True:
+        proposals += 1
+        leader = game.get_leader().player_id
+        others = [pid for pid in ids if pid != leader]
+        team = [leader] + rng.sample(others, game.current_round.num_on_mission - 1)
+        game.set_mission_members(team)
+
+        for player in game.players:
+            p = strategy.approve_bad if player.team == TEAM_BAD else strategy.approve_good
+            game.current_round.vote(player.player_id, rng.random() < p)
+        passed, votes = game.get_votes()
+
+        if passed:
+            game.start_mission_voting()
+            for pid in team:
+                bad = game.get_player(pid).team == TEAM_BAD
+                game.current_round.mission_vote(pid, not (bad and rng.random() < strategy.sabotage))
+            game.get_mission_votes()
+
+            if game.is_over():
+                return (GOOD_WINS if game.good_won >= rules.num_wins else BAD_WINS_MISSIONS), proposals
+            game.start_round()
+            game.start_proposal()
+        else:
+            game.start_proposal()
+            if game.is_over():
+                return BAD_WINS_PROPOSALS, proposals
+
+
+def disagreements(rules, n_players, n_games, strategy, seed):
+    '''
+    play n_games both ways, returns the outcomes that differ by more
+    than Z standard errors
+    '''
+    rng = random.Random(seed)
+    scalar = [0] * len(OUTCOMES)
+    for _ in range(n_games):
+        outcome, _ = play_scalar(rng, rules, n_players, strategy)
+        scalar[outcome] += 1
+
+    vector, _ = simulate(rules, n_players, n_games, strategy, seed)
+
+    found = []
+    for i, name in enumerate(OUTCOMES):
+        p1 = scalar[i] / n_games
+        p2 = vector[i] / n_games
+        pooled = (scalar[i] + vector[i]) / (2.0 * n_games)
+        stderr = math.sqrt(max(pooled * (1 - pooled) * 2.0 / n_games, 1e-12))
+        if abs(p1 - p2) > Z * stderr:
+            found.append('{}: engine {:.3f}, simulator {:.3f}'.format(name, p1, p2))
+    return found
+
+
+@pytest.mark.parametrize('n_players', range(MIN_NUM_OF_PLAYERS, MAX_NUM_OF_PLAYERS + 1))
+@pytest.mark.parametrize('rules', sorted(RULES))
+def test_simulator_agrees_with_engine(rules, n_players):
+    assert disagreements(RULES[rules], n_players, GAMES, Strategy(), SEED) == []
+
+
+def test_simulator_agrees_with_engine_when_proposals_fail():
+    # hardly anybody approves, so most games are lost on proposals
+    strategy = Strategy(approve_good=0.3, approve_bad=0.3)
+    assert disagreements(DEFAULT_RULES, 7, GAMES, strategy, SEED) == []
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compact Encoding
+================
+
+Every compact event against the json one it stands for: encoded by compact_payload, sent through json, and turned back by expand with the player list a client has, it has to come out as the json payload.
+"""
+
+import json
+
+import pytest
+
+from ascendant.ascendant import AscendantGame, Player
+from ascendant.compact import COMPACT_EVENTS, compact_payload, expand
+from ascendant.payloads import encode, players_payload, propose_mission_payload
+from ascendant.settings import *
+
+N_PLAYERS = 7
+
+
+def new_game():
+    ids = ['00000000-0000-4000-8000-{:012d}'.format(i) for i in range(N_PLAYERS)]
+    game = AscendantGame('CMPT', Player(ids[0], 'player 0'))
+    for i, pid in enumerate(ids[1:], 1):
+        game.add_player(Player(pid, 'player {}'.format(i)))
+    game.start_game()
+    game.start_round()
+    game.start_proposal()
+    return game, ids
+
+
+def round_trip(game, event, payload, players=None):
+    '''
+    what a compact client makes of the event, and the compact payload
+    as it went over the wire
+    '''
+    wire = json.loads(compact_payload(game, event, payload))
+    return expand(event, wire, players_payload(game) if players is None else players), wire
+
+
+def payloads(game, ids):
+    team = [ids[5], ids[1], ids[3]][:game.current_round.num_on_mission]
+    votes = dict((pid, i % 3 != 0) for i, pid in enumerate(ids))
+    approvals = sum(votes.values())
+    return {
+        'update_players': players_payload(game),
+        'propose_mission': propose_mission_payload(game),
+        'do_proposal_vote': {'players': sorted(team, key=ids.index)},
+        'proposal_vote_result': {'pass': True, 'votes': votes, 'tally': [approvals, len(ids) - approvals],
+                                 'players': sorted(team, key=ids.index), 'failed_proposals': 2},
+        'mission_vote_result': {'pass': False, 'mission_number': 1, 'tally': [2, 1]},
+    }
+
+
+@pytest.mark.parametrize('event', sorted(COMPACT_EVENTS))
+def test_round_trip(event):
+    game, ids = new_game()
+    payload = payloads(game, ids)[event]
+    assert round_trip(game, event, payload)[0] == payload
+    # already encoded payloads, the way broadcasts are, too
+    assert round_trip(game, event, encode(payload))[0] == payload
+
+
+@pytest.mark.parametrize('event', sorted(COMPACT_EVENTS))
+def test_compact_has_no_ids(event):
+    game, ids = new_game()
+    payload = payloads(game, ids)[event]
+    compact = compact_payload(game, event, payload)
+    assert len(compact) < len(encode(payload))
+    assert not any(pid in compact for pid in ids)
+
+
+def test_seats_and_bitmaps():
+    game, ids = new_game()
+    assert round_trip(game, 'update_players', players_payload(game))[1] == \
+        [[i, 'player {}'.format(i)] for i in range(N_PLAYERS)]
+    assert round_trip(game, 'do_proposal_vote', {'players': [ids[6], ids[0]]})[1] == [(1 << 6) | 1]
+
+    leader = game.get_leader().player_id
+    assert round_trip(game, 'propose_mission', propose_mission_payload(game))[1][0] == ids.index(leader)
+
+
+def test_players_the_client_doesnt_know_yet():
+    # the list from the join ack is older than everyone who joined since
+    game, ids = new_game()
+    expanded, wire = round_trip(game, 'update_players', players_payload(game), players_payload(game)[:3])
+    assert [p['id'] for p in expanded] == ids[:3] + [None] * (N_PLAYERS - 3)
+    assert [p['name'] for p in expanded] == [p.name for p in game.players]
+
+
+def test_events_without_a_compact_form():
+    game, ids = new_game()
+    assert compact_payload(game, 'assign_roles', {'player': {}, 'players': []}) is None
+    assert expand('assign_roles', {'players': []}, []) == {'players': []}
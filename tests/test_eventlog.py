@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+"""
+Event Log
+=========
+
+Games logged by EventLog have to come back from disk exactly as they were: after a clean close, across a snapshot, and after a crash that cut the last write short. The fsyncs are faked, so these also check what the group commit syncs and when.
+"""
+
+import os
+import random
+
+import pytest
+
+from ascendant.ascendant import AscendantGame, Player
+from ascendant.eventlog import EventLog, SEGMENT_NAME, SNAPSHOT_NAME
+from ascendant.store import MemoryGameStore
+from ascendant.settings import *
+
+N_PLAYERS = 5
+
+
+class Stop(Exception):
+    pass
+
+
+class Syncs(object):
+    '''
+    stands in for os.fsync, counting instead of syncing
+    '''
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, fd):
+        self.calls += 1
+
+
+def start_log(directory):
+    log = EventLog(str(directory))
+    return log, log.recover(MemoryGameStore())
+
+
+def new_game(store, game_id):
+    game = AscendantGame(game_id, Player(game_id + '-0', 'player 0'))
+    assert store.add(game)
+    for i in range(1, N_PLAYERS):
+        game.add_player(Player('{}-{}'.format(game_id, i), 'player {}'.format(i)))
+    return game
+
+
+def play(game, rng, proposals):
+    '''
+    start the game and play this many proposals of it, or until it's
+    over, with everybody voting at random
+    '''
+    ids = [p.player_id for p in game.players]
+    game.start_game()
+    game.start_round()
+    game.start_proposal()
+
+    for _ in range(proposals):
+        team = rng.sample(ids, game.current_round.num_on_mission)
+        game.set_mission_members(team)
+        for pid in ids:
+            game.vote(pid, rng.random() < 0.6)
+        passed, votes = game.get_votes()
+
+        if passed:
+            game.start_mission_voting()
+            for pid in team:
+                game.mission_vote(pid, rng.random() < 0.7)
+            game.get_mission_votes()
+            if game.is_over():
+                game.finish()
+                return
+            game.start_round()
+            game.start_proposal()
+        else:
+            game.start_proposal()
+            if game.is_over():
+                game.finish()
+                return
+
+
+def states(store):
+    return dict((game.game_id, game.to_state()) for game in store)
+
+
+def files(directory):
+    return sorted(os.listdir(str(directory)))
+
+
+def test_recover_after_close(tmpdir):
+    rng = random.Random(1)
+    log, store = start_log(tmpdir)
+
+    # one still joining, a few at different points, and one that's gone
+    new_game(store, 'JOIN')
+    for game_id, proposals in [('ONEE', 1), ('MANY', 6), ('DONE', 100)]:
+        play(new_game(store, game_id), rng, proposals)
+    play(new_game(store, 'GONE'), rng, 3)
+    store.delete('GONE')
+
+    before = states(store)
+    log.close()
+
+    log, recovered = start_log(tmpdir)
+    assert states(recovered) == before
+    assert 'GONE' not in recovered
+
+    # and the recovered games keep logging
+    recovered.get('JOIN').add_player(Player('JOIN-late', 'late'))
+    before = states(recovered)
+    log.close()
+    assert states(start_log(tmpdir)[1]) == before
+
+
+def test_group_commit(tmpdir):
+    log, store = start_log(tmpdir)
+    segment = tmpdir.join(SEGMENT_NAME.format(log._segment))
+    syncs = Syncs()
+
+    game = new_game(store, 'GRUP')
+    # nothing hits the disk until the flush, and then it's all synced
+    # at once
+    assert segment.read() == ''
+    log.flush(syncs)
+    assert syncs.calls == 1
+    # the create and everyone else joining
+    assert len(segment.read().splitlines()) == N_PLAYERS
+
+    # with nothing buffered, there's nothing to sync
+    log.flush(syncs)
+    assert syncs.calls == 1
+
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        if len(sleeps) > 3:
+            raise Stop()
+        game.set_ready(game.players[len(sleeps)].player_id)
+
+    # each wake up flushes what was recorded while it slept
+    with pytest.raises(Stop):
+        log.run(sleep, snapshot_interval=3600, sync=syncs)
+    assert sleeps == [LOG_FLUSH_INTERVAL] * 4
+    assert syncs.calls == 4
+    assert len(segment.read().splitlines()) == N_PLAYERS + 3
+    log.close()
+
+
+def test_snapshot_rotation(tmpdir):
+    rng = random.Random(2)
+    log, store = start_log(tmpdir)
+    first = log._segment
+    play(new_game(store, 'SNAP'), rng, 4)
+    log.flush()
+
+    calls = []
+
+    def sleep(seconds):
+        calls.append(seconds)
+        if len(calls) > 1:
+            raise Stop()
+
+    # a snapshot is due every time, so the first wake up rotates
+    with pytest.raises(Stop):
+        log.run(sleep, snapshot_interval=0)
+    assert log._segment == first + 1
+    assert files(tmpdir) == [SEGMENT_NAME.format(first + 1), SNAPSHOT_NAME.format(first + 1)]
+
+    # the old segment is gone, so this has to come from the snapshot
+    # plus what was logged after it
+    play(new_game(store, 'NEXT'), rng, 2)
+    before = states(store)
+    log.close()
+    assert states(start_log(tmpdir)[1]) == before
+
+
+def test_recover_a_log_cut_off_mid_record(tmpdir):
+    rng = random.Random(3)
+    log, store = start_log(tmpdir)
+    game = new_game(store, 'CUTS')
+    play(game, rng, 2)
+    before = game.to_state()
+
+    # the worker dies halfway through writing the last event
+    game.set_mission_members([p.player_id for p in game.players[:game.current_round.num_on_mission]])
+    log.close()
+
+    segment = tmpdir.join(SEGMENT_NAME.format(log._segment))
+    data = segment.read()
+    last = data.rstrip('\n').rfind('\n') + 1
+    segment.write(data[:last + (len(data) - last) // 2])
+
+    # everything up to the cut comes back, and the log carries on
+    log, recovered = start_log(tmpdir)
+    assert recovered.get('CUTS').to_state() == before
+    recovered.get('CUTS').set_mission_members(game.current_round.players_on_mission)
+    log.close()
+    assert start_log(tmpdir)[1].get('CUTS').to_state() == game.to_state()
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+"""
+Game IDs
+========
+
+The allocators in ascendant/ids.py: every code comes out exactly once before any is reused, freed codes come back once the counter runs out, and the Redis allocator (against fakeredis) shares one sequence between workers.
+"""
+
+import pytest
+
+from ascendant.errors import *
+from ascendant.ids import (ID_SPACE, ID_LENGTH, GameIdAllocator, RedisGameIdAllocator, Permutation,
+                           encode, decode, is_game_id)
+
+KEY = 1234
+
+
+def test_codes_and_ids():
+    assert ID_SPACE == 26 ** ID_LENGTH
+    assert encode(0) == 'AAAA'
+    assert encode(ID_SPACE - 1) == 'ZZZZ'
+    for code in (0, 1, 25, 26, 12345, ID_SPACE - 1):
+        assert decode(encode(code)) == code
+
+    assert is_game_id('ABCD')
+    assert is_game_id(u'ABCD')
+    for game_id in ('abcd', 'ABC', 'ABCDE', 'AB1D', None, 1234):
+        assert not is_game_id(game_id)
+
+
+def test_permutation_stays_in_the_space():
+    permute = Permutation(KEY)
+    # including the numbers whose first feistel step lands outside
+    # ID_SPACE, which have to walk back into it
+    for n in list(range(1000)) + list(range(ID_SPACE - 1000, ID_SPACE)):
+        assert 0 <= permute(n) < ID_SPACE
+
+    # the key picks the order
+    assert [Permutation(KEY)(n) for n in range(20)] == [permute(n) for n in range(20)]
+    assert [Permutation(KEY + 1)(n) for n in range(20)] != [permute(n) for n in range(20)]
+
+
+def test_whole_space_without_duplicates():
+    ids = GameIdAllocator(KEY)
+    seen = set(ids.allocate() for _ in range(ID_SPACE))
+
+    assert len(seen) == ID_SPACE
+    assert all(is_game_id(game_id) for game_id in seen)
+    assert len(ids) == ID_SPACE
+    with pytest.raises(AscendantError):
+        ids.allocate()
+
+
+def test_freed_ids_come_back():
+    ids = GameIdAllocator(KEY)
+    ids._next = ID_SPACE - 2
+    first, second = ids.allocate(), ids.allocate()
+
+    # released ones aren't used while the counter lasts, and then in the
+    # order they were released
+    ids.release(second)
+    ids.release(second)
+    ids.release(first)
+    ids.release('NOPE')
+    assert second not in ids
+    assert [ids.allocate(), ids.allocate()] == [second, first]
+    with pytest.raises(AscendantError):
+        ids.allocate()
+
+
+def test_claim():
+    ids = GameIdAllocator(KEY)
+    ids.claim('ABCD')
+    assert 'ABCD' in ids and len(ids) == 1
+    ids.release('ABCD')
+    assert 'ABCD' not in ids
+
+
+class TestRedis(object):
+
+    @pytest.fixture
+    def server(self):
+        fakeredis = pytest.importorskip('fakeredis')
+        server = fakeredis.FakeServer()
+        return lambda: RedisGameIdAllocator(fakeredis.FakeStrictRedis(server=server))
+
+    def test_workers_share_the_sequence(self, server):
+        a, b = server(), server()
+        # the first worker picked the key for both
+        assert a.permute.round_keys == b.permute.round_keys
+
+        allocated = [worker.allocate() for worker in (a, b) * 500]
+        assert len(set(allocated)) == len(allocated)
+        assert allocated == [encode(a.permute(n)) for n in range(len(allocated))]
+        assert len(a) == len(b) == len(allocated)
+        assert allocated[1] in a
+
+    def test_freed_ids_come_back(self, server):
+        a, b = server(), server()
+        a.redis.set(a.next_key, ID_SPACE - 2)
+        first, second = a.allocate(), b.allocate()
+
+        b.release(second)
+        b.release(second)
+        a.release(first)
+        assert second not in a
+        assert [a.allocate(), b.allocate()] == [second, first]
+        with pytest.raises(AscendantError):
+            a.allocate()
+
+    def test_claim(self, server):
+        ids = server()
+        ids.claim('ABCD')
+        assert 'ABCD' in ids
+        ids.release('ABCD')
+        assert 'ABCD' not in ids
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+
+"""
+Lobby
+=====
+
+LobbyIndex keeping its buckets up to date as games fill up, start and end, and the pages it serves out of its snapshot.
+"""
+
+import json
+
+import pytest
+
+from ascendant.ascendant import AscendantGame, Player
+from ascendant.lobby import LobbyIndex
+from ascendant.service import GameService
+from ascendant.store import MemoryGameStore
+from ascendant.settings import *
+
+from fakes import FakeTransport
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def new_game(game_id, n_players):
+    game = AscendantGame(game_id, Player(game_id + '-0', 'creator of ' + game_id))
+    for i in range(1, n_players):
+        game.add_player(Player('{}-{}'.format(game_id, i), 'player {}'.format(i)))
+    return game
+
+
+def listed(lobby, **kwargs):
+    return json.loads(lobby.page(**kwargs))
+
+
+def game_ids(lobby, **kwargs):
+    return [g['game_id'] for g in listed(lobby, **kwargs)['games']]
+
+
+def test_buckets():
+    lobby = LobbyIndex(ttl=0)
+    a, b, c = new_game('AAAA', 2), new_game('BBBB', 4), new_game('CCCC', 2)
+    for game in (a, b, c):
+        lobby.update(game)
+
+    # fullest first, then oldest
+    assert game_ids(lobby) == ['BBBB', 'AAAA', 'CCCC']
+    assert listed(lobby)['games'][0] == {'game_id': 'BBBB', 'creator': 'creator of BBBB', 'players': 4,
+                                         'rules': DEFAULT_RULES.name}
+
+    # a join moves it to its new bucket, at the back of it
+    a.add_player(Player('AAAA-new', 'new'))
+    lobby.update(a)
+    c.add_player(Player('CCCC-new', 'new'))
+    lobby.update(c)
+    assert game_ids(lobby) == ['BBBB', 'AAAA', 'CCCC']
+    assert lobby._bucket_of == {'AAAA': 3, 'BBBB': 4, 'CCCC': 3}
+
+    # nothing changed, so it keeps its place
+    lobby.update(a)
+    assert game_ids(lobby) == ['BBBB', 'AAAA', 'CCCC']
+
+    a.remove_player('AAAA-new')
+    lobby.update(a)
+    assert game_ids(lobby) == ['BBBB', 'CCCC', 'AAAA']
+
+    lobby.remove('BBBB')
+    lobby.remove('BBBB')
+    assert game_ids(lobby) == ['CCCC', 'AAAA']
+    assert len(lobby) == 2
+
+
+def test_started_and_full_games_arent_listed():
+    lobby = LobbyIndex(ttl=0)
+    started = new_game('STRT', MIN_NUM_OF_PLAYERS)
+    full = new_game('FULL', MAX_NUM_OF_PLAYERS)
+    lobby.update(started)
+    lobby.update(full)
+    assert game_ids(lobby) == ['STRT']
+
+    started.start_game()
+    lobby.update(started)
+    assert game_ids(lobby) == []
+    assert len(lobby) == 0
+
+
+def test_snapshot_lasts_its_ttl():
+    clock = Clock()
+    lobby = LobbyIndex(clock=clock)
+    lobby.update(new_game('AAAA', 2))
+    first = lobby.page()
+    assert game_ids(lobby) == ['AAAA']
+
+    # changes don't show until the snapshot is rebuilt, and until then
+    # the same page is the very same encoded json
+    lobby.update(new_game('BBBB', 3))
+    lobby.remove('AAAA')
+    clock.now = LOBBY_SNAPSHOT_TTL * 0.9
+    assert lobby.page() is first
+
+    clock.now = LOBBY_SNAPSHOT_TTL
+    assert lobby.page() is not first
+    assert game_ids(lobby) == ['BBBB']
+
+
+def test_paging():
+    lobby = LobbyIndex(ttl=0)
+    # 4 games of each size from 2 to 5 players
+    games = [new_game('G{}{:02d}'.format(n, i), n) for n in range(2, 6) for i in range(4)]
+    for game in games:
+        lobby.update(game)
+    in_order = [g.game_id for g in sorted(games, key=lambda g: -len(g.players))]
+
+    # pages run across buckets
+    pages = [game_ids(lobby, page=page, per_page=3) for page in range(6)]
+    assert sum(pages, []) == in_order
+    assert [len(p) for p in pages] == [3, 3, 3, 3, 3, 1]
+
+    first = listed(lobby, page=0, per_page=3)
+    assert (first['page'], first['per_page'], first['total']) == (0, 3, len(games))
+
+    # past the end, and negative pages are the first one
+    assert game_ids(lobby, page=100, per_page=3) == []
+    assert listed(lobby, page=100, per_page=3)['total'] == len(games)
+    assert game_ids(lobby, page=-1, per_page=3) == pages[0]
+
+
+@pytest.mark.parametrize('asked, got', [
+    (0, 1),
+    (-5, 1),
+    (LOBBY_MAX_PAGE_SIZE, LOBBY_MAX_PAGE_SIZE),
+    (LOBBY_MAX_PAGE_SIZE + 1, LOBBY_MAX_PAGE_SIZE),
+    (10 ** 9, LOBBY_MAX_PAGE_SIZE),
+])
+def test_per_page_is_clamped(asked, got):
+    lobby = LobbyIndex(ttl=0)
+    for i in range(LOBBY_MAX_PAGE_SIZE + 10):
+        lobby.update(new_game('P{:03d}'.format(i), 2))
+
+    page = listed(lobby, per_page=asked)
+    assert page['per_page'] == got
+    assert len(page['games']) == got
+
+
+@pytest.mark.parametrize('min_players, max_players, sizes', [
+    (1, MAX_NUM_OF_PLAYERS, [5, 4, 3, 2]),
+    (3, 4, [4, 3]),
+    (4, 4, [4]),
+    (5, 2, []),
+    # out of range is clamped to the real range
+    (-1, 100, [5, 4, 3, 2]),
+])
+def test_filter_by_players(min_players, max_players, sizes):
+    lobby = LobbyIndex(ttl=0)
+    for n in range(2, 6):
+        lobby.update(new_game('N{:03d}'.format(n), n))
+
+    page = listed(lobby, min_players=min_players, max_players=max_players)
+    assert [g['players'] for g in page['games']] == sizes
+    assert page['total'] == len(sizes)
+
+
+@pytest.mark.parametrize('data', [
+    {'page': 'two'},
+    {'per_page': None},
+    {'min_players': [3]},
+    {'max_players': 'lots'},
+])
+def test_bad_page(data):
+    service = GameService(MemoryGameStore(), FakeTransport())
+    assert service.list_games('sid', data) == {'success': False, 'error_message': 'Bad page'}
+
+
+def test_service_keeps_it_up_to_date():
+    service = GameService(MemoryGameStore(), FakeTransport())
+    service.lobby.ttl = 0
+    game_id = service.create('sid0', {'name': 'creator'})['game_id']
+    assert json.loads(service.list_games('sid', {}))['games'][0]['players'] == 1
+
+    service.join('sid1', {'game_id': game_id, 'name': 'joiner', 'old_id': None})
+    assert json.loads(service.list_games('sid', {}))['games'][0]['players'] == 2
+
+    service.end_game(game_id)
+    assert json.loads(service.list_games('sid', {}))['games'] == []
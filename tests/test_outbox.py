@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+"""
+Outbox
+======
+
+What the outbox sends and when, against a fake clock.
+"""
+
+from ascendant.outbox import Outbox
+from ascendant.settings import *
+
+from fakes import FakeClock
+
+ROOM = 'ROOM'
+
+
+class Room(object):
+    '''
+    an outbox on a fake clock, and everything it's sent so far as
+    (time, event, payload)
+    '''
+
+    def __init__(self):
+        self.clock = FakeClock()
+        self.outbox = Outbox(self.clock.schedule)
+        self.sent = []
+
+    def post(self, event, payload, room=ROOM):
+        self.outbox.post(room, event, lambda: self.sent.append((self.clock.now, event, payload)))
+
+
+def test_only_the_latest_goes_out():
+    room = Room()
+    for i in range(10):
+        room.post('update_players', i)
+    assert room.sent == []
+
+    room.clock.advance(COALESCE_WINDOW)
+    assert room.sent == [(COALESCE_WINDOW, 'update_players', 9)]
+    assert len(room.outbox) == 0
+    assert room.clock.pending() == []
+
+
+def test_a_burst_is_one_broadcast():
+    # a table filling up from a shared link, a join every 50 ms
+    room = Room()
+    for i in range(8):
+        room.post('update_players', i)
+        room.clock.advance(COALESCE_WINDOW / 2)
+    assert room.sent == []
+
+    room.clock.advance(COALESCE_WINDOW)
+    assert [payload for _, _, payload in room.sent] == [7]
+
+
+def test_a_trickle_is_still_sent():
+    # one never quite a window after the last, which mustn't hold
+    # them all back forever
+    room = Room()
+    step = COALESCE_WINDOW * 0.9
+    for i in range(int(COALESCE_MAX_DELAY / step) * 3):
+        room.post('update_players', i)
+        room.clock.advance(step)
+    room.clock.advance(COALESCE_WINDOW)
+
+    times = [when for when, _, _ in room.sent]
+    assert len(times) >= 3
+    assert times[0] <= COALESCE_MAX_DELAY
+    assert all(b - a <= COALESCE_MAX_DELAY + step for a, b in zip(times, times[1:]))
+    assert room.sent[-1][2] == i
+
+
+def test_other_events_go_out_in_order():
+    room = Room()
+    room.post('propose_mission', 'first')
+    # nothing held, so straight out
+    assert room.sent == [(0.0, 'propose_mission', 'first')]
+
+    room.post('update_players', 1)
+    room.post('update_players', 2)
+    room.post('do_proposal_vote', 'vote')
+    # that flushed what was held ahead of it
+    assert [(e, p) for _, e, p in room.sent[1:]] == [('update_players', 2), ('do_proposal_vote', 'vote')]
+    assert room.clock.pending() == []
+
+    # after something else, it's a new update and isn't merged
+    room.post('update_players', 3)
+    room.post('assign_roles', 'roles')
+    room.post('update_players', 4)
+    room.clock.advance(COALESCE_WINDOW)
+    assert [p for _, _, p in room.sent[3:]] == [3, 'roles', 4]
+
+
+def test_rooms_are_separate():
+    room = Room()
+    room.post('update_players', 'a', room='A')
+    room.post('update_players', 'b', room='B')
+    room.post('propose_mission', 'a', room='A')
+    assert [p for _, _, p in room.sent] == ['a', 'a']
+
+    room.clock.advance(COALESCE_WINDOW)
+    assert [p for _, _, p in room.sent] == ['a', 'a', 'b']
+
+
+def test_discard():
+    room = Room()
+    room.post('update_players', 1)
+    room.outbox.discard(ROOM)
+    room.clock.advance(COALESCE_MAX_DELAY)
+    assert room.sent == []
+    assert room.clock.pending() == []
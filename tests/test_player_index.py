@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+"""
+Player Index
+============
+
+AscendantGame keeps a player_id -> Player dict next to its player list. These play random sequences of joins, leaves, reorders and the creator rejoining, and check after every step that the dict is exactly the list.
+"""
+
+import random
+
+import pytest
+
+from ascendant.ascendant import AscendantGame, Player
+from ascendant.settings import *
+
+STEPS = 200
+
+
+def check_index(game):
+    assert game._players_by_id == dict((p.player_id, p) for p in game.players)
+    for p in game.players:
+        assert game.get_player(p.player_id) is p
+
+
+def add(game, rng, ids):
+    # sometimes someone who's already in, which has to be turned away.
+    # only the creator gets their old id back, see creator_rejoins
+    pid = rng.choice(ids[1:]) if len(ids) > 1 and rng.random() < 0.2 else 'p{}'.format(rng.getrandbits(32))
+    ids.append(pid)
+    was_in = game.get_player(pid) is not None
+    added = game.add_player(Player(pid, pid))
+    if was_in:
+        assert not added
+
+
+def remove(game, rng, ids):
+    pid = rng.choice(ids)
+    was_in = game.get_player(pid) is not None
+    assert game.remove_player(pid) == was_in
+    assert game.get_player(pid) is None
+
+
+def reorder(game, rng, ids):
+    players = list(game.players)
+    rng.shuffle(players)
+    game.set_players(players[:rng.randint(0, len(players))])
+
+
+def creator_rejoins(game, rng, ids):
+    # what join does when the creator comes back after leaving
+    game.add_player(game.creator)
+    # unless the game is full
+    player = game.get_player(game.creator.player_id)
+    assert player is game.creator or player is None
+
+
+def round_trip(game, rng, ids):
+    # from_state builds the index from scratch, it has to come out the same
+    return AscendantGame.from_state(game.to_state())
+
+
+STEP_KINDS = [add, add, add, remove, remove, reorder, creator_rejoins, round_trip]
+
+
+@pytest.mark.parametrize('seed', range(50))
+def test_index_matches_players(seed):
+    rng = random.Random(seed)
+    creator = Player('creator', 'creator')
+    game = AscendantGame('ABCD', creator)
+    ids = [creator.player_id]
+
+    for _ in range(STEPS):
+        step = rng.choice(STEP_KINDS)
+        game = step(game, rng, ids) or game
+        check_index(game)
+        assert len(game.players) <= MAX_NUM_OF_PLAYERS
+
+
+def test_started_game_keeps_its_players():
+    game = AscendantGame('ABCD', Player('creator', 'creator'))
+    for i in range(4):
+        game.add_player(Player('p{}'.format(i), 'p{}'.format(i)))
+    game.start_game()
+
+    # nobody leaves once the game has started
+    assert not game.remove_player('p0')
+    check_index(game)
+    assert game.get_player('p0') is not None
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+
+"""
+Rules
+=====
+
+What the RuleSet options change about a game.
+"""
+
+import pytest
+
+from ascendant.ascendant import AscendantGame, Player
+from ascendant.settings import *
+
+
+def tied_vote(rules):
+    '''
+    a six player game where half the table approves the first proposal
+    '''
+    ids = ['p{}'.format(i) for i in range(6)]
+    game = AscendantGame('RULE', Player(ids[0], ids[0]), rules)
+    for pid in ids[1:]:
+        game.add_player(Player(pid, pid))
+    game.start_game()
+    game.start_round()
+    game.start_proposal()
+
+    game.set_mission_members(ids[:game.current_round.num_on_mission])
+    for i, pid in enumerate(ids):
+        game.vote(pid, i % 2 == 0)
+    assert game.all_voted()
+    return game.get_votes()[0]
+
+
+@pytest.mark.parametrize('rules, passed', [(STANDARD_RULES, False), (HOUSE_RULES, True)])
+def test_ties(rules, passed):
+    assert rules.ties_pass == passed
+    assert tied_vote(rules) == passed
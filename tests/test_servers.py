@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+"""
+Servers
+=======
+
+Starts server.py and async_server.py for real, and plays a whole game against each with benchmarks/loadtest.py, so both are checked to speak the same protocol to the same client.
+
+server.py needs python 2 and the packages in requirements.txt. It's started with SERVER_PYTHON if that's set, and skipped if the interpreter can't import what it needs. The load tester itself needs python 3 and python-socketio 4.x.
+"""
+
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# how long a server gets to start listening
+START_TIMEOUT = 20.0
+
+SERVERS = {
+    'server.py': os.environ.get('SERVER_PYTHON', sys.executable),
+    'async_server.py': sys.executable
+}
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def get(port, path):
+    try:
+        from urllib.request import urlopen
+    except ImportError:
+        from urllib2 import urlopen
+    response = urlopen('http://127.0.0.1:{}{}'.format(port, path), timeout=10)
+    return response.getcode(), response.read().decode('utf-8')
+
+
+@pytest.fixture(params=sorted(SERVERS))
+def server(request, tmpdir):
+    name = request.param
+    port = free_port()
+    env = dict(os.environ, PORT=str(port), GAME_STORE_URL='memory://')
+    env.pop('REDISCLOUD_URL', None)
+    log = tmpdir.join('server.log')
+
+    with open(str(log), 'w') as out:
+        process = subprocess.Popen([SERVERS[name], os.path.join(ROOT, name)], cwd=ROOT, env=env,
+                                   stdout=out, stderr=subprocess.STDOUT)
+    try:
+        deadline = time.time() + START_TIMEOUT
+        while True:
+            if process.poll() is not None:
+                output = log.read()
+                if 'ImportError' in output or 'ModuleNotFoundError' in output or 'SyntaxError' in output:
+                    pytest.skip('{} can\'t run with {}'.format(name, SERVERS[name]))
+                pytest.fail('{} exited:\n{}'.format(name, output))
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                break
+            except socket.error:
+                if time.time() > deadline:
+                    pytest.fail('{} never started listening:\n{}'.format(name, log.read()))
+                time.sleep(0.1)
+
+        yield port, log
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
+
+def test_serves_the_page(server):
+    port, log = server
+    status, page = get(port, '/')
+    assert status == 200
+    assert '<html' in page.lower()
+
+
+def test_engineio_handshake(server):
+    port, log = server
+    # engine.io protocol 3, which is what the apps speak
+    status, body = get(port, '/socket.io/?EIO=3&transport=polling&b64=1')
+    assert status == 200
+    assert '"sid"' in body
+
+
+def test_metrics(server):
+    port, log = server
+    status, body = get(port, '/metrics')
+    assert status == 200
+    # the service's gauges are in there, once
+    assert body.count('# TYPE ascendant_connections gauge') == 1
+    assert 'ascendant_games_by_players' in body
+
+
+def test_plays_a_game(server):
+    socketio = pytest.importorskip('socketio')
+    pytest.importorskip('aiohttp')
+    if not socketio.__version__.startswith('4.'):
+        pytest.skip('the load tester needs python-socketio 4.x')
+
+    port, log = server
+    output = subprocess.check_output(
+        [sys.executable, os.path.join(ROOT, 'benchmarks', 'loadtest.py'), '--url', 'http://127.0.0.1:{}'.format(port),
+         '--ramp', '2', '--players', '5', '--idle-timeout', '3'],
+        cwd=ROOT, stderr=subprocess.STDOUT).decode('utf-8')
+
+    # a game that ends on failed proposals goes quiet instead of
+    # finishing, which can happen to either, but not to both
+    line = next(l for l in output.splitlines() if 'finished' in l)
+    assert 'errors: none' in line, output
+    assert int(line.split(',')[1].split()[0]) >= 1, output
+    assert 'Traceback' not in log.read()
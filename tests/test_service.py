@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+
+"""
+Game Service
+============
+
+Whole games through GameService, the code both servers hand every event to, over a fake transport. The clients ack everything they're sent the way the apps do, and the clock only moves when a test moves it.
+"""
+
+import pytest
+
+from ascendant.metrics import REGISTRY, render
+from ascendant.service import GameService
+from ascendant.store import MemoryGameStore
+from ascendant.settings import *
+
+from fakes import FakeTransport
+
+N_PLAYERS = 5
+
+
+class Table(object):
+    '''
+    a game and the clients playing it, sid i is seat i
+    '''
+
+    def __init__(self, n_players=N_PLAYERS, encoding='json'):
+        self.transport = FakeTransport()
+        self.clock = self.transport.clock
+        self.service = GameService(MemoryGameStore(), self.transport)
+        self.sids = ['sid{}'.format(i) for i in range(n_players)]
+
+        created = self.service.create(self.sids[0], {'name': 'player 0', 'encoding': encoding})
+        self.game_id = created['game_id']
+        self.player_ids = [created['creator_id']]
+        self.transport.players[self.sids[0]] = created['creator_id']
+
+        for i, sid in enumerate(self.sids[1:], 1):
+            joined = self.service.join(sid, {'game_id': self.game_id, 'name': 'player {}'.format(i),
+                                             'old_id': None, 'encoding': encoding})
+            assert joined['success']
+            self.player_ids.append(joined['player']['id'])
+            self.transport.players[sid] = joined['player']['id']
+        self.settle()
+
+    @property
+    def game(self):
+        return self.service.games.get(self.game_id)
+
+    def settle(self):
+        # past the outbox's window, with everything delivered and acked
+        self.transport.deliver()
+        self.clock.advance(COALESCE_WINDOW)
+        self.transport.deliver()
+
+    def sid_of(self, player_id):
+        return self.sids[self.player_ids.index(player_id)]
+
+    def data(self, sid, **kwargs):
+        kwargs.update(game_id=self.game_id, player_id=self.transport.players[sid])
+        return kwargs
+
+    def last(self, event, sid=None):
+        return self.transport.events(sid or self.sids[0], event)[-1].payload
+
+    def start(self):
+        assert self.service.start(self.sids[0], {'game_id': self.game_id})['success']
+        self.settle()
+        for sid in self.sids:
+            assert self.service.ready(sid, self.data(sid))['success']
+        self.settle()
+
+    def propose(self, team=None):
+        proposal = self.last('propose_mission')
+        leader = self.sid_of(proposal['leader']['id'])
+        team = team or self.player_ids[:proposal['number_players']]
+        assert self.service.propose_mission(leader, self.data(leader, player_ids=team))['success']
+        self.settle()
+        return leader, team
+
+    def vote(self, approve):
+        for sid in self.sids:
+            self.service.proposal_vote(sid, self.data(sid, vote=approve))
+        self.settle()
+
+    def play_mission(self, passed):
+        leader, team = self.propose()
+        self.vote(True)
+        for i, player_id in enumerate(team):
+            sid = self.sid_of(player_id)
+            self.service.mission_vote(sid, self.data(sid, vote=passed or i > 0))
+        self.settle()
+
+
+def test_whole_game():
+    table = Table()
+    table.start()
+
+    for sid in table.sids:
+        roles = table.transport.events(sid, 'assign_roles')
+        assert len(roles) == 1
+        assert roles[0].payload['player']['id'] == table.transport.players[sid]
+
+    for mission in range(3):
+        table.play_mission(True)
+        result = table.last('mission_vote_result')
+        assert result['pass'] and result['mission_number'] == mission
+
+    # three passed missions and the game is over and gone
+    assert table.game_id not in table.service.games
+    assert table.game_id not in table.service.game_ids
+    assert len(table.service.barriers) == 0
+
+    # everyone saw every result, with the sync versions going up
+    for sid in table.sids:
+        versions = [m.args[1] for m in table.transport.events(sid) if len(m.args) > 1]
+        assert versions == sorted(versions)
+        assert len(table.transport.events(sid, 'mission_vote_result')) == 3
+
+
+def test_game_lost_on_proposals():
+    table = Table()
+    table.start()
+
+    for _ in range(DEFAULT_RULES.max_num_round_fails):
+        table.propose()
+        table.vote(False)
+
+    assert table.game_id not in table.service.games
+    assert table.last('proposal_vote_result')['failed_proposals'] == DEFAULT_RULES.max_num_round_fails
+
+
+def test_leader_moves_on_after_a_failed_proposal():
+    table = Table()
+    table.start()
+
+    first = table.last('propose_mission')['leader']['id']
+    table.propose()
+    table.vote(False)
+    second = table.last('propose_mission')['leader']['id']
+
+    assert second != first
+    assert table.game.get_current_state() == GAMESTATE_PROPOSING
+
+
+def test_rejoin_gets_what_was_missed():
+    table = Table()
+    version = table.transport.events(table.sids[0], 'update_players')[-1].args[1]
+    table.start()
+    table.propose()
+
+    rejoin = table.service.join('new sid', {'game_id': table.game_id, 'name': 'player 0',
+                                            'old_id': table.player_ids[0], 'last_version': version})
+    assert rejoin['success'] and rejoin['rejoin']
+    assert [d[1] for d in rejoin['deltas']] == ['propose_mission', 'do_proposal_vote']
+    assert rejoin['deltas'][-1][0] == rejoin['version']
+
+
+def test_compact_clients_get_compact_events():
+    table = Table(encoding='compact')
+    table.start()
+
+    proposal = table.transport.events(table.sids[0], 'propose_mission')[-1]
+    assert proposal.room.endswith(COMPACT_ROOM)
+    assert isinstance(proposal.payload, list)
+    # nobody's in the plain rooms, so nothing went to them
+    assert not table.transport.rooms.get(table.game_id)
+
+
+def test_stale_proposal_isnt_announced():
+    table = Table()
+    table.start()
+
+    # one player is slow to ack the first mission's result, so its
+    # barrier is still going when the game moves on without it
+    slow = table.sids[-1]
+    table.transport.slow.add(slow)
+    table.play_mission(True)
+    assert table.service.barriers.get(table.game_id, 'mission_vote_result') is not None
+    # the proposal that barrier is holding back
+    stale = table.game.sync_version
+
+    # everybody else catches up by asking, and the next proposal fails
+    for sid in table.sids[:-1]:
+        table.service.get_current_action(sid, table.data(sid))
+    table.transport.deliver()
+    table.propose()
+    table.vote(False)
+    leader = table.game.get_leader().player_id
+
+    # the late ack finishes the old barrier, which mustn't announce the
+    # first proposal over the one that's going on now
+    table.transport.release(slow)
+    table.settle()
+    proposals = [m for m in table.transport.events(table.sids[0], 'propose_mission')
+                 if len(m.args) > 1 and m.args[1] >= stale]
+    assert proposals
+    assert all(m.payload['leader']['id'] == leader for m in proposals)
+
+
+@pytest.mark.parametrize('event', ['join', 'get_current_action'])
+def test_game_gone_before_the_handler(event):
+    table = Table()
+    # the reaper got to it after the limits let the event through
+    table.service.end_game(table.game_id)
+
+    data = table.data(table.sids[1], name='late', old_id=None)
+    ack = getattr(table.service, event)(table.sids[1], data)
+    assert ack == {'success': False, 'error_message': 'No such game'}
+
+
+def test_gauges_go_where_theyre_asked_to():
+    before = list(REGISTRY)
+    registries = [[], []]
+    for registry in registries:
+        GameService(MemoryGameStore(), FakeTransport(), registry=registry)
+    Table()
+
+    # each service's own, and none in the global registry
+    assert REGISTRY == before
+    for registry in registries:
+        assert len(set(m.name for m in registry)) == len(registry) == 5
+        assert 'ascendant_games_by_players' in render(registry)
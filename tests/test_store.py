@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+"""
+Game Stores
+===========
+
+The read-modify-write in RedisGameStore.update, against fakeredis: a plain update, one that races another worker and is retried, and one that keeps losing until it gives up.
+"""
+
+import pytest
+
+fakeredis = pytest.importorskip('fakeredis')
+
+from ascendant.ascendant import AscendantGame, Player
+from ascendant.store import MemoryGameStore, RedisGameStore
+from ascendant.settings import *
+from ascendant.errors import *
+
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+
+def worker(server):
+    '''
+    a store of its own on the shared redis, like another gunicorn worker
+    '''
+    return RedisGameStore(fakeredis.FakeStrictRedis(server=server))
+
+
+def new_game(store, game_id='ABCD'):
+    game = AscendantGame(game_id, Player('creator', 'creator'), DEFAULT_RULES)
+    assert store.add(game)
+    return game
+
+
+def joins(name):
+    def join(game):
+        return game.add_player(Player(name, name))
+    return join
+
+
+def names(game):
+    return [p.player_id for p in game.players]
+
+
+def test_add_and_get(server):
+    store = worker(server)
+    game = new_game(store)
+
+    assert not store.add(game)
+    assert 'ABCD' in store
+    assert store.get('ABCD').to_state() == game.to_state()
+    assert store.get('NOPE') is None
+    assert list(store.ids()) == ['ABCD']
+
+
+def test_update(server):
+    store = worker(server)
+    new_game(store)
+
+    game, added = store.update('ABCD', joins('p1'))
+    assert added
+    assert game.version == 2
+    # what's saved is what update handed back
+    assert store.get('ABCD').to_state() == game.to_state()
+    assert names(store.get('ABCD')) == ['creator', 'p1']
+
+
+def test_update_missing_game(server):
+    with pytest.raises(GameNotFound):
+        worker(server).update('NOPE', joins('p1'))
+
+
+def test_save_stale_copy(server):
+    store = worker(server)
+    new_game(store)
+    old = store.get('ABCD')
+    store.update('ABCD', joins('p1'))
+
+    old.add_player(Player('p2', 'p2'))
+    with pytest.raises(StaleGame):
+        store.save(old)
+    assert names(store.get('ABCD')) == ['creator', 'p1']
+
+
+def test_update_retries_after_another_worker_saves(server):
+    store, other = worker(server), worker(server)
+    new_game(store)
+    calls = []
+
+    def join(game):
+        # the first time through, another worker gets its save in
+        # between this one's read and its write
+        calls.append(game.version)
+        if len(calls) == 1:
+            other.update('ABCD', joins('p2'))
+        return game.add_player(Player('p1', 'p1'))
+
+    game, added = store.update('ABCD', join)
+    assert added
+    # the retry started from the other worker's save, so neither
+    # change was lost
+    assert calls == [1, 2]
+    assert names(store.get('ABCD')) == ['creator', 'p2', 'p1']
+    assert store.get('ABCD').version == 3
+
+
+def test_update_gives_up(server):
+    store, other = worker(server), worker(server)
+    new_game(store)
+    calls = []
+
+    def join(game):
+        # another worker beats it to the save every single time
+        calls.append(game.version)
+        other.update('ABCD', joins('other{}'.format(len(calls))))
+        return game.add_player(Player('p1', 'p1'))
+
+    with pytest.raises(StaleGame):
+        store.update('ABCD', join)
+    assert len(calls) == STORE_MAX_RETRIES
+    assert 'p1' not in names(store.get('ABCD'))
+
+
+def test_memory_store_update():
+    store = MemoryGameStore()
+    game = new_game(store)
+
+    updated, added = store.update('ABCD', joins('p1'))
+    # the memory store hands out the game itself
+    assert updated is game and added
+    assert game.version == 1
+    with pytest.raises(GameNotFound):
+        store.update('NOPE', joins('p1'))